@@ -9,18 +9,61 @@
 from __future__ import annotations
 from litestar.dto import DataclassDTO
 from litestar.dto.config import DTOConfig
-from litestar import Controller, get, post, Request
+from litestar import Controller, get, post, Request, Response
+from litestar.exceptions import (
+    NotFoundException,
+    ServiceUnavailableException,
+    ValidationException,
+)
+from litestar.params import Parameter
+from litestar.response import Stream
 
 from internal.data.content import ContentData
+from internal.db import g_db_func
 from sqlalchemy.orm import Session
-from typing import Generator
+from typing import Generator, Optional
+from dataclasses import asdict
+import json
+import os
 
 from internal.model.content.content import (
     read_content_impl,
+    read_node_span_impl,
+    iter_node_text_impl,
 )
 
-from internal.model.content.chapter import read_chapter_impl, read_book_chapter_impl
-from internal.data.content import ChapterData
+from internal.model.content.chapter import (
+    read_chapter_impl,
+    read_book_chapter_impl,
+    get_chapter_info_impl,
+    iter_book_chapters_impl,
+)
+from internal.model.content.cache import chapter_cache_stats
+from internal.model.content.search import search_chapters_impl
+from internal.model.content.book import read_book_toc_impl, read_books_info_impl
+from internal.model.content.image import (
+    get_images_impl,
+    find_similar_images_impl,
+    read_image_blob_impl,
+    read_image_derivative_impl,
+    read_image_tile_impl,
+    read_image_tiles_impl,
+)
+from internal.data.content import (
+    BookData,
+    ChapterData,
+    DBImageData,
+    ImageBlobData,
+    ImageTilesData,
+    SearchHitData,
+    SimilarImageData,
+)
+from utils.http_cache import make_etag, etag_matches
+from utils.http_range import parse_range, content_range, RangeNotSatisfiable
+from utils.http_encoding import accepts_gzip, gzip_chunks
+from utils.image import DERIVATIVE_FORMATS
+from utils.blob_store import iter_open_file
+from utils.phash import MultiIndexHash
 
 
 # --------------------------
@@ -60,6 +103,83 @@ class ContentController(Controller):
         return content
 
 
+# --------------------------
+# CONTENT NODE TEXT
+# --------------------------
+
+
+def stream_with_session(iterate, *args):
+    """
+    Iterate iterate(db, *args) with a session of its own: the request session
+    is closed once the handler returns, before the Stream body is iterated.
+    The session is opened on the first chunk and closed when the stream ends.
+    """
+    sessions = g_db_func()
+    db = next(sessions)
+    try:
+        yield from iterate(db, *args)
+    finally:
+        sessions.close()
+
+
+def node_text_response(db, node_id: int, request: Request):
+    """
+    Stream the text of a node, honoring `Range: bytes=a-b` (utf-8 bytes)
+    and `Range: chars=a-b` (characters), both end inclusive as in HTTP.
+    """
+    span = read_node_span_impl(db, node_id)
+    if span is None:
+        raise NotFoundException(detail=f"Content node {node_id} not found")
+
+    header = request.headers.get("range")
+    headers = {"Accept-Ranges": "bytes, chars"}
+    try:
+        rng = parse_range(header, span.nbytes, units=("bytes",)) or parse_range(
+            header, span.offset, units=("chars",)
+        )
+    except RangeNotSatisfiable:
+        unit = "chars" if header.strip().lower().startswith("chars") else "bytes"
+        total = span.offset if unit == "chars" else span.nbytes
+        headers["Content-Range"] = f"{unit} */{total}"
+        return Response(content=b"", status_code=416, headers=headers)
+
+    if rng is None:
+        unit, start, end, status_code = "chars", 0, span.offset, 200
+        headers["Content-Length"] = str(span.nbytes)
+    else:
+        unit, start, end = rng
+        status_code = 206
+        total = span.nbytes if unit == "bytes" else span.offset
+        headers["Content-Range"] = content_range(unit, start, end, total)
+        if unit == "bytes":
+            headers["Content-Length"] = str(end - start)
+
+    request.logger.info(f"Get node {node_id} text {unit} [{start}, {end})")
+    return Stream(
+        stream_with_session(iter_node_text_impl, span, start, end, unit),
+        media_type="text/plain; charset=utf-8",
+        status_code=status_code,
+        headers=headers,
+    )
+
+
+class ContentNodeController(Controller):
+    path = "/node"
+
+    @get("/{node_id:int}/text")
+    async def get_node_text(
+        self,
+        node_id: int,
+        router_dependency: Generator[Session, None, None],
+        request: Request,
+    ) -> Stream:
+        """
+        Get the text of a content node, supports Range requests.
+        """
+        db = next(router_dependency)
+        return node_text_response(db, node_id, request)
+
+
 # --------------------------
 # CHAPTER CONTROLLER
 # --------------------------
@@ -101,6 +221,29 @@ class ChapterController(Controller):
 
         return chapter
 
+    @get("/{chapter_id:int}/text", return_dto=None)
+    async def get_chapter_text(
+        self,
+        chapter_id: int,
+        router_dependency: Generator[Session, None, None],
+        request: Request,
+    ) -> Stream:
+        """
+        Get the chapter text as plain text, supports Range requests.
+        """
+        db = next(router_dependency)
+        chapter = get_chapter_info_impl(db, chapter_id)
+        if chapter is None:
+            raise NotFoundException(detail=f"Chapter {chapter_id} not found")
+        return node_text_response(db, chapter.content_node_id, request)
+
+    @get("/cache", return_dto=None)
+    async def get_chapter_cache_stats(self) -> dict:
+        """
+        Get the hit/miss metrics of the in-process chapter cache.
+        """
+        return chapter_cache_stats()
+
     # get '/' with param ? book={book_id}&order={chapter_order}
     @get("/")
     async def get_book_chapter(
@@ -120,3 +263,335 @@ class ChapterController(Controller):
             return None
 
         return chapter
+
+
+# --------------------------
+# BOOK CONTROLLER
+# --------------------------
+
+
+class BookDataReadDTO(DataclassDTO[BookData]):
+    config = DTOConfig(exclude={"chapters"})
+
+
+class BookController(Controller):
+    path = "/book"
+
+    # get '/' with param ? after={last_book_id}&limit={limit}
+    @get("/", return_dto=BookDataReadDTO)
+    async def get_books(
+        self,
+        router_dependency: Generator[Session, None, None],
+        request: Request,
+        after: int = 0,
+        limit: int = 50,
+    ) -> list[BookData]:
+        """
+        List the books by id with chapter count, total characters and last modification time.
+        Pass the last id of a page as `after` to get the next one.
+        """
+        db = next(router_dependency)
+        books = read_books_info_impl(db, after, min(max(limit, 1), 200))
+        request.logger.info(f"Get books after {after}: {len(books)}")
+        return books
+
+    @get("/{book_id:int}/toc")
+    async def get_book_toc(
+        self,
+        book_id: int,
+        router_dependency: Generator[Session, None, None],
+        request: Request,
+    ) -> Response:
+        """
+        Get the table of contents of a book: id, order, title and size of every chapter.
+        """
+        db = next(router_dependency)
+        toc = read_book_toc_impl(db, book_id)
+        if toc is None:
+            raise NotFoundException(detail=f"Book {book_id} not found")
+
+        body = json.dumps(asdict(toc), ensure_ascii=False).encode("utf-8")
+        etag = make_etag(body)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(content=b"", status_code=304, headers=headers)
+        request.logger.info(f"Get book {book_id} toc: {len(toc.chapters)} chapters")
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    # get '/{book_id}/chapters' with param ? from={first_order}&to={last_order}
+    @get("/{book_id:int}/chapters")
+    async def get_book_chapters(
+        self,
+        book_id: int,
+        request: Request,
+        first: Optional[int] = Parameter(query="from", default=None),
+        last: Optional[int] = Parameter(query="to", default=None),
+    ) -> Stream:
+        """
+        Stream the chapters with first <= order <= last as NDJSON, one chapter
+        per line, gzip encoded if the client accepts it. The body reads with a
+        session of its own, the request one is closed before it is iterated.
+        """
+        request.logger.info(f"Get book {book_id} chapters [{first}, {last}]")
+
+        def lines(db):
+            for chapter in iter_book_chapters_impl(db, book_id, first, last):
+                yield (
+                    json.dumps(
+                        {
+                            "id": chapter.id,
+                            "book_id": chapter.book_id,
+                            "order": chapter.order,
+                            "title": chapter.title,
+                            "content": chapter.content,
+                        },
+                        ensure_ascii=False,
+                    )
+                    + "\n"
+                ).encode("utf-8")
+
+        headers = {"Vary": "Accept-Encoding"}
+        body = stream_with_session(lines)
+        if accepts_gzip(request.headers.get("accept-encoding")):
+            headers["Content-Encoding"] = "gzip"
+            body = gzip_chunks(body)
+        return Stream(body, media_type="application/x-ndjson", headers=headers)
+
+
+# --------------------------
+# IMAGE CONTROLLER
+# --------------------------
+
+
+# the id of an image is stable but its bytes may be updated, so clients
+# revalidate with If-None-Match after an hour
+IMAGE_CACHE_CONTROL = "public, max-age=3600"
+
+
+def _iter_bytes(data: bytes, start: int, end: int, chunk: int = 1 << 16):
+    view = memoryview(data)
+    for i in range(start, end, chunk):
+        yield bytes(view[i : min(i + chunk, end)])
+
+
+def _close_blob(blob: ImageBlobData):
+    if blob.file is not None:
+        blob.file.close()
+
+
+def blob_response(blob: ImageBlobData, request: Request):
+    """
+    Serve image bytes with a strong ETag from the content hash, conditional
+    GET and a single `Range: bytes=a-b`, the body is streamed in chunks.
+    """
+    if blob.file is not None:
+        total = os.fstat(blob.file.fileno()).st_size
+    else:
+        total = len(blob.data)
+    if blob.tag is not None:
+        etag = f'"{blob.tag}"'
+    elif blob.data is not None:
+        etag = make_etag(blob.data)
+    else:
+        # cache files are named by their key, which includes the update time
+        etag = make_etag(os.path.basename(blob.file.name).encode("utf-8"), weak=True)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMAGE_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        _close_blob(blob)
+        return Response(content=b"", status_code=304, headers=headers)
+
+    header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range is not None and not etag_matches(if_range, etag, strong=True):
+        # other or weakly validated bytes, or a date (no Last-Modified is sent)
+        header = None  # send the whole image
+    try:
+        rng = parse_range(header, total)
+    except RangeNotSatisfiable:
+        headers["Content-Range"] = f"bytes */{total}"
+        _close_blob(blob)
+        return Response(content=b"", status_code=416, headers=headers)
+    if rng is None:
+        start, end, status_code = 0, total, 200
+    else:
+        _, start, end = rng
+        status_code = 206
+        headers["Content-Range"] = content_range("bytes", start, end, total)
+    headers["Content-Length"] = str(end - start)
+
+    request.logger.info(f"Get image {request.url.path} [{start}, {end}) of {total}")
+    if blob.file is not None:
+        body = iter_open_file(blob.file, start, end)
+    else:
+        body = _iter_bytes(blob.data, start, end)
+    return Stream(
+        body, media_type=blob.media_type, status_code=status_code, headers=headers
+    )
+
+
+class DBImageDataReadDTO(DataclassDTO[DBImageData]):
+    config = DTOConfig(exclude={"data"})
+
+
+class SimilarImageDataReadDTO(DataclassDTO[SimilarImageData]): ...
+
+
+class ImageTilesDataReadDTO(DataclassDTO[ImageTilesData]): ...
+
+
+class ImageController(Controller):
+    path = "/image"
+
+    # get '/' with param ? skip={skip}&limit={limit}
+    @get("/", return_dto=DBImageDataReadDTO)
+    async def get_images(
+        self,
+        router_dependency: Generator[Session, None, None],
+        request: Request,
+        skip: int = 0,
+        limit: int = 100,
+    ) -> list[DBImageData]:
+        """
+        List the image metadata: name, hash, width, height, size and format, without the bytes.
+        """
+        db = next(router_dependency)
+        images = get_images_impl(db, max(skip, 0), min(max(limit, 1), 1000), no_data=True)
+        request.logger.info(f"Get images from {skip}: {len(images)}")
+        return images
+
+    # get '/{image_id}' with param ? w={max_width}&fmt={webp|jpeg|png}
+    @get("/{image_id:int}")
+    async def get_image(
+        self,
+        image_id: int,
+        router_dependency: Generator[Session, None, None],
+        request: Request,
+        w: Optional[int] = None,
+        fmt: str = "webp",
+    ) -> Response:
+        """
+        Get the image bytes, or a scaled copy at most `w` pixels wide.
+        """
+        db = next(router_dependency)
+        if w is not None:
+            if w <= 0 or fmt not in DERIVATIVE_FORMATS:
+                raise ValidationException(detail=f"Invalid derivative {w} {fmt}")
+            blob = read_image_derivative_impl(db, image_id, w, fmt)
+        else:
+            blob = read_image_blob_impl(db, image_id)
+        if blob is None:
+            raise NotFoundException(detail=f"Image {image_id} not found")
+        return blob_response(blob, request)
+
+    # get '/{image_id}/similar' with param ? distance={max_distance}&limit={limit}
+    @get("/{image_id:int}/similar", return_dto=SimilarImageDataReadDTO)
+    async def get_similar_images(
+        self,
+        image_id: int,
+        router_dependency: Generator[Session, None, None],
+        request: Request,
+        distance: int = 8,
+        limit: int = 20,
+    ) -> list[SimilarImageData]:
+        """
+        Find near duplicates of an image (resized or re-saved copies) by perceptual hash.
+        """
+        db = next(router_dependency)
+        similar = find_similar_images_impl(
+            db,
+            image_id,
+            min(max(distance, 0), MultiIndexHash.MAX_RADIUS),
+            min(max(limit, 1), 100),
+        )
+        if similar is None:
+            raise NotFoundException(detail=f"Image {image_id} not found or not hashed")
+        request.logger.info(f"Get images similar to {image_id}: {len(similar)}")
+        return similar
+
+    # get '/{image_id}/tiles' with param ? fmt={webp|jpeg|png}
+    @get("/{image_id:int}/tiles", return_dto=ImageTilesDataReadDTO)
+    async def get_image_tiles(
+        self,
+        image_id: int,
+        router_dependency: Generator[Session, None, None],
+        request: Request,
+        fmt: str = "webp",
+    ) -> ImageTilesData:
+        """
+        Get the tile pyramid layout of an image for deep-zoom viewers.
+        """
+        db = next(router_dependency)
+        if fmt not in DERIVATIVE_FORMATS:
+            raise ValidationException(detail=f"Invalid tile format {fmt}")
+        tiles = read_image_tiles_impl(db, image_id, fmt)
+        if tiles is None:
+            raise NotFoundException(detail=f"Image {image_id} not found")
+        return tiles
+
+    # get '/{image_id}/tiles/{z}/{x}/{y}' with param ? fmt={webp|jpeg|png}
+    @get("/{image_id:int}/tiles/{z:int}/{x:int}/{y:int}")
+    async def get_image_tile(
+        self,
+        image_id: int,
+        z: int,
+        x: int,
+        y: int,
+        router_dependency: Generator[Session, None, None],
+        request: Request,
+        fmt: str = "webp",
+    ) -> Response:
+        """
+        Get one 256px tile of the image pyramid, z = 0 is the whole image.
+        A pyramid still being built answers 503 with Retry-After.
+        """
+        db = next(router_dependency)
+        if min(z, x, y) < 0 or fmt not in DERIVATIVE_FORMATS:
+            raise ValidationException(detail=f"Invalid tile {z}/{x}/{y} {fmt}")
+        state, blob = read_image_tile_impl(db, image_id, z, x, y, fmt)
+        if state is None:
+            raise NotFoundException(detail=f"Image {image_id} not found")
+        if state == "building":
+            raise ServiceUnavailableException(
+                detail=f"Tiles of image {image_id} are being built",
+                headers={"Retry-After": "5"},
+            )
+        if state == "too_large":
+            raise NotFoundException(detail=f"Image {image_id} is too large to tile")
+        if blob is None:
+            raise NotFoundException(detail=f"Tile {z}/{x}/{y} of image {image_id} not found")
+        return blob_response(blob, request)
+
+
+# --------------------------
+# SEARCH CONTROLLER
+# --------------------------
+
+
+class SearchHitDataReadDTO(DataclassDTO[SearchHitData]): ...
+
+
+class SearchController(Controller):
+    return_dto = SearchHitDataReadDTO
+    path = "/search"
+
+    # get '/' with param ? q={query}&book={book_id}&limit={limit}
+    @get("/")
+    async def search_chapters(
+        self,
+        q: str,
+        router_dependency: Generator[Session, None, None],
+        request: Request,
+        book: int = None,
+        limit: int = 20,
+    ) -> list[SearchHitData]:
+        """
+        Search chapters containing the query, every whitespace separated part is required.
+        """
+        db = next(router_dependency)
+        hits = search_chapters_impl(db, q, book, min(max(limit, 1), 100))
+        request.logger.info(f"Search {q}: {len(hits)} hits")
+        return hits
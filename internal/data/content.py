@@ -6,10 +6,11 @@
 # @version 1.0
 # ---------------------------------
 
-from sqlalchemy import Column, Integer, String, ForeignKey, LargeBinary, TEXT, DateTime, TIMESTAMP, func
-from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, LargeBinary, TEXT, DateTime, TIMESTAMP, func, Index, DDL, event
+from sqlalchemy.dialects.postgresql import JSONB, ARRAY, INT4RANGE
+from sqlalchemy.orm import deferred, relationship
 from dataclasses import dataclass, field
+from typing import BinaryIO
 from .orm import ORMBase
 import datetime
 
@@ -31,10 +32,34 @@ class BookData:
     title: str
     id: int = field(default=-1)
     chapters: list[int] = field(default_factory=list)  # list of chapter ids
+    chapter_count: int = field(default=0)
+    size: int = field(default=0)  # total characters of all chapters
+    mtime: datetime = field(default=None)  # last chapter modification
+
+
+@dataclass
+class TocEntryData:
+    id: int
+    order: int
+    title: str = field(default="")
+    size: int = field(default=0)  # content size in characters
+
+
+@dataclass
+class BookTocData:
+    """
+    The Book Table of Contents
+    """
+
+    id: int
+    title: str = field(default="")
+    author: str = field(default="")
+    chapters: list[TocEntryData] = field(default_factory=list)
 
 
 class Chapter(ORMBase):
     __tablename__ = "chapter"
+    __table_args__ = (Index("ix_chapter_book_id_order", "book_id", "order"),)
     id = Column(Integer, primary_key=True)
     title = Column(String)
     book_id = Column(Integer, ForeignKey("book.id"))
@@ -58,12 +83,38 @@ class ChapterData:
     content: str = field(default="")  # return content as string
 
 
+# Chapter Search Index
+class ChapterGram(ORMBase):
+    __tablename__ = "chapter_gram"
+    __table_args__ = (
+        Index("ix_chapter_gram_grams", "grams", postgresql_using="gin"),
+    )
+    chapter_id = Column(
+        Integer, ForeignKey("chapter.id", ondelete="CASCADE"), primary_key=True
+    )
+    book_id = Column(Integer, index=True)
+    grams = Column(ARRAY(String))  # unique unigrams and bigrams, see utils.ngram
+
+
+@dataclass
+class SearchHitData:
+    chapter_id: int
+    book_id: int
+    order: int
+    title: str = field(default="")
+    offsets: list[int] = field(default_factory=list)  # hit offsets in the chapter
+    snippet: str = field(default="")  # text around the first hit
+    snippet_start: int = field(default=0)  # offset of the snippet in the chapter
+
+
 # The Real Content Storage
 class Content(ORMBase):
     __tablename__ = "content"
     id = Column(Integer, primary_key=True)
     data = Column(String)
     size = Column(Integer)
+    hash = Column(String(64), nullable=True, unique=True, index=True)  # sha256 of data
+    packed = Column(LargeBinary, nullable=True)  # codec byte + compressed data, data is NULL then
     attached_nodes = relationship(
         "ContentNode",
         back_populates="content",
@@ -83,6 +134,29 @@ class ContentNode(ORMBase):
     tags = Column(String)  # tags, by system
     start = Column(Integer)
     offset = Column(Integer)
+    # the segmented node owning this segment, NULL for roots; chapters sharing
+    # a deduplicated Content overlap in range, so ownership is not a range query
+    root_id = Column(Integer, nullable=True, index=True)
+
+
+def content_node_span(node=ContentNode):
+    # [start, start + offset) as int4range, must match ix_content_node_span
+    return func.int4range(node.start, node.start + node.offset, type_=INT4RANGE)
+
+
+# interval index, answers "nodes covering p" and "nodes inside a range"
+# the btree_gist extension lets content_id share the GiST index
+Index(
+    "ix_content_node_span",
+    ContentNode.content_id,
+    content_node_span(),
+    postgresql_using="gist",
+)
+event.listen(
+    ContentNode.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gist").execute_if(dialect="postgresql"),
+)
 
 
 @dataclass
@@ -125,9 +199,17 @@ class DBImage(ORMBase):
     __tablename__ = "images"
     id = Column(Integer, primary_key=True)
     name = Column(String(255), nullable=False)  # image name
-    data = Column(LargeBinary, nullable=False)  # image data in binary
+    # image data, NULL if in the blob store, only loaded when accessed
+    data = deferred(Column(LargeBinary, nullable=True))
+    hash = Column(String(64), nullable=True, index=True)  # sha256 of the image data
     htime = Column(Integer, nullable=False)  # update time
     desp = Column(String(255), nullable=True)  # image description
+    width = Column(Integer, nullable=True)  # pixels
+    height = Column(Integer, nullable=True)  # pixels
+    size = Column(Integer, nullable=True)  # encoded bytes
+    format = Column(String(16), nullable=True)  # encoded format, e.g. png
+    ahash = Column(BigInteger, nullable=True)  # perceptual hashes, see utils.phash
+    dhash = Column(BigInteger, nullable=True)
 
 
 @dataclass
@@ -137,6 +219,54 @@ class DBImageData:
     data: bytes
     htime: int
     desp: str = field(default="")
+    hash: str = field(default=None)
+    width: int = field(default=None)
+    height: int = field(default=None)
+    size: int = field(default=None)
+    format: str = field(default=None)
+    ahash: int = field(default=None)
+    dhash: int = field(default=None)
+
+
+@dataclass
+class ImageBlobData:
+    """
+    The bytes of an image or of a scaled copy, in the open file if set, which
+    the response reads and closes: a cache may evict the path meanwhile
+    tag identifies the bytes: the image hash, plus width and format for copies
+    """
+
+    media_type: str
+    file: BinaryIO = field(default=None)
+    data: bytes = field(default=None)
+    tag: str = field(default=None)
+
+
+@dataclass
+class SimilarImageData:
+    id: int
+    distance: int  # Hamming distance of the dHash
+    name: str = field(default="")
+    width: int = field(default=None)
+    height: int = field(default=None)
+    format: str = field(default=None)
+
+
+@dataclass
+class ImageTilesData:
+    """
+    The tile pyramid layout of an image, tiles are /{z}/{x}/{y} with z from
+    0 (the whole image in one tile) to max_zoom (full resolution)
+    state: "ready", "building" (retry later) or "too_large" to be tiled
+    """
+
+    id: int
+    width: int
+    height: int
+    tile_size: int
+    max_zoom: int
+    format: str = field(default="webp")
+    state: str = field(default="ready")
 
 
 # --------------
@@ -156,6 +286,35 @@ class VaultNote(ORMBase):
     mtime = Column(TIMESTAMP, server_default=func.current_timestamp())  # update time
     tags = Column(String(255), nullable=True)  # note tags
     content = Column(TEXT, nullable=True)  # raw content with metadata
+    packed = Column(LargeBinary, nullable=True)  # codec byte + compressed content
+    # the file as last synced, see utils/vault_sync.py
+    file_size = Column(BigInteger, nullable=True)
+    file_mtime = Column(BigInteger, nullable=True)  # st_mtime_ns
+    file_hash = Column(String(64), nullable=True)  # sha256 of the file bytes
+
+    __table_args__ = (
+        Index("ix_vault_note_note_id", "note_id"),
+        Index("ix_vault_note_vault_path", "vault_name", "note_path"),
+    )
+
+
+class VaultSyncSkip(ORMBase):
+    """
+    A vault file that failed to parse, not read again until its stat changes
+    """
+
+    __tablename__ = "vault_sync_skip"
+    id = Column(Integer, primary_key=True)
+    vault_name = Column(String(255), nullable=False)
+    note_path = Column(String(255), nullable=False)
+    note_id = Column(String(255), nullable=True)  # the "id:" line, if any
+    file_size = Column(BigInteger, nullable=False)
+    file_mtime = Column(BigInteger, nullable=False)  # st_mtime_ns
+    error = Column(String(255), nullable=True)
+
+    __table_args__ = (
+        Index("ix_vault_sync_skip_vault_path", "vault_name", "note_path"),
+    )
 
 
 @dataclass
@@ -174,3 +333,6 @@ class VaultNoteData:
     tags: str = field(default="")
     content: str = field(default="")
     id: int = field(default=-1)
+    file_size: int = field(default=None)
+    file_mtime: int = field(default=None)
+    file_hash: str = field(default=None)
@@ -0,0 +1,2 @@
+-- Index for the per-book chapter lookups: table of contents, chapter ranges and book listing
+CREATE INDEX IF NOT EXISTS ix_chapter_book_id_order ON chapter (book_id, "order");
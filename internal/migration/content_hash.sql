@@ -0,0 +1,9 @@
+-- Content-addressed storage for the content table
+-- hash is the sha256 hex digest of content.data, NULL for rows not yet deduplicated
+-- run the dedupe_contents task afterwards to hash and merge the existing rows
+
+-- Step 1: Add the hash column
+ALTER TABLE content ADD COLUMN IF NOT EXISTS hash VARCHAR(64);
+
+-- Step 2: Unique index, NULL hashes are allowed multiple times
+CREATE UNIQUE INDEX IF NOT EXISTS ix_content_hash ON content (hash);
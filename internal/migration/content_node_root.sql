@@ -0,0 +1,13 @@
+-- Segment ownership on content_node, see ContentNode.root_id in internal/data/content.py
+-- chapters sharing a deduplicated content overlap in range, so the segments
+-- of a node are found by root_id; existing segments are filled from their trees
+
+ALTER TABLE content_node ADD COLUMN IF NOT EXISTS root_id INTEGER;
+CREATE INDEX IF NOT EXISTS ix_content_node_root_id ON content_node (root_id);
+
+UPDATE content_node AS n SET root_id = t.root_content_node_id
+FROM paragraph_tree AS t
+CROSS JOIN LATERAL jsonb_array_elements(t.data -> 'children') AS p
+LEFT JOIN LATERAL jsonb_array_elements(p -> 'children') AS s ON true
+WHERE n.root_id IS NULL
+AND n.id IN ((p ->> 'id')::int, (s ->> 'id')::int);
@@ -0,0 +1,7 @@
+-- Interval index on content_node, see content_node_span in internal/data/content.py
+-- the expression must stay int4range(start, start + "offset") to be used by the planner
+
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+CREATE INDEX IF NOT EXISTS ix_content_node_span ON content_node
+USING gist (content_id, int4range(start, start + "offset"));
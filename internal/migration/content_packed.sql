@@ -0,0 +1,7 @@
+-- Optional compressed storage for content and vault_note
+-- packed = 1 codec byte (1 zlib, 2 lzma, 3 bz2) + compressed utf-8 text
+-- a packed row keeps its text column NULL, see utils/codec.py
+-- run the compress_contents / compress_vault_notes tasks to migrate existing rows
+
+ALTER TABLE content ADD COLUMN IF NOT EXISTS packed BYTEA;
+ALTER TABLE vault_note ADD COLUMN IF NOT EXISTS packed BYTEA;
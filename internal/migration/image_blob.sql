@@ -0,0 +1,7 @@
+-- File-backed image blobs, see internal/model/content/blob.py
+-- hash is the sha256 hex digest of the image bytes, data is NULL once the
+-- bytes live in the blob store, run the move_image_blobs task to migrate
+
+ALTER TABLE images ALTER COLUMN data DROP NOT NULL;
+ALTER TABLE images ADD COLUMN IF NOT EXISTS hash VARCHAR(64);
+CREATE INDEX IF NOT EXISTS ix_images_hash ON images (hash);
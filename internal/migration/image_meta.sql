@@ -0,0 +1,7 @@
+-- Image metadata recorded at insert time, so listings never touch images.data
+-- run the fill_image_metadata task to fill the existing rows
+
+ALTER TABLE images ADD COLUMN IF NOT EXISTS width INTEGER;
+ALTER TABLE images ADD COLUMN IF NOT EXISTS height INTEGER;
+ALTER TABLE images ADD COLUMN IF NOT EXISTS size INTEGER;
+ALTER TABLE images ADD COLUMN IF NOT EXISTS format VARCHAR(16);
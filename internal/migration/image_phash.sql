@@ -0,0 +1,5 @@
+-- Perceptual hashes of the images, see utils/phash.py (unsigned 64 bit stored as BIGINT)
+-- run the fill_image_metadata task to hash the existing rows
+
+ALTER TABLE images ADD COLUMN IF NOT EXISTS ahash BIGINT;
+ALTER TABLE images ADD COLUMN IF NOT EXISTS dhash BIGINT;
@@ -0,0 +1,8 @@
+-- The file state of each vault note as last synced, see utils/vault_sync.py
+-- the first update_notes run reads every note once and fills them
+
+ALTER TABLE vault_note ADD COLUMN IF NOT EXISTS file_size BIGINT;
+ALTER TABLE vault_note ADD COLUMN IF NOT EXISTS file_mtime BIGINT;
+ALTER TABLE vault_note ADD COLUMN IF NOT EXISTS file_hash VARCHAR(64);
+CREATE INDEX IF NOT EXISTS ix_vault_note_note_id ON vault_note (note_id);
+CREATE INDEX IF NOT EXISTS ix_vault_note_vault_path ON vault_note (vault_name, note_path);
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# @file blob.py
+# @brief The Image Blob Backend and Derivative Cache
+# @author sailing-innocent
+# @date 2025-06-20
+# @version 1.0
+# ---------------------------------
+# IMAGE_BLOB_BACKEND=file keeps new image bytes in a sha256-addressed directory
+# (IMAGE_BLOB_DIR) and only metadata and the hash in the images table,
+# the default "db" keeps the bytes in images.data
+
+from utils.blob_store import LocalBlobStore
+from utils.disk_cache import DiskLRUCache
+from utils.tile_store import TileStore
+import os
+
+IMAGE_BLOB_BACKEND = os.environ.get("IMAGE_BLOB_BACKEND", "db")
+IMAGE_BLOB_DIR = os.environ.get("IMAGE_BLOB_DIR", "data/blobs")
+
+g_image_store = LocalBlobStore(IMAGE_BLOB_DIR)
+
+
+def file_backend_enabled(backend: str = None):
+    return (backend or IMAGE_BLOB_BACKEND) == "file"
+
+
+# scaled copies for galleries, 256MB by default
+IMAGE_DERIVATIVE_DIR = os.environ.get("IMAGE_DERIVATIVE_DIR", "data/derivatives")
+IMAGE_DERIVATIVE_BYTES = int(
+    os.environ.get("IMAGE_DERIVATIVE_BYTES", 256 * 1024 * 1024)
+)
+
+g_derivative_cache = DiskLRUCache(IMAGE_DERIVATIVE_DIR, IMAGE_DERIVATIVE_BYTES)
+
+# deep-zoom tile pyramids, evicted as whole pyramids, 4GB by default
+IMAGE_TILE_DIR = os.environ.get("IMAGE_TILE_DIR", "data/tiles")
+IMAGE_TILE_BYTES = int(os.environ.get("IMAGE_TILE_BYTES", 4 * 1024 * 1024 * 1024))
+IMAGE_TILE_WORKERS = int(os.environ.get("IMAGE_TILE_WORKERS", 1))
+
+g_tile_store = TileStore(IMAGE_TILE_DIR, IMAGE_TILE_BYTES)
@@ -6,14 +6,29 @@
 # @version 1.0
 # ---------------------------------
 
-from internal.data.content import BookData, Book, Chapter
+from sqlalchemy import func
+
+from internal.data.content import (
+    BookData,
+    Book,
+    Chapter,
+    ChapterData,
+    ContentData,
+    ContentNode,
+    BookTocData,
+    TocEntryData,
+)
 from utils.book_parser import BPBook, BPChapter
+from typing import Callable, Iterable
+from itertools import islice
 import logging
 
 logger = logging.getLogger(__name__)
 
 from tqdm import tqdm
-from .chapter import create_chapter_from_parser
+from .chapter import bulk_create_chapter_impl
+from .content import bulk_create_content_with_node_impl
+from .search import index_chapter_grams_impl
 
 
 def book_from_create(create: BookData):
@@ -27,12 +42,84 @@ def create_book_impl(db, crt: BookData):
     return book.id
 
 
-def create_book_from_parser(db, book: BPBook):
+def import_book_impl(
+    db,
+    crt: BookData,
+    chapters: Iterable[BPChapter],
+    batch_size: int = 500,
+    progress: Callable[[int, int], None] = None,
+    index: bool = True,
+):
+    """
+    Import a book with all its chapters in one transaction.
+
+    Content, ContentNode and Chapter rows are inserted batch by batch with
+    multi-row inserts, progress(done, total) is called after each batch
+    (total is None for streamed chapters), a tqdm bar is shown by default.
+    With index, the search grams of every chapter are written in the same transaction.
+    """
+    total = len(chapters) if hasattr(chapters, "__len__") else None
+    bar = None
+    if progress is None:
+        bar = tqdm(total=total, desc=crt.title, unit="chapter")
+
+    it = iter(chapters)
+    done = 0
+    try:
+        book = book_from_create(crt)
+        db.add(book)
+        db.flush()
+        while True:
+            batch = list(islice(it, batch_size))
+            if len(batch) == 0:
+                break
+            node_ids = bulk_create_content_with_node_impl(
+                db,
+                [
+                    ContentData(data=chapter.content, size=len(chapter.content))
+                    for chapter in batch
+                ],
+            )
+            chapter_ids = bulk_create_chapter_impl(
+                db,
+                [
+                    ChapterData(
+                        title=chapter.title,
+                        book_id=book.id,
+                        content_node_id=node_id,
+                        order=done + i,
+                    )
+                    for i, (chapter, node_id) in enumerate(zip(batch, node_ids))
+                ],
+            )
+            if index:
+                index_chapter_grams_impl(
+                    db,
+                    [
+                        (chapter_id, book.id, chapter.content)
+                        for chapter_id, chapter in zip(chapter_ids, batch)
+                    ],
+                )
+            done += len(batch)
+            if bar is not None:
+                bar.update(len(batch))
+            else:
+                progress(done, total)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if bar is not None:
+            bar.close()
+
+    logger.info(f"Imported book {book.id} {crt.title} with {done} chapters")
+    return book.id
+
+
+def create_book_from_parser(db, book: BPBook, progress=None):
     book_crt = BookData(title=book.title, author=book.author)
-    book_id = create_book_impl(db, book_crt)
-    for i, chapter in tqdm(enumerate(book.chapters)):
-        create_chapter_from_parser(db, chapter, book_id, i)
-    return book_id
+    return import_book_impl(db, book_crt, book.chapters, progress=progress)
 
 
 def read_book_impl(db, book_id: int):
@@ -54,6 +141,89 @@ def read_book_impl(db, book_id: int):
     )
 
 
-def read_books_info_impl(db, skip: int, limit: int):
-    books = db.query(Book).order_by(Book.id).offset(skip).limit(limit).all()
-    return [BookData(id=book.id, title=book.title) for book in books]
+def read_books_info_impl(db, after_id: int = 0, limit: int = 50):
+    """
+    target SQL:
+    WITH page AS (SELECT id, title, author FROM book WHERE id > :after_id ORDER BY id LIMIT :limit)
+    SELECT page.id, page.title, page.author, count(chapter.id),
+    coalesce(sum(content_node.offset), 0), max(chapter.mtime) FROM page
+    LEFT OUTER JOIN chapter ON chapter.book_id=page.id
+    LEFT OUTER JOIN content_node ON content_node.id=chapter.content_node_id
+    GROUP BY page.id, page.title, page.author ORDER BY page.id;
+    keyset pagination, pass the last id of a page as after_id of the next one
+    """
+    page = (
+        db.query(Book.id, Book.title, Book.author)
+        .filter(Book.id > after_id)
+        .order_by(Book.id)
+        .limit(limit)
+        .cte("page")
+    )
+    rows = (
+        db.query(
+            page.c.id,
+            page.c.title,
+            page.c.author,
+            func.count(Chapter.id).label("chapter_count"),
+            func.coalesce(func.sum(ContentNode.offset), 0).label("size"),
+            func.max(Chapter.mtime).label("mtime"),
+        )
+        .outerjoin(Chapter, Chapter.book_id == page.c.id)
+        .outerjoin(ContentNode, ContentNode.id == Chapter.content_node_id)
+        .group_by(page.c.id, page.c.title, page.c.author)
+        .order_by(page.c.id)
+        .all()
+    )
+    return [
+        BookData(
+            id=row.id,
+            title=row.title or "",
+            author=row.author or "",
+            chapter_count=row.chapter_count,
+            size=row.size,
+            mtime=row.mtime,
+        )
+        for row in rows
+    ]
+
+
+def read_book_toc_impl(db, book_id: int):
+    """
+    target SQL:
+    SELECT book.title, book.author, chapter.id, chapter.order, chapter.title, content_node.offset FROM book
+    LEFT OUTER JOIN chapter ON chapter.book_id=book.id
+    LEFT OUTER JOIN content_node ON content_node.id=chapter.content_node_id
+    WHERE book.id=1 ORDER BY chapter.order;
+    """
+    rows = (
+        db.query(
+            Book.title,
+            Book.author,
+            Chapter.id.label("chapter_id"),
+            Chapter.order,
+            Chapter.title.label("chapter_title"),
+            ContentNode.offset,
+        )
+        .outerjoin(Chapter, Chapter.book_id == Book.id)
+        .outerjoin(ContentNode, ContentNode.id == Chapter.content_node_id)
+        .filter(Book.id == book_id)
+        .order_by(Chapter.order, Chapter.id)
+        .all()
+    )
+    if len(rows) == 0:
+        return None
+    return BookTocData(
+        id=book_id,
+        title=rows[0].title or "",
+        author=rows[0].author or "",
+        chapters=[
+            TocEntryData(
+                id=row.chapter_id,
+                order=row.order,
+                title=row.chapter_title or "",
+                size=row.offset or 0,
+            )
+            for row in rows
+            if row.chapter_id is not None
+        ],
+    )
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# @file cache.py
+# @brief The Chapter Payload Cache
+# @author sailing-innocent
+# @date 2025-06-12
+# @version 1.0
+# ---------------------------------
+
+from internal.data.content import ChapterData
+from utils.lru import SizedLRUCache
+from dataclasses import replace
+import os
+import sys
+
+# 64MB by default, 0 disables the cache
+CHAPTER_CACHE_BYTES = int(os.environ.get("CHAPTER_CACHE_BYTES", 64 * 1024 * 1024))
+
+
+def _chapter_size(chapter: ChapterData):
+    return sys.getsizeof(chapter.content) + sys.getsizeof(chapter.title)
+
+
+g_chapter_cache = SizedLRUCache(CHAPTER_CACHE_BYTES, sizeof=_chapter_size)
+# (book_id, order) -> chapter id, so a chapter is stored and charged once;
+# bounded by entry count, a stale pointer only costs a miss
+g_chapter_order_index = SizedLRUCache(1 << 16, sizeof=lambda _: 1)
+
+
+def _id_key(chapter_id: int):
+    return ("id", chapter_id)
+
+
+def _order_key(book_id: int, order: int):
+    return ("order", book_id, order)
+
+
+def get_cached_chapter(chapter_id: int = None, book_id: int = None, order: int = None):
+    # a copy is returned, so callers can not mutate the cached entry
+    if chapter_id is None:
+        chapter_id = g_chapter_order_index.get(_order_key(book_id, order))
+        chapter = g_chapter_cache.get(_id_key(chapter_id))
+        if chapter is not None and (chapter.book_id, chapter.order) != (book_id, order):
+            chapter = None  # the slot now holds another chapter
+    else:
+        chapter = g_chapter_cache.get(_id_key(chapter_id))
+    return replace(chapter) if chapter is not None else None
+
+
+def put_cached_chapter(chapter: ChapterData):
+    if g_chapter_cache.max_bytes <= 0:
+        return
+    g_chapter_cache.put(_id_key(chapter.id), replace(chapter))
+    g_chapter_order_index.put(_order_key(chapter.book_id, chapter.order), chapter.id)
+
+
+def invalidate_chapter_cache(
+    chapter_id: int = None,
+    book_id: int = None,
+    order: int = None,
+    content_node_id: int = None,
+):
+    """
+    Drop every cached chapter matching any of the given ids,
+    call it whenever a chapter or a content node is changed.
+    book_id alone drops the whole book, with order only that slot.
+    """
+
+    def match(_, chapter: ChapterData):
+        return (
+            (chapter_id is not None and chapter.id == chapter_id)
+            or (
+                book_id is not None
+                and chapter.book_id == book_id
+                and (order is None or chapter.order == order)
+            )
+            or (
+                content_node_id is not None
+                and chapter.content_node_id == content_node_id
+            )
+        )
+
+    if book_id is not None:
+        g_chapter_order_index.invalidate_if(
+            lambda key, _: key[1] == book_id and (order is None or key[2] == order)
+        )
+    return g_chapter_cache.invalidate_if(match)
+
+
+def clear_chapter_cache():
+    g_chapter_cache.clear()
+    g_chapter_order_index.clear()
+
+
+def chapter_cache_stats() -> dict:
+    return g_chapter_cache.stats()
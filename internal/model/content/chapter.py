@@ -7,11 +7,12 @@
 # ---------------------------------
 
 from pydantic import BaseModel
-from sqlalchemy import and_
+from sqlalchemy import and_, func, insert
 
 from internal.data.content import (
     Book,
     Chapter,
+    ChapterGram,
     ContentNode,
     Content,
     ParagraphTree,
@@ -21,17 +22,30 @@ from internal.data.content import (
 from internal.model.content.content import (
     create_content_with_node_impl,
     read_content_data_by_node_impl,
+    node_data_column,
+    node_text,
+)
+from internal.model.content.search import chapter_text_query, index_chapter_grams_impl
+from internal.model.content.cache import (
+    get_cached_chapter,
+    put_cached_chapter,
+    invalidate_chapter_cache,
+    clear_chapter_cache,
 )
 from utils.book_parser import BPChapter
 import time
 import logging
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 
 def clean_all_impl(db):
+    db.query(ChapterGram).delete()
     db.query(Chapter).delete()
     db.query(Book).delete()
     db.commit()
+    clear_chapter_cache()
 
 
 def chapter_from_create(create: ChapterData):
@@ -49,9 +63,52 @@ def create_chapter_impl(db, crt: ChapterData):
     chapter = chapter_from_create(crt)
     db.add(chapter)
     db.commit()
+    invalidate_chapter_cache(book_id=chapter.book_id, order=chapter.order)
     return chapter.id
 
 
+def update_chapter_impl(db, chapter_id: int, upd: ChapterData):
+    chapter = db.query(Chapter).filter(Chapter.id == chapter_id).first()
+    if chapter is None:
+        return None
+    old_book_id, old_order = chapter.book_id, chapter.order
+    chapter.title = upd.title
+    chapter.book_id = upd.book_id
+    chapter.order = upd.order
+    chapter.mtime = datetime.now()
+    db.commit()
+    invalidate_chapter_cache(chapter_id=chapter_id)
+    invalidate_chapter_cache(book_id=old_book_id, order=old_order)
+    invalidate_chapter_cache(book_id=chapter.book_id, order=chapter.order)
+    return info_from_chapter(chapter)
+
+
+def bulk_create_chapter_impl(db, crts: list[ChapterData]):
+    """
+    Insert chapters with multi-row INSERT ... RETURNING.
+    Only flushed, the caller owns the transaction.
+    """
+    if len(crts) == 0:
+        return []
+    for book_id in set(crt.book_id for crt in crts):
+        invalidate_chapter_cache(book_id=book_id)
+    now = datetime.now()
+    return db.scalars(
+        insert(Chapter).returning(Chapter.id, sort_by_parameter_order=True),
+        [
+            {
+                "title": crt.title,
+                "book_id": crt.book_id,
+                "content_node_id": crt.content_node_id,
+                "ctime": now,
+                "mtime": now,
+                "order": crt.order,
+            }
+            for crt in crts
+        ],
+    ).all()
+
+
 def info_from_chapter(chapter: Chapter):
     return ChapterData(
         title=chapter.title,
@@ -81,38 +138,53 @@ def get_chapter_info_by_book_impl(db, book_id: int, order: int = -1):
 
 
 def read_chapter_impl(db, chapter_id: int) -> ChapterData:
+    cached = get_cached_chapter(chapter_id=chapter_id)
+    if cached is not None:
+        return cached
     chapter = db.query(Chapter).filter(Chapter.id == chapter_id).first()
     if chapter is None:
         return None
     # return read_from_chapter(chapter)
     content_data = read_content_data_by_node_impl(db, chapter.content_node_id)
-    return ChapterData(
+    res = ChapterData(
         id=chapter.id,
         title=chapter.title,
         book_id=chapter.book_id,
+        content_node_id=chapter.content_node_id,
         content=content_data,
         order=chapter.order,
     )
+    if content_data is not None:
+        put_cached_chapter(res)
+    return res
 
 
 def read_book_chapter_impl(db, book_id: int, chapter_order: int) -> ChapterData:
     """
     target SQL:
-    SELECT content_node.start, content_node.offset, content.data, content.size FROM chapter
+    SELECT chapter.id, chapter.title, chapter.order,
+    coalesce(substr(content.data, content_node.start + 1, content_node.offset), content.data),
+    content.packed FROM chapter
     INNER JOIN book ON chapter.book_id=book.id
     INNER JOIN content_node ON content_node.id=chapter.content_node_id
     INNER JOIN content ON content.id=content_node.content_id
     WHERE book.id=1 AND chapter.order=13;
     """
+    cached = get_cached_chapter(book_id=book_id, order=chapter_order)
+    if cached is not None:
+        return cached
     result = (
         db.query(
             Chapter.id,
             Chapter.title,
             Chapter.order,
+            Chapter.content_node_id,
             ContentNode.start,
             ContentNode.offset,
-            Content.data,
             Content.size,
+            # a node without start/offset falls back to the whole content
+            func.coalesce(node_data_column(), Content.data).label("data"),
+            Content.packed,
         )
         .join(Book, Chapter.book_id == Book.id)
         .join(ContentNode, ContentNode.id == Chapter.content_node_id)
@@ -124,45 +196,76 @@ def read_book_chapter_impl(db, book_id: int, chapter_order: int) -> ChapterData:
     if result is None:
         return None
 
-    # Extract content data based on start and offset
-    content_data = (
-        result.data[result.start : result.start + result.offset]
-        if result.start is not None and result.offset is not None
-        else result.data
-    )
+    if (
+        result.start is not None
+        and result.offset is not None
+        and result.size is not None
+        and result.start + result.offset > result.size
+    ):
+        logger.error("ContentNode out of range")
+        return None
 
-    return ChapterData(
+    res = ChapterData(
         id=result.id,
         title=result.title,
         book_id=book_id,
-        content=content_data,
+        content_node_id=result.content_node_id,
+        content=node_text(result.data, result.packed, result.start, result.offset),
         order=result.order,
     )
+    put_cached_chapter(res)
+    return res
+
+
+def iter_book_chapters_impl(
+    db, book_id: int, first: int = None, last: int = None, batch_size: int = 64
+):
+    """
+    target SQL:
+    SELECT chapter.id, chapter.order, chapter.title, substr(...), content.packed FROM chapter
+    JOIN content_node ON ... JOIN content ON ...
+    WHERE chapter.book_id=1 AND chapter.order BETWEEN :first AND :last
+    ORDER BY chapter.order;
+    one query for the whole range, rows are fetched batch_size at a time
+    """
+    query = chapter_text_query(db).filter(Chapter.book_id == book_id)
+    if first is not None:
+        query = query.filter(Chapter.order >= first)
+    if last is not None:
+        query = query.filter(Chapter.order <= last)
+    for row in query.order_by(Chapter.order, Chapter.id).yield_per(batch_size):
+        yield ChapterData(
+            id=row.id,
+            title=row.title,
+            book_id=row.book_id,
+            order=row.order,
+            content=node_text(row.data, row.packed, row.start, row.offset) or "",
+        )
 
 
 class ParagraphTreeCreate(BaseModel):
-    from_content_node_id: int
-    to_content_node_id: int
+    root_content_node_id: int
+    data: dict
 
 
 class ParagraphTreeRead(BaseModel):
     id: int
-    from_content_node_id: int
-    to_content_node_id: int
+    root_content_node_id: int
+    data: dict
 
 
 def paragraph_tree_from_create(create: ParagraphTreeCreate):
     return ParagraphTree(
-        from_content_node_id=create.from_content_node_id,
-        to_content_node_id=create.to_content_node_id,
+        root_content_node_id=create.root_content_node_id,
+        data=create.data,
     )
 
 
 def read_from_paragraph_tree(tree: ParagraphTree):
     return ParagraphTreeRead(
         id=tree.id,
-        from_content_node_id=tree.from_content_node_id,
-        to_content_node_id=tree.to_content_node_id,
+        root_content_node_id=tree.root_content_node_id,
+        data=tree.data or {},
     )
 
 
@@ -189,4 +292,7 @@ def create_chapter_from_parser(db, chapter: BPChapter, book_id, order):
         content_node_id=content_node_id,
         order=order,
     )
-    return create_chapter_impl(db, crt)
+    chapter_id = create_chapter_impl(db, crt)
+    index_chapter_grams_impl(db, [(chapter_id, book_id, chapter.content)])
+    db.commit()
+    return chapter_id
@@ -6,38 +6,99 @@
 # @version 1.0
 # ---------------------------------
 
-from internal.data.content import ContentNode, Content, ContentData, ContentNodeData
+from sqlalchemy import func, insert, or_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from internal.data.content import (
+    ContentNode,
+    Content,
+    ContentData,
+    ContentNodeData,
+    ParagraphTree,
+    content_node_span,
+)
+from internal.model.content.cache import invalidate_chapter_cache, clear_chapter_cache
+from utils.codec import pack_if_large, unpack_text
+from dataclasses import dataclass
+import hashlib
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
 
 def clean_all_impl(db):
+    db.query(ParagraphTree).delete()
     db.query(Content).delete()
     db.query(ContentNode).delete()
     db.commit()
+    clear_chapter_cache()
+
+
+def content_hash(data: str):
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def dedup_enabled(dedup: bool = None):
+    # content-addressed mode, on unless CONTENT_DEDUP=false
+    if dedup is not None:
+        return dedup
+    return os.environ.get("CONTENT_DEDUP", "true").lower() == "true"
+
+
+def content_text(data: str, packed: bytes):
+    # the raw text of a content row, packed rows are decompressed here
+    if data is None and packed is not None:
+        return unpack_text(packed)
+    return data
+
+
+def node_text(data: str, packed: bytes, start: int, offset: int):
+    # data is the SQL-side node slice, packed rows are sliced after decompression
+    if data is None and packed is not None:
+        text = unpack_text(packed)
+        if start is not None and offset is not None:
+            return text[start : start + offset]
+        return text
+    return data
+
+
+def content_row_values(create: ContentData, threshold: int = None):
+    # column values of a new content row, large texts are packed
+    data, packed = pack_if_large(create.data, threshold)
+    return {"data": data, "packed": packed, "size": create.size}
 
 
 def content_from_data(create: ContentData):
-    return Content(
-        data=create.data,
-        size=create.size,
-    )
+    return Content(**content_row_values(create))
 
 
 def data_from_content(content: Content):
     return ContentData(
         id=content.id,
-        data=content.data,
+        data=content_text(content.data, content.packed),
         size=content.size,
     )
 
 
-def create_content_impl(db, crt: ContentData):
-    content = content_from_data(crt)
-    db.add(content)
+def create_content_impl(db, crt: ContentData, dedup: bool = None):
+    if not dedup_enabled(dedup):
+        content = content_from_data(crt)
+        db.add(content)
+        db.commit()
+        return content.id, content.size
+
+    # identical text reuses the existing row
+    h = content_hash(crt.data)
+    row = db.execute(
+        pg_insert(Content)
+        .values(hash=h, **content_row_values(crt))
+        .on_conflict_do_nothing(index_elements=[Content.hash])
+        .returning(Content.id, Content.size)
+    ).first()
+    if row is None:
+        row = db.query(Content.id, Content.size).filter(Content.hash == h).first()
     db.commit()
-    return content.id, content.size
+    return row.id, row.size
 
 
 def read_content_impl(db, content_id: int):
@@ -64,8 +125,21 @@ def create_content_node_impl(db, crt: ContentNodeData):
     return content_node.id
 
 
-def create_content_with_node_impl(db, crt: ContentData):
-    cid, sz = create_content_impl(db, crt)
+def update_content_node_impl(db, node_id: int, upd: ContentNodeData):
+    node = db.query(ContentNode).filter(ContentNode.id == node_id).first()
+    if node is None:
+        return None
+    node.raw_tags = upd.raw_tags
+    node.tags = upd.tags
+    node.start = upd.start
+    node.offset = upd.offset
+    db.commit()
+    invalidate_chapter_cache(content_node_id=node_id)
+    return node.id
+
+
+def create_content_with_node_impl(db, crt: ContentData, dedup: bool = None):
+    cid, sz = create_content_impl(db, crt, dedup)
     # the auto binding full node
     node_crt = ContentNodeData(
         raw_tags="",
@@ -77,15 +151,375 @@ def create_content_with_node_impl(db, crt: ContentData):
     return create_content_node_impl(db, node_crt)
 
 
+def node_data_column():
+    """
+    substr(content.data, content_node.start + 1, content_node.offset)
+    the node slice is cut in SQL, so only the node text is transferred
+    """
+    return func.substr(Content.data, ContentNode.start + 1, ContentNode.offset)
+
+
+def bulk_upsert_content_impl(db, crts: list[ContentData]):
+    """
+    Content-addressed multi-row insert, rows whose hash already exists
+    (in the table or earlier in crts) are reused instead of inserted.
+    Only flushed, returns the content ids in the order of crts.
+    """
+    hashes = [content_hash(crt.data) for crt in crts]
+    unique = {}
+    for h, crt in zip(hashes, crts):
+        unique.setdefault(h, crt)
+
+    ids = dict(
+        db.query(Content.hash, Content.id).filter(Content.hash.in_(list(unique))).all()
+    )
+    missing = [h for h in unique if h not in ids]
+    if len(missing) > 0:
+        rows = db.execute(
+            pg_insert(Content)
+            .values(
+                [{"hash": h, **content_row_values(unique[h])} for h in missing]
+            )
+            .on_conflict_do_nothing(index_elements=[Content.hash])
+            .returning(Content.hash, Content.id)
+        ).all()
+        ids.update({row.hash: row.id for row in rows})
+        # inserted concurrently by another session
+        raced = [h for h in missing if h not in ids]
+        if len(raced) > 0:
+            ids.update(
+                db.query(Content.hash, Content.id)
+                .filter(Content.hash.in_(raced))
+                .all()
+            )
+    return [ids[h] for h in hashes]
+
+
+def bulk_create_content_with_node_impl(
+    db, crts: list[ContentData], dedup: bool = None
+):
+    """
+    Insert contents and their full nodes with multi-row INSERT ... RETURNING.
+    Only flushed, the caller owns the transaction.
+    Returns the content node ids in the order of crts.
+    """
+    if len(crts) == 0:
+        return []
+    if dedup_enabled(dedup):
+        content_ids = bulk_upsert_content_impl(db, crts)
+    else:
+        content_ids = db.scalars(
+            insert(Content).returning(Content.id, sort_by_parameter_order=True),
+            [content_row_values(crt) for crt in crts],
+        ).all()
+    node_ids = db.scalars(
+        insert(ContentNode).returning(ContentNode.id, sort_by_parameter_order=True),
+        [
+            {
+                "raw_tags": "",
+                "tags": "",
+                "content_id": cid,
+                "start": 0,
+                "offset": crt.size,
+            }
+            for cid, crt in zip(content_ids, crts)
+        ],
+    ).all()
+    return node_ids
+
+
+def dedupe_content_batch_impl(db, after_id: int = 0, batch_size: int = 500):
+    """
+    Hash one batch of legacy rows (hash IS NULL, id > after_id), rows whose
+    text already exists are merged: their nodes are moved to the canonical
+    row and the duplicate is deleted. One transaction per batch.
+    Returns (last_id, hashed, merged), last_id is None when nothing is left.
+    """
+    rows = (
+        db.query(Content.id, Content.data, Content.packed)
+        .filter(Content.hash.is_(None), Content.id > after_id)
+        .order_by(Content.id)
+        .limit(batch_size)
+        .all()
+    )
+    if len(rows) == 0:
+        return None, 0, 0
+
+    hashes = [content_hash(content_text(row.data, row.packed) or "") for row in rows]
+    canonical = dict(
+        db.query(Content.hash, Content.id).filter(Content.hash.in_(hashes)).all()
+    )
+    to_hash = []
+    to_merge = []  # (duplicate id, canonical id)
+    for row, h in zip(rows, hashes):
+        if h in canonical:
+            to_merge.append((row.id, canonical[h]))
+        else:
+            canonical[h] = row.id
+            to_hash.append({"id": row.id, "hash": h})
+
+    try:
+        if len(to_hash) > 0:
+            db.execute(update(Content), to_hash)
+        for dup_id, keep_id in to_merge:
+            db.query(ContentNode).filter(ContentNode.content_id == dup_id).update(
+                {ContentNode.content_id: keep_id}, synchronize_session=False
+            )
+        if len(to_merge) > 0:
+            db.query(Content).filter(
+                Content.id.in_([dup_id for dup_id, _ in to_merge])
+            ).delete(synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return rows[-1].id, len(to_hash), len(to_merge)
+
+
 def read_content_data_by_node_impl(db, node_id: int):
+    """
+    target SQL:
+    SELECT content_node.start, content_node.offset, content.size,
+    substr(content.data, content_node.start + 1, content_node.offset), content.packed FROM content_node
+    INNER JOIN content ON content.id=content_node.content_id
+    WHERE content_node.id=1;
+    packed is NULL for raw rows, so only packed rows transfer the whole blob
+    """
+    result = (
+        db.query(
+            ContentNode.start,
+            ContentNode.offset,
+            Content.size,
+            node_data_column().label("data"),
+            Content.packed,
+        )
+        .join(Content, Content.id == ContentNode.content_id)
+        .filter(ContentNode.id == node_id)
+        .first()
+    )
+    if result is None:
+        return None
+    if result.start + result.offset > result.size:
+        logger.error("ContentNode out of range")
+        return None
+
+    return node_text(result.data, result.packed, result.start, result.offset)
+
+
+def data_from_content_node(node: ContentNode):
+    return ContentNodeData(
+        id=node.id,
+        content_id=node.content_id,
+        raw_tags=node.raw_tags or "",
+        tags=node.tags or "",
+        start=node.start,
+        offset=node.offset,
+    )
+
+
+def read_nodes_covering_impl(db, root_id: int, pos: int, tags: str = None):
+    """
+    The nodes of the tree of root_id (the root and the segments it owns,
+    a segment stands for its root) whose range covers pos, outermost first.
+    target SQL:
+    SELECT * FROM content_node
+    WHERE content_id = 1 AND int4range(start, start + "offset") @> 42
+      AND (root_id = 7 OR id = 7)
+    ORDER BY "offset" DESC, id;
+    served by ix_content_node_span; the root filter drops the nodes of other
+    chapters sharing the same deduplicated content
+    """
+    node = db.query(ContentNode).filter(ContentNode.id == root_id).first()
+    if node is None:
+        return []
+    root_id = node.root_id or node.id  # a segment stands for its tree
+    query = db.query(ContentNode).filter(
+        ContentNode.content_id == node.content_id,
+        content_node_span().op("@>")(pos),
+        or_(ContentNode.root_id == root_id, ContentNode.id == root_id),
+    )
+    if tags is not None:
+        query = query.filter(ContentNode.tags == tags)
+    nodes = query.order_by(ContentNode.offset.desc(), ContentNode.id).all()
+    return [data_from_content_node(node) for node in nodes]
+
+
+def read_node_descendants_impl(
+    db, node_id: int, tags: str = None, include_self: bool = False
+):
+    """
+    The segments of node_id: for a root every node it owns, for a segment the
+    nodes of the same root inside its range, sorted by start, outer first.
+    SELECT * FROM content_node WHERE root_id = 1 ORDER BY start, "offset" DESC, id;
+    Ownership comes from root_id, ranges alone would mix in the nodes of other
+    chapters sharing the same deduplicated content. A segment with the same
+    range as the node counts as its child if it was created later (the
+    sentence of a single sentence paragraph).
+    with include_self the node itself comes first
+    """
     node = db.query(ContentNode).filter(ContentNode.id == node_id).first()
     if node is None:
+        return []
+    end = node.start + node.offset
+    query = db.query(ContentNode).filter(ContentNode.id != node.id)
+    if node.root_id is None:
+        query = query.filter(ContentNode.root_id == node.id)
+    else:
+        query = query.filter(
+            ContentNode.root_id == node.root_id,
+            ContentNode.start >= node.start,
+            ContentNode.start + ContentNode.offset <= end,
+            or_(
+                ContentNode.start != node.start,
+                ContentNode.offset != node.offset,
+                ContentNode.id > node.id,
+            ),
+        )
+    if tags is not None:
+        query = query.filter(ContentNode.tags == tags)
+    nodes = query.order_by(
+        ContentNode.start, ContentNode.offset.desc(), ContentNode.id
+    ).all()
+    if include_self:
+        nodes.insert(0, node)
+    return [data_from_content_node(n) for n in nodes]
+
+
+def compress_content_batch_impl(
+    db, after_id: int = 0, batch_size: int = 200, threshold: int = 4096
+):
+    """
+    Pack one batch of raw rows (packed IS NULL, size >= threshold, id > after_id).
+    Returns (last_id, packed, saved_bytes), last_id is None when nothing is left.
+    """
+    rows = (
+        db.query(Content.id, Content.data, Content.size)
+        .filter(
+            Content.packed.is_(None),
+            Content.data.is_not(None),
+            Content.size >= threshold,
+            Content.id > after_id,
+        )
+        .order_by(Content.id)
+        .limit(batch_size)
+        .all()
+    )
+    if len(rows) == 0:
+        return None, 0, 0
+
+    updates = []
+    saved = 0
+    for row in rows:
+        data, packed = pack_if_large(row.data, threshold)
+        if packed is None:
+            continue
+        updates.append({"id": row.id, "data": None, "packed": packed})
+        saved += len(row.data.encode("utf-8")) - len(packed)
+    try:
+        if len(updates) > 0:
+            db.execute(update(Content), updates)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return rows[-1].id, len(updates), saved
+
+
+@dataclass
+class NodeSpan:
+    node_id: int
+    content_id: int
+    start: int
+    offset: int  # length in characters
+    nbytes: int  # length in utf-8 bytes
+    text: str = None  # only for packed rows, which can not be cut in SQL
+
+
+def read_node_span_impl(db, node_id: int):
+    """
+    The position and lengths of a node, without transferring its text
+    """
+    result = (
+        db.query(
+            ContentNode.start,
+            ContentNode.offset,
+            Content.id,
+            Content.size,
+            func.octet_length(node_data_column()).label("nbytes"),
+            Content.packed,
+        )
+        .join(Content, Content.id == ContentNode.content_id)
+        .filter(ContentNode.id == node_id)
+        .first()
+    )
+    if result is None:
         return None
-    content = db.query(Content).filter(Content.id == node.content_id).first()
-    if content is None:
-        return None
-    if node.start + node.offset > content.size:
+    if result.start + result.offset > result.size:
         logger.error("ContentNode out of range")
         return None
+    span = NodeSpan(
+        node_id=node_id,
+        content_id=result.id,
+        start=result.start,
+        offset=result.offset,
+        nbytes=result.nbytes or 0,
+    )
+    if result.packed is not None:
+        span.text = node_text(None, result.packed, result.start, result.offset)
+        span.nbytes = len(span.text.encode("utf-8"))
+    return span
+
+
+def read_node_chars_impl(db, span: NodeSpan, begin: int, end: int):
+    """
+    Characters [begin, end) of the node, cut by substr in SQL
+    """
+    end = min(end, span.offset)
+    if begin >= end:
+        return ""
+    if span.text is not None:
+        return span.text[begin:end]
+    return (
+        db.query(func.substr(Content.data, span.start + begin + 1, end - begin))
+        .filter(Content.id == span.content_id)
+        .scalar()
+    )
+
+
+def read_node_bytes_impl(db, span: NodeSpan, begin: int, end: int):
+    """
+    UTF-8 bytes [begin, end) of the node, cut by substring in SQL
+    """
+    end = min(end, span.nbytes)
+    if begin >= end:
+        return b""
+    if span.text is not None:
+        return span.text.encode("utf-8")[begin:end]
+    node_bytes = func.convert_to(
+        func.substr(Content.data, span.start + 1, span.offset), "UTF8"
+    )
+    return bytes(
+        db.query(func.substring(node_bytes, begin + 1, end - begin))
+        .filter(Content.id == span.content_id)
+        .scalar()
+    )
+
 
-    return content.data[node.start : node.start + node.offset]
+def iter_node_text_impl(
+    db, span: NodeSpan, begin: int, end: int, unit: str = "chars", chunk: int = 65536
+):
+    """
+    Yield the utf-8 encoded range [begin, end) chunk by chunk, one query per
+    chunk, so the memory of a request is bounded by the chunk size.
+    """
+    if span.text is not None and unit == "bytes":
+        data = span.text.encode("utf-8")[begin:end]
+        for i in range(0, len(data), chunk):
+            yield data[i : i + chunk]
+        return
+    for pos in range(begin, end, chunk):
+        if unit == "chars":
+            text = read_node_chars_impl(db, span, pos, min(pos + chunk, end))
+            yield text.encode("utf-8")
+        else:
+            yield read_node_bytes_impl(db, span, pos, min(pos + chunk, end))
@@ -9,15 +9,103 @@
 # Image Resources
 # ----------------------------------------
 
-from internal.data.content import DBImage, DBImageData
+from sqlalchemy import func, insert, or_, update
+from sqlalchemy.orm import undefer
+from PIL import Image
+from io import BytesIO
+
+from internal.data.content import (
+    DBImage,
+    DBImageData,
+    ImageBlobData,
+    ImageTilesData,
+    SimilarImageData,
+)
+from internal.model.content.blob import (
+    IMAGE_TILE_WORKERS,
+    g_image_store,
+    g_derivative_cache,
+    g_tile_store,
+    file_backend_enabled,
+)
+from utils.blob_store import blob_hash
+from utils.tile_store import PyramidTooLarge
+from utils.phash import MultiIndexHash, ahash, dhash, hamming, to_signed64, to_unsigned64
+from utils.image import (
+    DERIVATIVE_FORMATS,
+    TILE_SIZE,
+    classify_image,
+    encode_for_storage,
+    storage_format,
+    storage_mode,
+    format_media_type,
+    image_info,
+    image_media_type,
+    is_lossy_encoding,
+    iter_tiles,
+    make_derivative,
+    snap_width,
+    tile_max_zoom,
+)
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def image_blob_values(data: bytes, backend: str = None, sha: str = None):
+    # data and hash columns of new image bytes, the file backend keeps data NULL
+    if data is None:
+        return {"data": None, "hash": None}
+    if file_backend_enabled(backend):
+        return {"data": None, "hash": g_image_store.put(data)}
+    return {"data": data, "hash": sha or blob_hash(data)}
+
+
+def image_phash_values(image: Image.Image):
+    # perceptual hash columns of a decoded image, stored as signed BIGINT
+    return {
+        "ahash": to_signed64(ahash(image)),
+        "dhash": to_signed64(dhash(image)),
+    }
+
+
+def image_metadata_values(data: bytes):
+    # width, height, size, format and perceptual hash columns, computed once at insert time
+    values = {"width": None, "height": None, "size": None, "format": None}
+    values.update(ahash=None, dhash=None)
+    if data is None:
+        return values
+    width, height, format = image_info(data)
+    values.update(width=width, height=height, size=len(data), format=format)
+    if format is not None:
+        try:
+            with Image.open(BytesIO(data)) as image:
+                values.update(image_phash_values(image))
+        except Exception as e:
+            logger.warning(f"Failed to hash image: {e}")
+    return values
+
+
+def image_data(image: DBImage):
+    # the bytes of an image row, read from the blob store if not in the row
+    if image.data is not None:
+        return image.data
+    if image.hash is not None:
+        return g_image_store.read(image.hash)
+    return None
 
 
 def image_from_create(create: DBImageData):
     return DBImage(
         name=create.name,
-        data=create.data,
         htime=create.htime,
         desp=create.desp,
+        **image_blob_values(create.data),
+        **image_metadata_values(create.data),
     )
 
 
@@ -25,20 +113,28 @@ def image_from_read(read: DBImageData):
     return DBImage(
         id=read.id,
         name=read.name,
-        data=read.data,
         htime=read.htime,
         desp=read.desp,
+        **image_blob_values(read.data),
+        **image_metadata_values(read.data),
     )
 
 
 def read_from_image(image: DBImage, no_data: bool = False):
-    data = image.data if not no_data else None
+    data = image_data(image) if not no_data else None
     return DBImageData(
         id=image.id,
         name=image.name,
         data=data,
         htime=image.htime,
         desp=image.desp,
+        hash=image.hash,
+        width=image.width,
+        height=image.height,
+        size=image.size,
+        format=image.format,
+        ahash=to_unsigned64(image.ahash) if image.ahash is not None else None,
+        dhash=to_unsigned64(image.dhash) if image.dhash is not None else None,
     )
 
 
@@ -49,6 +145,44 @@ def create_image_impl(db, image_create: DBImageData):
     return read_from_image(image)
 
 
+def bulk_create_images_impl(db, crts: list[DBImageData]):
+    """
+    Insert images with one multi-row INSERT ... RETURNING, a precomputed
+    crt.hash and crt.width/height/format are used as they are.
+    Only flushed, the caller owns the transaction.
+    Returns the image ids in the order of crts.
+    """
+    if len(crts) == 0:
+        return []
+    rows = []
+    for crt in crts:
+        values = image_blob_values(crt.data, sha=crt.hash)
+        if crt.width is not None and crt.format is not None and crt.dhash is not None:
+            values.update(
+                width=crt.width,
+                height=crt.height,
+                size=len(crt.data),
+                format=crt.format,
+                ahash=to_signed64(crt.ahash),
+                dhash=to_signed64(crt.dhash),
+            )
+        else:
+            values.update(image_metadata_values(crt.data))
+        rows.append({"name": crt.name, "htime": crt.htime, "desp": crt.desp, **values})
+    return db.scalars(
+        insert(DBImage).returning(DBImage.id, sort_by_parameter_order=True), rows
+    ).all()
+
+
+def existing_image_hashes_impl(db, hashes: list[str]):
+    if len(hashes) == 0:
+        return set()
+    return {
+        sha
+        for (sha,) in db.query(DBImage.hash).filter(DBImage.hash.in_(hashes)).all()
+    }
+
+
 def get_image_impl(db, image_id: int, no_data: bool = False):
     image = db.query(DBImage).filter(DBImage.id == image_id).first()
     if image is None:
@@ -56,19 +190,45 @@ def get_image_impl(db, image_id: int, no_data: bool = False):
     return read_from_image(image, no_data)
 
 
+def release_image_blobs_impl(db, hashes):
+    """
+    Delete the blob files of hashes that no row refers to any more,
+    a blob may be shared by several rows with the same bytes
+    """
+    hashes = {sha for sha in hashes if sha is not None}
+    if len(hashes) == 0:
+        return
+    for sha in hashes - existing_image_hashes_impl(db, list(hashes)):
+        g_image_store.delete(sha)
+
+
 def update_image_impl(db, image_id: int, image_update: DBImageData):
     image = db.query(DBImage).filter(DBImage.id == image_id).first()
     if image is None:
         return None
+    old_hash, new_hash = image.hash, image.hash
     if image_update.name is not None:
         image.name = image_update.name
     if image_update.data is not None:
-        image.data = image_update.data
+        values = image_blob_values(image_update.data)
+        values.update(image_metadata_values(image_update.data))
+        new_hash = values["hash"]
+        for key, value in values.items():
+            setattr(image, key, value)
     if image_update.htime is not None:
         image.htime = image_update.htime
     if image_update.desp is not None:
         image.desp = image_update.desp
-    db.commit()
+    try:
+        db.commit()
+    except Exception:
+        db.rollback()
+        if new_hash != old_hash:
+            release_image_blobs_impl(db, [new_hash])  # written before the commit
+        raise
+    if new_hash != old_hash:
+        release_image_blobs_impl(db, [old_hash])
+        invalidate_phash_index()
     return read_from_image(image)
 
 
@@ -76,16 +236,484 @@ def delete_image_impl(db, image_id: int):
     image = db.query(DBImage).filter(DBImage.id == image_id).first()
     if image is None:
         return None
+    res = read_from_image(image)
     db.delete(image)
     db.commit()
-    return read_from_image(image)
+    release_image_blobs_impl(db, [res.hash])
+    invalidate_phash_index()
+    return res
 
 
 def get_images_impl(db, skip: int = 0, limit: int = 0, no_data: bool = False):
+    # data is deferred, so a metadata listing never selects the blobs
     query = db.query(DBImage).order_by(DBImage.id)
+    if not no_data:
+        query = query.options(undefer(DBImage.data))
     if skip > 0:
         query = query.offset(skip)
     if limit > 0:
         query = query.limit(limit)
     images = query.all()
     return [read_from_image(image, no_data) for image in images]
+
+
+def iter_images_impl(db, batch_size: int = 50, no_data: bool = False):
+    """
+    Stream all images in id order, only batch_size rows are held at a time
+    """
+    query = db.query(DBImage).order_by(DBImage.id)
+    if not no_data:
+        query = query.options(undefer(DBImage.data))
+    for image in query.yield_per(batch_size):
+        yield read_from_image(image, no_data)
+
+
+def fill_image_metadata_batch_impl(db, after_id: int = 0, batch_size: int = 50):
+    """
+    Fill width, height, size, format and the perceptual hashes of one batch
+    of legacy rows (size or dhash IS NULL, id > after_id).
+    Returns (last_id, filled), last_id is None when nothing is left.
+    """
+    rows = (
+        db.query(DBImage)
+        .options(undefer(DBImage.data))
+        .filter(
+            DBImage.id > after_id,
+            or_(DBImage.size.is_(None), DBImage.dhash.is_(None)),
+        )
+        .order_by(DBImage.id)
+        .limit(batch_size)
+        .all()
+    )
+    if len(rows) == 0:
+        return None, 0
+    values = [
+        {"id": image.id, **image_metadata_values(image_data(image))}
+        for image in rows
+    ]
+    last_id = rows[-1].id
+    try:
+        db.execute(update(DBImage), values)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    invalidate_phash_index()
+    return last_id, len(rows)
+
+
+def read_image_derivative_impl(db, image_id: int, width: int, format: str = "webp"):
+    """
+    A copy of the image at most `width` wide, generated on the first request
+    and served from the disk cache afterwards, the width is snapped to
+    DERIVATIVE_WIDTHS. The image bytes are only loaded on a cache miss.
+    """
+    row = (
+        db.query(DBImage.id, DBImage.hash, DBImage.htime)
+        .filter(DBImage.id == image_id)
+        .first()
+    )
+    if row is None:
+        return None
+    width = snap_width(width)
+    media_type = DERIVATIVE_FORMATS[format][1]
+    # keyed by content, rows without a hash fall back to id and update time
+    key = ("image", row.hash or f"{row.id}:{row.htime}", width, format)
+    tag = f"{row.hash}-{width}-{format}" if row.hash else None
+    file = g_derivative_cache.open(key)
+    if file is not None:
+        return ImageBlobData(media_type=media_type, file=file, tag=tag)
+
+    image = db.query(DBImage).filter(DBImage.id == image_id).first()
+    data = make_derivative(image_data(image), width, format)
+    g_derivative_cache.put(key, data)
+    logger.info(f"Image {image_id} derivative {width} {format}: {len(data)} bytes")
+    # served from memory, the entry may already be evicted by another put
+    return ImageBlobData(media_type=media_type, data=data, tag=tag)
+
+
+def _tiles_key(row, format: str):
+    # keyed by content, rows without a hash fall back to id and update time
+    return ("tiles", row.hash or f"{row.id}:{row.htime}", TILE_SIZE, format)
+
+
+# pyramids are built by a small thread pool, never on the request path
+_tile_executor = ThreadPoolExecutor(
+    max_workers=max(IMAGE_TILE_WORKERS, 1), thread_name_prefix="tiles"
+)
+_tile_pending = set()  # keys queued or building
+_tile_too_large = set()  # keys whose pyramid does not fit the store
+_tile_state_lock = threading.Lock()
+
+
+def build_image_tiles_impl(db, image_id: int, format: str = "webp"):
+    """
+    Cut the whole pyramid of an image into the tile store, the image is
+    decoded once for all levels. Returns (tiles, bytes), None if the image
+    does not exist. Raises PyramidTooLarge if it does not fit the store.
+    """
+    image = db.query(DBImage).filter(DBImage.id == image_id).first()
+    if image is None:
+        return None
+    key = _tiles_key(image, format)
+    try:
+        count, total = g_tile_store.put(
+            key, iter_tiles(image_data(image), format, TILE_SIZE)
+        )
+    except PyramidTooLarge:
+        with _tile_state_lock:
+            _tile_too_large.add(key)
+        raise
+    logger.info(f"Image {image_id} tiles {format}: {count} tiles, {total} bytes")
+    return count, total
+
+
+def _build_image_tiles_job(image_id: int, format: str, key):
+    # runs in the tile pool with its own session
+    from internal.db import g_db_func
+
+    sessions = g_db_func()
+    try:
+        build_image_tiles_impl(next(sessions), image_id, format)
+    except PyramidTooLarge as e:
+        logger.warning(f"Image {image_id} is too large to tile: {e}")
+    except Exception:
+        logger.exception(f"Failed to build the tiles of image {image_id}")
+    finally:
+        sessions.close()
+        with _tile_state_lock:
+            _tile_pending.discard(key)
+
+
+def _tiles_state(row, format: str):
+    # "ready", "too_large", or "building" after queueing the build once
+    key = _tiles_key(row, format)
+    if g_tile_store.has(key):
+        return "ready"
+    with _tile_state_lock:
+        if key in _tile_too_large:
+            return "too_large"
+        if key in _tile_pending:
+            return "building"
+        _tile_pending.add(key)
+    _tile_executor.submit(_build_image_tiles_job, row.id, format, key)
+    return "building"
+
+
+def _tiles_row(db, image_id: int):
+    return (
+        db.query(DBImage.id, DBImage.hash, DBImage.htime, DBImage.width, DBImage.height)
+        .filter(DBImage.id == image_id)
+        .first()
+    )
+
+
+def read_image_tiles_impl(db, image_id: int, format: str = "webp"):
+    """
+    The pyramid layout of an image for deep-zoom viewers, None if the image
+    does not exist. Asking for it queues the pyramid build, viewers poll
+    until the state is "ready". The size comes from the metadata columns,
+    the header of the bytes is only read for images without it.
+    """
+    row = _tiles_row(db, image_id)
+    if row is None:
+        return None
+    width, height = row.width, row.height
+    if width is None or height is None:
+        image = db.query(DBImage).filter(DBImage.id == image_id).first()
+        width, height, _ = image_info(image_data(image))
+        if width is None:
+            return None
+    return ImageTilesData(
+        id=image_id,
+        width=width,
+        height=height,
+        tile_size=TILE_SIZE,
+        max_zoom=tile_max_zoom(width, height),
+        format=format,
+        state=_tiles_state(row, format),
+    )
+
+
+def read_image_tile_impl(db, image_id: int, z: int, x: int, y: int, format: str = "webp"):
+    """
+    One tile of a built pyramid: (state, blob), state is None if the image
+    does not exist, blob is None unless the state is "ready" and the tile
+    exists. A missing pyramid is queued for building, never built here.
+    """
+    row = _tiles_row(db, image_id)
+    if row is None:
+        return None, None
+    state = _tiles_state(row, format)
+    if state != "ready":
+        return state, None
+    file = g_tile_store.open(_tiles_key(row, format), z, x, y)
+    if file is None:
+        return state, None
+    tag = f"{row.hash}-{TILE_SIZE}-{format}-{z}-{x}-{y}" if row.hash else None
+    return state, ImageBlobData(
+        media_type=DERIVATIVE_FORMATS[format][1], file=file, tag=tag
+    )
+
+
+def read_image_blob_impl(db, image_id: int):
+    """
+    Locate the bytes of an image for serving: the blob file if the image is
+    in the blob store, otherwise the data column (only selected then)
+    """
+    row = (
+        db.query(DBImage.id, DBImage.hash, DBImage.format)
+        .filter(DBImage.id == image_id)
+        .first()
+    )
+    if row is None:
+        return None
+    if row.hash is not None and g_image_store.exists(row.hash):
+        try:
+            file = open(g_image_store.path(row.hash), "rb")
+        except FileNotFoundError:
+            return None  # released meanwhile
+        if row.format:
+            media_type = format_media_type(row.format)
+        else:
+            # moved before fill_image_metadata, sniff the leading bytes
+            media_type = image_media_type(file.read(16))
+            file.seek(0)
+        return ImageBlobData(media_type=media_type, file=file, tag=row.hash)
+    (data,) = db.query(DBImage.data).filter(DBImage.id == image_id).first()
+    if data is None:
+        return None
+    media_type = (
+        format_media_type(row.format) if row.format else image_media_type(data)
+    )
+    return ImageBlobData(media_type=media_type, data=data, tag=row.hash)
+
+
+def move_image_blobs_batch_impl(
+    db, after_id: int = 0, batch_size: int = 50, backend: str = "file"
+):
+    """
+    Move the bytes of one batch of rows with id > after_id out of the table
+    (backend "file"), or hash legacy rows in place (backend "db").
+    Blobs are written before the rows are updated, so a failed batch only
+    leaves unreferenced files behind.
+    Returns (last_id, moved), last_id is None when nothing is left.
+    """
+    query = db.query(DBImage.id, DBImage.data).filter(
+        DBImage.id > after_id, DBImage.data.isnot(None)
+    )
+    if not file_backend_enabled(backend):
+        query = query.filter(DBImage.hash.is_(None))
+    rows = query.order_by(DBImage.id).limit(batch_size).all()
+    if len(rows) == 0:
+        return None, 0
+    values = []
+    for row in rows:
+        row_values = image_blob_values(row.data, backend)
+        if not file_backend_enabled(backend):
+            del row_values["data"]  # unchanged, do not send it back
+        values.append({"id": row.id, **row_values})
+    try:
+        db.execute(update(DBImage), values)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return rows[-1].id, len(rows)
+
+
+def reencode_images_batch_impl(
+    db,
+    after_id: int = 0,
+    batch_size: int = 20,
+    photo_mode: str = None,
+    graphic_mode: str = None,
+    force: bool = False,
+):
+    """
+    Re-encode one batch of images with id > after_id in the storage mode of
+    their class. An image is skipped if it is already in the target format,
+    if it is stored lossy (JPEG or lossy WebP, a second lossy pass only loses
+    quality) unless force is set, or if the result is not smaller.
+    Returns (last_id, reencoded, bytes_before, bytes_after) over the re-encoded
+    images, last_id is None when nothing is left.
+    """
+    modes = {
+        "photo": photo_mode or storage_mode("photo"),
+        "graphic": graphic_mode or storage_mode("graphic"),
+    }
+    rows = (
+        db.query(DBImage)
+        .options(undefer(DBImage.data))
+        .filter(DBImage.id > after_id)
+        .order_by(DBImage.id)
+        .limit(batch_size)
+        .all()
+    )
+    if len(rows) == 0:
+        return None, 0, 0, 0
+    last_id = rows[-1].id
+
+    values = []
+    old_hashes = []
+    before, after = 0, 0
+    for image in rows:
+        data = image_data(image)
+        if data is None:
+            continue
+        with Image.open(BytesIO(data)) as decoded:
+            decoded.load()
+            mode = modes[classify_image(decoded)]
+            if (image.format or (decoded.format or "").lower()) == storage_format(mode):
+                continue
+            if not force and is_lossy_encoding(data):
+                continue
+            encoded, _ = encode_for_storage(decoded, mode)
+        if len(encoded) >= len(data):
+            continue
+        row_values = image_blob_values(encoded)
+        row_values.update(image_metadata_values(encoded))
+        values.append({"id": image.id, **row_values})
+        if image.data is None and image.hash is not None:
+            old_hashes.append(image.hash)
+        before += len(data)
+        after += len(encoded)
+    if len(values) == 0:
+        return last_id, 0, 0, 0
+    try:
+        db.execute(update(DBImage), values)
+        db.commit()
+    except Exception:
+        db.rollback()
+        # the new blobs were written before the commit
+        release_image_blobs_impl(db, [v["hash"] for v in values if v["data"] is None])
+        raise
+    # blobs of the old encodings, unless another row still has the same bytes
+    release_image_blobs_impl(db, old_hashes)
+    invalidate_phash_index()
+    return last_id, len(values), before, after
+
+
+# the in-process dHash index; writes of this process invalidate it, new rows
+# from other processes show in max(id), their updates and deletes within the TTL
+PHASH_INDEX_TTL = float(os.environ.get("PHASH_INDEX_TTL", 300))
+_phash_index = {"version": None, "index": None, "built": 0.0}
+_phash_lock = threading.Lock()
+
+
+def invalidate_phash_index():
+    with _phash_lock:
+        _phash_index["version"] = None
+
+
+def phash_index_impl(db):
+    """
+    The multi-index over the dHash of all images, items are (id, ahash).
+    Checking the version is a max(id) on the primary key, the index is
+    rebuilt when images were added, on a local write, or after the TTL.
+    """
+    version = db.query(func.max(DBImage.id)).scalar()
+    with _phash_lock:
+        if (
+            _phash_index["version"] == version
+            and time.monotonic() - _phash_index["built"] < PHASH_INDEX_TTL
+        ):
+            return _phash_index["index"]
+        index = MultiIndexHash()
+        rows = (
+            db.query(DBImage.id, DBImage.ahash, DBImage.dhash)
+            .filter(DBImage.dhash.isnot(None))
+            .order_by(DBImage.id)
+            .yield_per(10000)
+        )
+        for row in rows:
+            index.add(to_unsigned64(row.dhash), (row.id, to_unsigned64(row.ahash)))
+        _phash_index.update(version=version, index=index, built=time.monotonic())
+        logger.info(f"Built the image hash index over {len(index)} images")
+        return index
+
+
+def _near(index, dh: int, ah: int, distance: int):
+    # dHash candidates from the index, confirmed by the aHash distance
+    return [
+        (d, image_id)
+        for d, (image_id, other_ah) in index.query(dh, distance)
+        if hamming(ah, other_ah) <= distance
+    ]
+
+
+def find_similar_images_impl(db, image_id: int, distance: int = 8, limit: int = 20):
+    """
+    Images whose dHash and aHash are both within distance of the image,
+    closest first, None if the image does not exist or is not hashed
+    """
+    row = (
+        db.query(DBImage.ahash, DBImage.dhash).filter(DBImage.id == image_id).first()
+    )
+    if row is None or row.dhash is None:
+        return None
+    index = phash_index_impl(db)
+    near = [
+        (d, other_id)
+        for d, other_id in _near(
+            index, to_unsigned64(row.dhash), to_unsigned64(row.ahash), distance
+        )
+        if other_id != image_id
+    ][:limit]
+    if len(near) == 0:
+        return []
+    meta = {
+        r.id: r
+        for r in db.query(
+            DBImage.id, DBImage.name, DBImage.width, DBImage.height, DBImage.format
+        )
+        .filter(DBImage.id.in_([other_id for _, other_id in near]))
+        .all()
+    }
+    return [
+        SimilarImageData(
+            id=other_id,
+            distance=d,
+            name=meta[other_id].name,
+            width=meta[other_id].width,
+            height=meta[other_id].height,
+            format=meta[other_id].format,
+        )
+        for d, other_id in near
+        if other_id in meta
+    ]
+
+
+def image_duplicate_clusters_impl(db, distance: int = 4):
+    """
+    Group all hashed images into clusters of near duplicates (union-find over
+    the pairs within distance), returns the clusters with more than one image
+    as sorted id lists, largest first
+    """
+    index = phash_index_impl(db)
+    parent = {}
+
+    def find(x):
+        while parent.get(x, x) != x:
+            parent[x] = parent.get(parent[x], parent[x])
+            x = parent[x]
+        return x
+
+    rows = (
+        db.query(DBImage.id, DBImage.ahash, DBImage.dhash)
+        .filter(DBImage.dhash.isnot(None))
+        .yield_per(10000)
+    )
+    for row in rows:
+        for _, other_id in _near(
+            index, to_unsigned64(row.dhash), to_unsigned64(row.ahash), distance
+        ):
+            a, b = find(row.id), find(other_id)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+
+    clusters = {}
+    for image_id in list(parent):
+        clusters.setdefault(find(image_id), []).append(image_id)
+    res = [sorted(set(ids) | {root}) for root, ids in clusters.items()]
+    return sorted((ids for ids in res if len(ids) > 1), key=len, reverse=True)
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+# @file paragraph.py
+# @brief The Paragraph Segmentation of Content Nodes
+# @author sailing-innocent
+# @date 2025-06-18
+# @version 1.0
+# ---------------------------------
+# A segmented node owns one ParagraphTree row:
+# {"version": 1, "root": node_id, "children": [
+#     {"id": paragraph_node_id, "start": 0, "offset": 120, "children": [
+#         {"id": sentence_node_id, "start": 0, "offset": 30}, ...]}, ...]}
+# start/offset are absolute in the content, like the ContentNode columns.
+
+from sqlalchemy import delete, insert, or_
+
+from internal.data.content import Chapter, ContentNode, ParagraphTree
+from internal.model.content.content import node_text, read_node_descendants_impl
+from internal.model.content.search import chapter_text_query
+from utils.segment import nest_spans, segment_text
+import logging
+
+logger = logging.getLogger(__name__)
+
+TREE_VERSION = 1
+PARAGRAPH_TAG = "paragraph"
+SENTENCE_TAG = "sentence"
+
+
+def tree_node_ids(tree: dict):
+    # all segment node ids of a tree, paragraphs before their sentences
+    for paragraph in tree.get("children", []):
+        yield paragraph["id"]
+        for sentence in paragraph.get("children", []):
+            yield sentence["id"]
+
+
+def segment_nodes_impl(db, roots: list[tuple[int, int, int, str]]):
+    """
+    Segment (node_id, content_id, start, text) roots into paragraph and
+    sentence nodes, all nodes and trees of the batch are inserted with two
+    multi-row INSERT ... RETURNING statements.
+    Only flushed, the caller owns the transaction.
+    Returns the number of created nodes.
+    """
+    segmented = []
+    node_rows = []
+    for node_id, content_id, start, text in roots:
+        if text is None:
+            continue
+        segments = segment_text(text)
+        segmented.append((node_id, start, segments))
+        for p_start, p_offset, sentences in segments:
+            node_rows.append(
+                {
+                    "content_id": content_id,
+                    "raw_tags": "",
+                    "tags": PARAGRAPH_TAG,
+                    "start": start + p_start,
+                    "offset": p_offset,
+                    "root_id": node_id,
+                }
+            )
+            node_rows.extend(
+                {
+                    "content_id": content_id,
+                    "raw_tags": "",
+                    "tags": SENTENCE_TAG,
+                    "start": start + s_start,
+                    "offset": s_offset,
+                    "root_id": node_id,
+                }
+                for s_start, s_offset in sentences
+            )
+    if len(node_rows) == 0:
+        return 0
+
+    ids = iter(
+        db.scalars(
+            insert(ContentNode).returning(ContentNode.id, sort_by_parameter_order=True),
+            node_rows,
+        ).all()
+    )
+
+    # the ids come back in row order, so the trees are rebuilt in the same walk
+    tree_rows = []
+    for node_id, start, segments in segmented:
+        children = []
+        for p_start, p_offset, sentences in segments:
+            children.append(
+                {
+                    "id": next(ids),
+                    "start": start + p_start,
+                    "offset": p_offset,
+                    "children": [
+                        {"id": next(ids), "start": start + s_start, "offset": s_offset}
+                        for s_start, s_offset in sentences
+                    ],
+                }
+            )
+        tree_rows.append(
+            {
+                "root_content_node_id": node_id,
+                "data": {"version": TREE_VERSION, "root": node_id, "children": children},
+            }
+        )
+    db.execute(insert(ParagraphTree), tree_rows)
+    return len(node_rows)
+
+
+def drop_paragraph_trees_impl(db, root_node_ids: list[int]):
+    """
+    Delete the trees of the roots and the segment nodes they own.
+    Only flushed, the caller owns the transaction.
+    """
+    trees = (
+        db.query(ParagraphTree.data)
+        .filter(ParagraphTree.root_content_node_id.in_(root_node_ids))
+        .all()
+    )
+    node_ids = [nid for (data,) in trees if data for nid in tree_node_ids(data)]
+    db.execute(
+        delete(ParagraphTree).where(
+            ParagraphTree.root_content_node_id.in_(root_node_ids)
+        )
+    )
+    db.execute(
+        delete(ContentNode).where(
+            or_(
+                ContentNode.root_id.in_(root_node_ids),
+                ContentNode.id.in_(node_ids),
+            )
+        )
+    )
+
+
+def _unsegmented(query):
+    # chapters whose content node has no paragraph tree yet
+    return query.outerjoin(
+        ParagraphTree, ParagraphTree.root_content_node_id == Chapter.content_node_id
+    ).filter(ParagraphTree.id.is_(None))
+
+
+def _segment_rows(db, rows):
+    return segment_nodes_impl(
+        db,
+        [
+            (
+                row.content_node_id,
+                row.content_id,
+                row.start or 0,
+                node_text(row.data, row.packed, row.start, row.offset),
+            )
+            for row in rows
+        ],
+    )
+
+
+def _chapter_segment_query(db):
+    return chapter_text_query(db).add_columns(
+        Chapter.content_node_id, ContentNode.content_id
+    )
+
+
+def segment_chapter_impl(db, chapter_id: int, force: bool = False):
+    """
+    Segment one chapter, an existing tree is kept unless force is set.
+    Returns the number of created nodes, None if the chapter does not exist.
+    """
+    row = _chapter_segment_query(db).filter(Chapter.id == chapter_id).first()
+    if row is None:
+        return None
+    try:
+        if force:
+            drop_paragraph_trees_impl(db, [row.content_node_id])
+        elif (
+            db.query(ParagraphTree.id)
+            .filter(ParagraphTree.root_content_node_id == row.content_node_id)
+            .first()
+            is not None
+        ):
+            return 0
+        created = _segment_rows(db, [row])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return created
+
+
+def segment_chapters_batch_impl(
+    db, after_id: int = 0, batch_size: int = 50, book_id: int = None
+):
+    """
+    Segment one batch of unsegmented chapters with id > after_id, so a whole
+    library is processed with one batch of texts in memory at a time.
+    Returns (last_id, chapters, nodes), last_id is None when nothing is left.
+    """
+    query = _unsegmented(_chapter_segment_query(db)).filter(Chapter.id > after_id)
+    if book_id is not None:
+        query = query.filter(Chapter.book_id == book_id)
+    rows = query.order_by(Chapter.id).limit(batch_size).all()
+    if len(rows) == 0:
+        return None, 0, 0
+    try:
+        created = _segment_rows(db, rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return rows[-1].id, len(rows), created
+
+
+def read_paragraph_tree_impl(db, root_node_id: int):
+    tree = (
+        db.query(ParagraphTree)
+        .filter(ParagraphTree.root_content_node_id == root_node_id)
+        .first()
+    )
+    if tree is None:
+        return None
+    return tree.data
+
+
+def _subtree_dict(node, children):
+    return {
+        "id": node.id,
+        "tags": node.tags,
+        "start": node.start,
+        "offset": node.offset,
+        "children": [_subtree_dict(n, c) for n, c in children],
+    }
+
+
+def read_node_subtree_impl(db, node_id: int):
+    """
+    Load a node and the segments it owns, the hierarchy is
+    rebuilt from range containment among them
+    """
+    nodes = read_node_descendants_impl(db, node_id, include_self=True)
+    if len(nodes) == 0 or nodes[0].id != node_id:
+        return None
+    (root, children), *_ = nest_spans(nodes)
+    return _subtree_dict(root, children)
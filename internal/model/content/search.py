@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# @file search.py
+# @brief The Chapter Full-Text Search
+# @author sailing-innocent
+# @date 2025-06-15
+# @version 1.0
+# ---------------------------------
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from internal.data.content import (
+    Chapter,
+    ChapterGram,
+    Content,
+    ContentNode,
+    SearchHitData,
+)
+from internal.model.content.content import node_data_column, node_text
+from utils.ngram import text_grams, query_grams
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+SNIPPET_RADIUS = 40
+MAX_OFFSETS = 50
+
+
+def index_chapter_grams_impl(db, rows: list[tuple[int, int, str]]):
+    """
+    Upsert the gram index of (chapter_id, book_id, text) rows.
+    Only flushed, the caller owns the transaction.
+    """
+    params = [
+        {"chapter_id": chapter_id, "book_id": book_id, "grams": text_grams(text)}
+        for chapter_id, book_id, text in rows
+        if text is not None
+    ]
+    if len(params) == 0:
+        return
+    # executemany, the driver sends the rows in pages, not as one huge VALUES
+    stmt = pg_insert(ChapterGram)
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[ChapterGram.chapter_id],
+            set_={"book_id": stmt.excluded.book_id, "grams": stmt.excluded.grams},
+        ),
+        params,
+    )
+
+
+def chapter_text_query(db):
+    return (
+        db.query(
+            Chapter.id,
+            Chapter.book_id,
+            Chapter.order,
+            Chapter.title,
+            ContentNode.start,
+            ContentNode.offset,
+            func.coalesce(node_data_column(), Content.data).label("data"),
+            Content.packed,
+        )
+        .join(ContentNode, ContentNode.id == Chapter.content_node_id)
+        .join(Content, Content.id == ContentNode.content_id)
+    )
+
+
+def index_chapters_batch_impl(db, after_id: int = 0, batch_size: int = 200):
+    """
+    (Re)build the gram index of one batch of chapters with id > after_id.
+    Returns (last_id, indexed), last_id is None when nothing is left.
+    """
+    rows = (
+        chapter_text_query(db)
+        .filter(Chapter.id > after_id)
+        .order_by(Chapter.id)
+        .limit(batch_size)
+        .all()
+    )
+    if len(rows) == 0:
+        return None, 0
+    try:
+        index_chapter_grams_impl(
+            db,
+            [
+                (
+                    row.id,
+                    row.book_id,
+                    node_text(row.data, row.packed, row.start, row.offset),
+                )
+                for row in rows
+            ],
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return rows[-1].id, len(rows)
+
+
+def _hit_from_text(row, text: str, patterns: list[re.Pattern]):
+    offsets = []
+    for pattern in patterns:
+        found = [m.start() for m in pattern.finditer(text)]
+        if len(found) == 0:
+            return None  # every query part is required
+        offsets.extend(found)
+    offsets = sorted(offsets)[:MAX_OFFSETS]
+    snippet_start = max(0, offsets[0] - SNIPPET_RADIUS)
+    return SearchHitData(
+        chapter_id=row.id,
+        book_id=row.book_id,
+        order=row.order,
+        title=row.title,
+        offsets=offsets,
+        snippet=text[snippet_start : offsets[0] + SNIPPET_RADIUS],
+        snippet_start=snippet_start,
+    )
+
+
+def search_chapters_impl(db, q: str, book_id: int = None, limit: int = 20):
+    """
+    target SQL:
+    SELECT chapter_id FROM chapter_gram WHERE grams @> ARRAY['北京', '京大']
+    ORDER BY chapter_id LIMIT :limit;
+    the GIN index narrows the chapters down, the candidates are then verified
+    against their text, which also yields the hit offsets
+    """
+    grams = query_grams(q)
+    if len(grams) == 0:
+        return []
+    patterns = [
+        re.compile(re.escape(part), re.IGNORECASE) for part in q.split() if part
+    ]
+
+    hits = []
+    after_id = 0
+    # a few candidates may be false positives, so fetch a bit more than needed
+    batch_size = max(limit * 2, 20)
+    while len(hits) < limit:
+        cq = db.query(ChapterGram.chapter_id).filter(
+            ChapterGram.grams.contains(grams), ChapterGram.chapter_id > after_id
+        )
+        if book_id is not None:
+            cq = cq.filter(ChapterGram.book_id == book_id)
+        candidates = [
+            cid
+            for (cid,) in cq.order_by(ChapterGram.chapter_id).limit(batch_size).all()
+        ]
+        if len(candidates) == 0:
+            break
+        after_id = candidates[-1]
+
+        rows = (
+            chapter_text_query(db)
+            .filter(Chapter.id.in_(candidates))
+            .order_by(Chapter.id)
+            .all()
+        )
+        for row in rows:
+            text = node_text(row.data, row.packed, row.start, row.offset)
+            if text is None:
+                continue
+            hit = _hit_from_text(row, text, patterns)
+            if hit is not None:
+                hits.append(hit)
+        if len(candidates) < batch_size:
+            break
+
+    logger.info(f"Search {q} in book {book_id}: {len(hits[:limit])} hits")
+    return hits[:limit]
@@ -6,12 +6,46 @@
 # @version 1.0
 # ---------------------------------
 
-from internal.data.content import VaultNote, VaultNoteData
+from sqlalchemy import delete, func, insert, update
+from internal.data.content import VaultNote, VaultNoteData, VaultSyncSkip
+from utils.codec import pack_if_large, unpack_text
+from dataclasses import asdict
+import datetime
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def set_note_content(note_orm: VaultNote, content: str):
+    # large notes are stored packed, see utils.codec
+    note_orm.content, note_orm.packed = pack_if_large(content)
+
+
+def read_note_content(note_orm: VaultNote):
+    if note_orm.content is None and note_orm.packed is not None:
+        return unpack_text(note_orm.packed)
+    return note_orm.content
+
+
+def data_from_vault_note(note_orm: VaultNote):
+    # the content is always text, packed notes are unpacked here
+    return VaultNoteData(
+        id=note_orm.id,
+        vault_name=note_orm.vault_name,
+        note_path=note_orm.note_path,
+        note_id=note_orm.note_id,
+        title=note_orm.title,
+        desc=note_orm.desc,
+        ctime=note_orm.ctime,
+        mtime=note_orm.mtime,
+        tags=note_orm.tags,
+        content=read_note_content(note_orm),
+        file_size=note_orm.file_size,
+        file_mtime=note_orm.file_mtime,
+        file_hash=note_orm.file_hash,
+    )
+
+
 def create_vault_note_impl(db, note: VaultNoteData):
     # no id required
     note_orm = VaultNote(
@@ -23,8 +57,8 @@ def create_vault_note_impl(db, note: VaultNoteData):
         ctime=note.ctime,
         mtime=note.mtime,
         tags=note.tags,
-        content=note.content,
     )
+    set_note_content(note_orm, note.content)
     db.add(note_orm)
     db.commit()
     return note_orm.id
@@ -35,7 +69,7 @@ def get_vault_note_impl(db, id: int):
     if not note:
         logger.warning(f"Vault note with id {id} not found.")
         return None
-    return note
+    return data_from_vault_note(note)
 
 
 def update_vault_note_impl(db, id: int, note: VaultNoteData):
@@ -43,10 +77,15 @@ def update_vault_note_impl(db, id: int, note: VaultNoteData):
     if not note_orm:
         logger.warning(f"Vault note with id {id} not found.")
         return None
-    for key, value in note.dict().items():
-        setattr(note_orm, key, value)
+    for key, value in asdict(note).items():
+        if key == "id":
+            continue
+        if key == "content":
+            set_note_content(note_orm, value)
+        else:
+            setattr(note_orm, key, value)
     db.commit()
-    return note_orm
+    return data_from_vault_note(note_orm)
 
 
 def update_vault_note_by_note_id(
@@ -68,9 +107,9 @@ def update_vault_note_by_note_id(
     note_orm.ctime = note.ctime
     note_orm.mtime = note.mtime
     note_orm.tags = note.tags
-    note_orm.content = note.content
+    set_note_content(note_orm, note.content)
     db.commit()
-    return note_orm
+    return data_from_vault_note(note_orm)
 
 
 def delete_vault_note_impl(db, id: int):
@@ -78,9 +117,10 @@ def delete_vault_note_impl(db, id: int):
     if not note:
         logger.warning(f"Vault note with id {id} not found.")
         return None
+    data = data_from_vault_note(note)
     db.delete(note)
     db.commit()
-    return note
+    return data
 
 
 def delete_vault_note_by_note_id_impl(db, note_id: str):
@@ -88,6 +128,210 @@ def delete_vault_note_by_note_id_impl(db, note_id: str):
     if not note:
         logger.warning(f"Vault note with note_id {note_id} not found.")
         return None
+    data = data_from_vault_note(note)
     db.delete(note)
     db.commit()
-    return note
+    return data
+
+
+def compress_vault_note_batch_impl(
+    db, after_id: int = 0, batch_size: int = 200, threshold: int = 4096
+):
+    """
+    Pack one batch of raw notes, same contract as compress_content_batch_impl.
+    """
+    rows = (
+        db.query(VaultNote.id, VaultNote.content)
+        .filter(
+            VaultNote.packed.is_(None),
+            VaultNote.content.is_not(None),
+            func.length(VaultNote.content) >= threshold,
+            VaultNote.id > after_id,
+        )
+        .order_by(VaultNote.id)
+        .limit(batch_size)
+        .all()
+    )
+    if len(rows) == 0:
+        return None, 0, 0
+
+    updates = []
+    saved = 0
+    for row in rows:
+        content, packed = pack_if_large(row.content, threshold)
+        if packed is None:
+            continue
+        updates.append({"id": row.id, "content": None, "packed": packed})
+        saved += len(row.content.encode("utf-8")) - len(packed)
+    try:
+        if len(updates) > 0:
+            db.execute(update(VaultNote), updates)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return rows[-1].id, len(updates), saved
+
+
+def _note_time(value):
+    # parsed notes carry epoch seconds, the columns are TIMESTAMP
+    if isinstance(value, (int, float)):
+        return datetime.datetime.fromtimestamp(value)
+    return value
+
+
+def _note_values(note: VaultNoteData):
+    content, packed = pack_if_large(note.content)
+    return {
+        "vault_name": note.vault_name,
+        "note_path": note.note_path,
+        "note_id": note.note_id,
+        "title": note.title,
+        "desc": note.desc,
+        "ctime": _note_time(note.ctime),
+        "mtime": _note_time(note.mtime),
+        "tags": note.tags,
+        "content": content,
+        "packed": packed,
+        "file_size": note.file_size,
+        "file_mtime": note.file_mtime,
+        "file_hash": note.file_hash,
+    }
+
+
+def read_vault_sync_state_impl(db, vault_name: str):
+    """
+    note_path -> (id, note_id, file_size, file_mtime, file_hash) of the
+    stored notes of a vault, without their content
+    """
+    rows = (
+        db.query(
+            VaultNote.id,
+            VaultNote.note_path,
+            VaultNote.note_id,
+            VaultNote.file_size,
+            VaultNote.file_mtime,
+            VaultNote.file_hash,
+        )
+        .filter(VaultNote.vault_name == vault_name)
+        .all()
+    )
+    return {row.note_path: row for row in rows}
+
+
+def upsert_vault_notes_batch_impl(db, notes: list[VaultNoteData]):
+    """
+    Update the notes whose note_id is stored and insert the others, with one
+    lookup, one bulk UPDATE and one multi-row INSERT in one transaction.
+    A repeated note_id keeps the last note. Returns the ids of the rows.
+    """
+    by_note_id = {note.note_id: note for note in notes}
+    if len(by_note_id) == 0:
+        return []
+    existing = dict(
+        db.query(VaultNote.note_id, VaultNote.id)
+        .filter(VaultNote.note_id.in_(list(by_note_id)))
+        .all()
+    )
+    updates = [
+        {"id": existing[note_id], **_note_values(note)}
+        for note_id, note in by_note_id.items()
+        if note_id in existing
+    ]
+    inserts = [
+        _note_values(note)
+        for note_id, note in by_note_id.items()
+        if note_id not in existing
+    ]
+    try:
+        ids = [row["id"] for row in updates]
+        if len(updates) > 0:
+            db.execute(update(VaultNote), updates)
+        if len(inserts) > 0:
+            ids.extend(
+                db.scalars(
+                    insert(VaultNote).returning(
+                        VaultNote.id, sort_by_parameter_order=True
+                    ),
+                    inserts,
+                ).all()
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return ids
+
+
+def touch_vault_notes_impl(db, stats: list[dict]):
+    """
+    Record the new size and mtime of notes whose bytes did not change,
+    stats are {"id", "file_size", "file_mtime"}
+    """
+    if len(stats) == 0:
+        return
+    try:
+        db.execute(update(VaultNote), stats)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+def delete_vault_notes_impl(db, ids: list[int]):
+    if len(ids) == 0:
+        return 0
+    try:
+        res = db.execute(delete(VaultNote).where(VaultNote.id.in_(ids)))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return res.rowcount
+
+
+def read_vault_skips_impl(db, vault_name: str):
+    """
+    note_path -> (note_id, file_size, file_mtime) of the files of a vault
+    that failed to parse
+    """
+    rows = (
+        db.query(
+            VaultSyncSkip.note_path,
+            VaultSyncSkip.note_id,
+            VaultSyncSkip.file_size,
+            VaultSyncSkip.file_mtime,
+        )
+        .filter(VaultSyncSkip.vault_name == vault_name)
+        .all()
+    )
+    return {row.note_path: row for row in rows}
+
+
+def update_vault_skips_impl(db, vault_name: str, cleared: list[str], failed: list[dict]):
+    """
+    Drop the failure markers of cleared paths and record the new failures,
+    failed are {"note_path", "note_id", "file_size", "file_mtime", "error"}
+    """
+    paths = list(set(cleared) | {row["note_path"] for row in failed})
+    if len(paths) == 0:
+        return
+    try:
+        db.execute(
+            delete(VaultSyncSkip).where(
+                VaultSyncSkip.vault_name == vault_name,
+                VaultSyncSkip.note_path.in_(paths),
+            )
+        )
+        if len(failed) > 0:
+            db.execute(
+                insert(VaultSyncSkip),
+                [
+                    {**row, "vault_name": vault_name, "error": row["error"][:255]}
+                    for row in failed
+                ],
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+# @file series.py
+# @brief The Cross-Domain Daily Series
+# @author sailing-innocent
+# @date 2025-06-10
+# @version 1.0
+# ---------------------------------
+
+from sqlalchemy import Float, Numeric, case, cast, func, literal_column, or_, select
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from internal.data.health import Weight
+from internal.data.finance import Transaction
+import logging
+
+logger = logging.getLogger(__name__)
+
+ONE_DAY = timedelta(days=1)
+
+
+@dataclass
+class DailySeriesData:
+    """
+    Per-day aligned series, every list has the same length as `days`
+    """
+
+    days: list[float] = field(default_factory=list)  # day start timestamps
+    weights: dict[str, list[float]] = field(default_factory=dict)  # None if absent
+    transactions: dict[str, list[float]] = field(default_factory=dict)  # 0 if absent
+
+
+def _day_start(ts: float) -> datetime:
+    return datetime.fromtimestamp(ts).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _weight_day_query(tag: str, start: datetime, end: datetime, name: str):
+    day = func.date_trunc("day", Weight.htime).label("day")
+    return (
+        select(day, func.avg(cast(Weight.value, Float)).label("value"))
+        # sampled records are tagged as "daily,YYYY-MM-DD"
+        .where(or_(Weight.tag == tag, Weight.tag.like(f"{tag},%")))
+        .where(Weight.htime >= start, Weight.htime < end)
+        .group_by(day)
+        .subquery(name)
+    )
+
+
+def _transaction_day_query(tag: str, start: datetime, end: datetime, name: str):
+    day = func.date_trunc("day", Transaction.htime).label("day")
+    # same sign convention as transactions_money_iter
+    signed_value = case(
+        (Transaction.from_acc_id.is_not(None), cast(Transaction.value, Numeric)),
+        else_=-cast(Transaction.value, Numeric),
+    )
+    return (
+        select(day, func.sum(signed_value).label("value"))
+        .where(Transaction.state != 0, Transaction.tags.like(f"%{tag}%"))
+        .where(Transaction.htime >= start, Transaction.htime < end)
+        .group_by(day)
+        .subquery(name)
+    )
+
+
+def read_daily_series_impl(
+    db,
+    start_time: float,  # timestamp in seconds
+    end_time: float,  # timestamp in seconds, the day containing it is included
+    weight_tags: list[str] = [],
+    transaction_tags: list[str] = [],
+) -> DailySeriesData:
+    """
+    target SQL:
+    SELECT days.day, w0.value, coalesce(t0.value, 0) FROM
+    generate_series(:start, :end, interval '1 day') AS days(day)
+    LEFT OUTER JOIN (SELECT date_trunc('day', htime) AS day, avg(value::float) ... GROUP BY 1) AS w0 ON w0.day = days.day
+    LEFT OUTER JOIN (SELECT date_trunc('day', htime) AS day, sum(+-value::numeric) ... GROUP BY 1) AS t0 ON t0.day = days.day
+    ORDER BY days.day;
+    """
+    start = _day_start(start_time)
+    last = _day_start(end_time)
+    if last < start:
+        return DailySeriesData()
+    end = last + ONE_DAY
+
+    days = select(
+        func.generate_series(start, last, literal_column("interval '1 day'")).label(
+            "day"
+        )
+    ).subquery("days")
+
+    columns = [days.c.day]
+    joins = []
+    for i, tag in enumerate(weight_tags):
+        sq = _weight_day_query(tag, start, end, f"w{i}")
+        columns.append(sq.c.value)
+        joins.append(sq)
+    for i, tag in enumerate(transaction_tags):
+        sq = _transaction_day_query(tag, start, end, f"t{i}")
+        columns.append(func.coalesce(sq.c.value, 0))
+        joins.append(sq)
+
+    stmt = select(*columns).select_from(days)
+    for sq in joins:
+        stmt = stmt.outerjoin(sq, sq.c.day == days.c.day)
+    rows = db.execute(stmt.order_by(days.c.day)).all()
+
+    n_weight = len(weight_tags)
+    res = DailySeriesData(
+        days=[row[0].timestamp() for row in rows],
+        weights={tag: [] for tag in weight_tags},
+        transactions={tag: [] for tag in transaction_tags},
+    )
+    for row in rows:
+        for i, tag in enumerate(weight_tags):
+            value = row[1 + i]
+            res.weights[tag].append(float(value) if value is not None else None)
+        for i, tag in enumerate(transaction_tags):
+            res.transactions[tag].append(float(row[1 + n_weight + i]))
+
+    logger.info(
+        f"Read daily series of {len(rows)} days for weights {weight_tags} and transactions {transaction_tags}"
+    )
+    return res
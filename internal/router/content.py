@@ -9,7 +9,14 @@
 
 from litestar import Router
 from litestar.di import Provide
-from internal.controller.content import ContentController, ChapterController
+from internal.controller.content import (
+    ContentController,
+    ContentNodeController,
+    ChapterController,
+    BookController,
+    ImageController,
+    SearchController,
+)
 from internal.db import get_db_dependency
 
 router = Router(
@@ -17,6 +24,10 @@ router = Router(
     dependencies={"router_dependency": Provide(get_db_dependency)},
     route_handlers=[
         ContentController,
+        ContentNodeController,
         ChapterController,
+        BookController,
+        ImageController,
+        SearchController,
     ],
 )
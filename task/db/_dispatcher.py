@@ -7,12 +7,34 @@
 # ---------------------------------
 
 from task.db.basic import check_db_conn
-from task.db.content_image import create_image, read_image, read_images
-from task.db.content import split_paragraph, read_book_chapter
+from task.db.content_image import (
+    create_image,
+    import_images,
+    read_image,
+    read_images,
+    move_image_blobs,
+    fill_image_metadata,
+    reencode_images,
+    image_duplicates,
+    build_image_tiles,
+)
+from task.db.content import (
+    split_paragraph,
+    split_paragraphs,
+    read_book_chapter,
+    import_book,
+    import_books,
+    bench_book_ingest,
+    dedupe_contents,
+    compress_contents,
+    bench_content_codec,
+    index_chapters,
+    search_chapters,
+)
 from task.db.service_account import create_service_account_from_csv
 from task.db.world import story_conclude
 from task.db.weight import read_weight, sample_weight, analyze_weight
-from task.db.vault import update_notes
+from task.db.vault import update_notes, compress_vault_notes, bench_vault_parse
 from task.db.money import fix_account_balance, read_transaction, analyze_transaction
 from task.db.life import analyze_snack_weight_rel
 
@@ -24,16 +46,33 @@ class DBTaskDispatcher:
         self.tasks = {
             "check_db_conn": check_db_conn,
             "create_image": create_image,
+            "import_images": import_images,
             "read_image": read_image,
             "read_images": read_images,
+            "move_image_blobs": move_image_blobs,
+            "fill_image_metadata": fill_image_metadata,
+            "reencode_images": reencode_images,
+            "image_duplicates": image_duplicates,
+            "build_image_tiles": build_image_tiles,
             "create_service_account_from_csv": create_service_account_from_csv,
             "story_conclude": story_conclude,
             "split_paragraph": split_paragraph,
+            "split_paragraphs": split_paragraphs,
             "read_book_chapter": read_book_chapter,
+            "import_book": import_book,
+            "import_books": import_books,
+            "bench_book_ingest": bench_book_ingest,
+            "dedupe_contents": dedupe_contents,
+            "compress_contents": compress_contents,
+            "bench_content_codec": bench_content_codec,
+            "index_chapters": index_chapters,
+            "search_chapters": search_chapters,
             "read_weight": read_weight,
             "sample_weight": sample_weight,
             "analyze_weight": analyze_weight,
             "update_notes": update_notes,
+            "compress_vault_notes": compress_vault_notes,
+            "bench_vault_parse": bench_vault_parse,
             "fix_account_balance": fix_account_balance,
             "read_transaction": read_transaction,
             "analyze_transaction": analyze_transaction,
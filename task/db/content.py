@@ -6,9 +6,30 @@
 # @version 1.0
 # ---------------------------------
 
-from internal.model.content.book import create_book_from_parser
+from internal.model.content.book import import_book_impl
 from internal.model.content.chapter import read_chapter_impl, read_book_chapter_impl
+from internal.model.content.content import (
+    dedupe_content_batch_impl,
+    compress_content_batch_impl,
+    content_text,
+    read_content_data_by_node_impl,
+)
+from internal.model.content.search import index_chapters_batch_impl, search_chapters_impl
+from internal.model.content.paragraph import (
+    segment_chapter_impl,
+    segment_chapters_batch_impl,
+    read_paragraph_tree_impl,
+)
+from internal.data.content import Content, ContentNode
+from utils.codec import CODECS, pack_text, unpack_text
+import time
+from internal.data.content import BookData
 from utils.book_parser import BPBook, BPChapter, BookParser
+from utils.text_source import MappedTextFile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tqdm import tqdm
+import multiprocessing
+import os
 
 import logging
 
@@ -19,6 +40,214 @@ def read_book(db_func, book_path: str) -> str:
     return "Done"
 
 
+def import_book(
+    db_func, book_path: str, title: str, author: str = "", encoding: str = None
+) -> str:
+    db = next(db_func())
+    parser = BookParser(title, author)
+    with MappedTextFile(book_path, encoding) as f:
+        # chapters are streamed from the mapped file into the bulk import
+        logger.info(f"Reading {book_path} ({f.size} bytes) as {f.encoding}")
+        book_id = import_book_impl(
+            db, BookData(title=title, author=author), parser.iter_parse(f)
+        )
+    logger.info(f"Imported {book_path} as book {book_id}")
+    return "Done"
+
+
+def bench_book_ingest(db_func, book_path: str, encoding: str = None) -> str:
+    """
+    Read and parse a book without touching the database, reports MB/s of the
+    mapped reader against reading the whole file into lines
+    """
+    t0 = time.perf_counter()
+    with MappedTextFile(book_path, encoding) as f:
+        size, encoding = f.size, f.encoding
+        chapters = sum(1 for _ in BookParser("", "").iter_parse(f))
+    mapped = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with open(book_path, "r", encoding=encoding, errors="replace") as f:
+        lines = f.readlines()
+    BookParser("", "").parse(lines)
+    del lines
+    whole = time.perf_counter() - t0
+
+    mb = size / (1 << 20)
+    logger.info(f"{book_path}: {mb:.1f} MB, {encoding}, {chapters} chapters")
+    logger.info(f"mapped {mb / mapped:.1f} MB/s, readlines {mb / whole:.1f} MB/s")
+    return "Done"
+
+
+def _import_book_worker(book_path: str):
+    # runs in a spawned process, which owns its own engine and session
+    from internal.db import g_db_func
+
+    title = os.path.splitext(os.path.basename(book_path))[0]
+    parser = BookParser(title, "")
+    db = next(g_db_func())
+    try:
+        with MappedTextFile(book_path) as f:
+            return import_book_impl(
+                db,
+                BookData(title=title, author=""),
+                parser.iter_parse(f),
+                progress=lambda done, total: None,
+            )
+    finally:
+        db.close()
+
+
+def import_books(db_func, book_dir: str, workers: int = 0) -> str:
+    """
+    Parse and import every .txt book under book_dir in a process pool,
+    the file name is used as the book title.
+    """
+    workers = int(workers) if int(workers) > 0 else os.cpu_count()
+    book_paths = sorted(
+        os.path.join(book_dir, f)
+        for f in os.listdir(book_dir)
+        if f.lower().endswith(".txt")
+    )
+    logger.info(f"Importing {len(book_paths)} books with {workers} workers")
+
+    failed = []
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        futures = {pool.submit(_import_book_worker, p): p for p in book_paths}
+        for future in tqdm(as_completed(futures), total=len(futures), unit="book"):
+            book_path = futures[future]
+            try:
+                book_id = future.result()
+                logger.info(f"Imported {book_path} as book {book_id}")
+            except Exception as e:
+                logger.error(f"Failed to import {book_path}: {e}")
+                failed.append(book_path)
+
+    return f"Done {len(book_paths) - len(failed)}/{len(book_paths)}"
+
+
+def dedupe_contents(db_func, batch_size: int = 500) -> str:
+    """
+    Hash the legacy content rows batch by batch and merge the duplicates
+    """
+    db = next(db_func())
+    batch_size = int(batch_size)
+    last_id = 0
+    total_hashed, total_merged = 0, 0
+    while True:
+        last_id, hashed, merged = dedupe_content_batch_impl(db, last_id, batch_size)
+        if last_id is None:
+            break
+        total_hashed += hashed
+        total_merged += merged
+        logger.info(
+            f"Deduped contents up to id {last_id}: {total_hashed} hashed, {total_merged} merged"
+        )
+    return f"Done {total_hashed} hashed, {total_merged} merged"
+
+
+def compress_contents(db_func, threshold: int = 4096, batch_size: int = 200) -> str:
+    """
+    Pack the existing raw content rows of at least `threshold` characters
+    """
+    db = next(db_func())
+    threshold = int(threshold)
+    batch_size = int(batch_size)
+    last_id = 0
+    total_packed, total_saved = 0, 0
+    while True:
+        last_id, packed, saved = compress_content_batch_impl(
+            db, last_id, batch_size, threshold
+        )
+        if last_id is None:
+            break
+        total_packed += packed
+        total_saved += saved
+        logger.info(
+            f"Compressed contents up to id {last_id}: {total_packed} rows, {total_saved / 1024 / 1024:.2f} MB saved"
+        )
+    return f"Done {total_packed} rows, {total_saved} bytes saved"
+
+
+def bench_content_codec(db_func, sample: int = 20) -> str:
+    """
+    Compression ratio vs read latency of every codec on the largest contents,
+    plus the current node read latency from the database
+    """
+    db = next(db_func())
+    rows = (
+        db.query(Content.id, Content.data, Content.packed)
+        .order_by(Content.size.desc())
+        .limit(int(sample))
+        .all()
+    )
+    texts = [content_text(row.data, row.packed) or "" for row in rows]
+    raw_bytes = sum(len(t.encode("utf-8")) for t in texts)
+    if raw_bytes == 0:
+        return "No content to benchmark"
+    logger.info(f"Benchmark on {len(texts)} contents, {raw_bytes / 1024 / 1024:.2f} MB")
+
+    for codec in CODECS:
+        t0 = time.perf_counter()
+        packed = [pack_text(t, codec) for t in texts]
+        t1 = time.perf_counter()
+        for p in packed:
+            unpack_text(p)
+        t2 = time.perf_counter()
+        ratio = sum(len(p) for p in packed) / raw_bytes
+        logger.info(
+            f"{codec:>5}: ratio {ratio:.3f}, "
+            f"compress {raw_bytes / (t1 - t0) / 1024 / 1024:.1f} MB/s, "
+            f"decompress {raw_bytes / (t2 - t1) / 1024 / 1024:.1f} MB/s, "
+            f"read {(t2 - t1) * 1000 / len(texts):.2f} ms/row"
+        )
+
+    node_ids = [
+        node_id
+        for (node_id,) in db.query(ContentNode.id)
+        .filter(ContentNode.content_id.in_([row.id for row in rows]))
+        .all()
+    ]
+    if len(node_ids) > 0:
+        t0 = time.perf_counter()
+        for node_id in node_ids:
+            read_content_data_by_node_impl(db, node_id)
+        t1 = time.perf_counter()
+        logger.info(
+            f"db node read: {(t1 - t0) * 1000 / len(node_ids):.2f} ms/node over {len(node_ids)} nodes"
+        )
+    return "Done"
+
+
+def index_chapters(db_func, batch_size: int = 200) -> str:
+    """
+    Build the search index of the chapters imported before it existed
+    """
+    db = next(db_func())
+    batch_size = int(batch_size)
+    last_id = 0
+    total = 0
+    while True:
+        last_id, indexed = index_chapters_batch_impl(db, last_id, batch_size)
+        if last_id is None:
+            break
+        total += indexed
+        logger.info(f"Indexed chapters up to id {last_id}: {total}")
+    return f"Done {total} chapters"
+
+
+def search_chapters(db_func, q: str, book_id: int = None) -> str:
+    db = next(db_func())
+    book_id = int(book_id) if book_id is not None else None
+    t0 = time.perf_counter()
+    hits = search_chapters_impl(db, q, book_id)
+    logger.info(f"{len(hits)} hits in {(time.perf_counter() - t0) * 1000:.1f} ms")
+    for hit in hits:
+        logger.info(f"{hit.book_id}/{hit.order} {hit.title} {hit.offsets[:5]}: {hit.snippet}")
+    return "Done"
+
+
 def read_book_chapter(db_func, book_id: int, chapter_order: int) -> str:
     db = next(db_func())
     book_id = int(book_id)
@@ -29,10 +258,42 @@ def read_book_chapter(db_func, book_id: int, chapter_order: int) -> str:
     return "Done"
 
 
-def split_paragraph(db_func, chapter_id: str) -> str:
+def split_paragraph(db_func, chapter_id: str, force: bool = False) -> str:
     db = next(db_func())
     chapter_id = int(chapter_id)
-    chapter = read_chapter_impl(db, chapter_id)
-    logger.info(chapter)
+    force = str(force).lower() == "true"
+    created = segment_chapter_impl(db, chapter_id, force)
+    if created is None:
+        return f"Chapter {chapter_id} not found"
+    tree = read_paragraph_tree_impl(db, read_chapter_impl(db, chapter_id).content_node_id)
+    paragraphs = tree["children"] if tree else []
+    logger.info(
+        f"Chapter {chapter_id}: {len(paragraphs)} paragraphs, "
+        f"{sum(len(p['children']) for p in paragraphs)} sentences"
+    )
+    return f"Done {created} nodes"
 
-    return "Done"
+
+def split_paragraphs(db_func, book_id: int = None, batch_size: int = 50) -> str:
+    """
+    Segment every unsegmented chapter of a book, or of the whole library
+    """
+    db = next(db_func())
+    book_id = int(book_id) if book_id is not None else None
+    batch_size = int(batch_size)
+    last_id = 0
+    chapters = 0
+    nodes = 0
+    t0 = time.perf_counter()
+    while True:
+        last_id, segmented, created = segment_chapters_batch_impl(
+            db, last_id, batch_size, book_id
+        )
+        if last_id is None:
+            break
+        chapters += segmented
+        nodes += created
+        logger.info(f"Segmented chapters up to id {last_id}: {chapters}, {nodes} nodes")
+    dt = time.perf_counter() - t0
+    logger.info(f"{chapters} chapters in {dt:.1f} s")
+    return f"Done {chapters} chapters, {nodes} nodes"
@@ -6,15 +6,31 @@
 # @version 1.0
 # ---------------------------------
 
-from utils.image import image_to_bytes, bytes_to_image
+from utils.image import bytes_to_image, encode_for_import
 from internal.data.content import DBImageData
 from internal.model.content.image import (
     create_image_impl,
+    bulk_create_images_impl,
+    existing_image_hashes_impl,
     get_image_impl,
     delete_image_impl,
-    get_images_impl,
+    iter_images_impl,
+    move_image_blobs_batch_impl,
+    fill_image_metadata_batch_impl,
+    reencode_images_batch_impl,
+    image_duplicate_clusters_impl,
+    build_image_tiles_impl,
 )
+from utils.blob_store import blob_hash
+from utils.tile_store import PyramidTooLarge
+from utils.phash import ahash, dhash
 from PIL import Image
+from io import BytesIO
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from tqdm import tqdm
+import multiprocessing
+import os
+import time
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,8 +38,10 @@ logger = logging.getLogger(__name__)
 
 def create_image(db_func, img_path: str, img_name: str = "", debug: bool = False):
     db = next(db_func())
-    image = Image.open(img_path).convert("RGB")
-    img_data = image_to_bytes(image, format="PNG")
+    with open(img_path, "rb") as f:
+        source = f.read()
+    with Image.open(BytesIO(source)) as image:
+        img_data, _ = encode_for_import(image, source)
     if img_name == "":
         img_name = img_path.split("\\")[-1].split(".")[0]
 
@@ -52,6 +70,111 @@ def create_image(db_func, img_path: str, img_name: str = "", debug: bool = False
     return "Done"
 
 
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".gif", ".tif", ".tiff")
+
+
+def _encode_image_worker(img_path: str):
+    # runs in a pool process: decode, encode in the storage mode unless the
+    # source is lossy or already smaller, and hash
+    with open(img_path, "rb") as f:
+        source = f.read()
+    with Image.open(BytesIO(source)) as image:
+        data, format = encode_for_import(image, source)
+        width, height = image.size
+        ah, dh = ahash(image), dhash(image)
+    return DBImageData(
+        id=-1,
+        name=os.path.splitext(os.path.basename(img_path))[0],
+        data=data,
+        htime=0,
+        desp="",
+        hash=blob_hash(data),
+        width=width,
+        height=height,
+        size=len(data),
+        format=format,
+        ahash=ah,
+        dhash=dh,
+    )
+
+
+def _insert_image_batch(db, batch: list[DBImageData]):
+    # skips the hashes already stored, returns the number of inserted images
+    existing = existing_image_hashes_impl(db, [crt.hash for crt in batch])
+    batch = [crt for crt in batch if crt.hash not in existing]
+    try:
+        bulk_create_images_impl(db, batch)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(batch)
+
+
+def import_images(db_func, img_dir: str, workers: int = 0, batch_size: int = 64):
+    """
+    Import every image under img_dir: decoding, encoding and hashing run in a
+    process pool, identical images are stored once, rows are inserted in
+    batched transactions. The file name is used as the image name.
+    """
+    db = next(db_func())
+    workers = int(workers) if int(workers) > 0 else os.cpu_count()
+    batch_size = int(batch_size)
+    img_paths = sorted(
+        os.path.join(root, f)
+        for root, _, files in os.walk(img_dir)
+        for f in files
+        if f.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    logger.info(f"Importing {len(img_paths)} images with {workers} workers")
+
+    seen = set()
+    batch = []
+    inserted, failed = 0, 0
+    t0 = time.perf_counter()
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        # a bounded window of tasks in flight, so encoded images do not pile up
+        pending = {}
+        it = iter(img_paths)
+        bar = tqdm(total=len(img_paths), unit="image")
+        while True:
+            for img_path in it:
+                pending[pool.submit(_encode_image_worker, img_path)] = img_path
+                if len(pending) >= workers * 4:
+                    break
+            if len(pending) == 0:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                img_path = pending.pop(future)
+                bar.update(1)
+                try:
+                    crt = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to encode {img_path}: {e}")
+                    failed += 1
+                    continue
+                if crt.hash in seen:
+                    continue
+                seen.add(crt.hash)
+                batch.append(crt)
+            if len(batch) >= batch_size:
+                inserted += _insert_image_batch(db, batch)
+                batch = []
+        bar.close()
+    inserted += _insert_image_batch(db, batch)
+    # repeated in the directory or already stored
+    duplicated = len(img_paths) - failed - inserted
+
+    dt = time.perf_counter() - t0
+    logger.info(
+        f"{inserted} inserted, {duplicated} duplicates, {failed} failed in {dt:.1f} s, "
+        f"{len(img_paths) / max(dt, 1e-9):.1f} images/s"
+    )
+    return f"Done {inserted}/{len(img_paths)}"
+
+
 def read_image(db_func, id: int):
     db = next(db_func())
     image = get_image_impl(db, id)
@@ -69,17 +192,121 @@ def read_image(db_func, id: int):
     return "Done"
 
 
-def read_images(db_func, out_dir: str):
+def read_images(db_func, out_dir: str, batch_size: int = 50):
     db = next(db_func())
-    images = get_images_impl(db)
-    logger.info("Read images from db, with ids: ", [image.id for image in images])
-    for dbimage in images:
+    count = 0
+    # streamed, only one batch of blobs is in memory
+    for dbimage in iter_images_impl(db, int(batch_size)):
         image = bytes_to_image(dbimage.data)
-        # print image metadata
-        logger.info("Image size: ", image.size)
-        logger.info("Image format: ", image.format)
-        logger.info("Image mode: ", image.mode)
-        # Save to out.png
+        logger.info(
+            f"Image {dbimage.id}: {dbimage.width}x{dbimage.height} {dbimage.format}, {dbimage.size} bytes"
+        )
         image.save(f"{out_dir}/{dbimage.name}.png")
-        logger.info(f"Saved image to {out_dir}/{dbimage.name}.png")
+        count += 1
+    logger.info(f"Saved {count} images to {out_dir}")
     return "Done"
+
+
+def fill_image_metadata(db_func, batch_size: int = 50):
+    """
+    Read width, height, size and format of the images stored before they were recorded
+    """
+    db = next(db_func())
+    batch_size = int(batch_size)
+    last_id = 0
+    total = 0
+    while True:
+        last_id, filled = fill_image_metadata_batch_impl(db, last_id, batch_size)
+        if last_id is None:
+            break
+        total += filled
+        logger.info(f"Filled image metadata up to id {last_id}: {total}")
+    return f"Done {total} images"
+
+
+def move_image_blobs(db_func, batch_size: int = 50, backend: str = "file"):
+    """
+    Move the image bytes from the images table into the blob store batch by batch,
+    with backend=db the legacy rows are only hashed
+    """
+    db = next(db_func())
+    batch_size = int(batch_size)
+    last_id = 0
+    total = 0
+    while True:
+        last_id, moved = move_image_blobs_batch_impl(db, last_id, batch_size, backend)
+        if last_id is None:
+            break
+        total += moved
+        logger.info(f"Moved image blobs up to id {last_id}: {total}")
+    return f"Done {total} images"
+
+
+def reencode_images(
+    db_func,
+    batch_size: int = 20,
+    photo_mode: str = None,
+    graphic_mode: str = None,
+    force: bool = False,
+):
+    """
+    Re-encode the stored images in the storage mode of their class, e.g.
+    photo_mode=jpeg:85 graphic_mode=webp-lossless, and report the bytes saved;
+    lossy stored images are only re-encoded with force=true
+    """
+    db = next(db_func())
+    batch_size = int(batch_size)
+    force = str(force).lower() == "true"
+    last_id = 0
+    total, before, after = 0, 0, 0
+    t0 = time.perf_counter()
+    while True:
+        last_id, reencoded, b, a = reencode_images_batch_impl(
+            db, last_id, batch_size, photo_mode, graphic_mode, force
+        )
+        if last_id is None:
+            break
+        total += reencoded
+        before += b
+        after += a
+        logger.info(f"Re-encoded images up to id {last_id}: {total}")
+    saved = before - after
+    logger.info(
+        f"{total} images re-encoded in {time.perf_counter() - t0:.1f} s: "
+        f"{before / 2**20:.1f} MB -> {after / 2**20:.1f} MB, "
+        f"{saved / 2**20:.1f} MB saved ({saved / max(before, 1):.0%})"
+    )
+    return f"Done {total} images, {saved} bytes saved"
+
+
+def image_duplicates(db_func, distance: int = 4):
+    """
+    Report the clusters of near duplicate images by perceptual hash
+    """
+    db = next(db_func())
+    t0 = time.perf_counter()
+    clusters = image_duplicate_clusters_impl(db, int(distance))
+    logger.info(
+        f"{len(clusters)} clusters, {sum(len(c) for c in clusters)} images "
+        f"in {time.perf_counter() - t0:.1f} s"
+    )
+    for ids in clusters:
+        logger.info(f"{len(ids)} images: {ids}")
+    return f"Done {len(clusters)} clusters"
+
+
+def build_image_tiles(db_func, id: int, fmt: str = "webp"):
+    """
+    Precompute the deep-zoom tile pyramid of an image into the tile store
+    """
+    db = next(db_func())
+    t0 = time.perf_counter()
+    try:
+        built = build_image_tiles_impl(db, int(id), fmt)
+    except PyramidTooLarge as e:
+        return f"Image {id} is too large to tile: {e}"
+    if built is None:
+        return f"Image {id} not found"
+    count, total = built
+    logger.info(f"{count} tiles, {total} bytes in {time.perf_counter() - t0:.1f} s")
+    return f"Done {count} tiles"
@@ -7,16 +7,13 @@
 # ---------------------------------
 
 import numpy as np
-from internal.model.finance.transaction import read_transactions_impl
-from internal.data.finance import transactions_money_iter
 import logging
 import datetime
-from internal.model.health import read_weights_impl
+from internal.model.series import read_daily_series_impl
 
 import matplotlib.pyplot as plt
-from utils.money import sumup
 from utils.stat.regression import linear_regression_1d
-from scipy.signal import correlate
+from utils.stat.correlation import as_series, fill_gaps, lag_analysis
 
 logger = logging.getLogger(__name__)
 
@@ -34,37 +31,31 @@ def analyze_snack_weight_rel(db_func):
     end_date_literal = "2025-05-30"
     start_date = datetime.datetime.strptime(start_date_literal, "%Y-%m-%d")
     end_date = datetime.datetime.strptime(end_date_literal, "%Y-%m-%d")
-    # read daily result
-    weights = read_weights_impl(
+    # read daily weight and daily snack outcome in one query
+    series = read_daily_series_impl(
         db,
         start_time=start_date.timestamp(),
         end_time=end_date.timestamp(),
-        _tag="daily",
+        weight_tags=["daily"],
+        transaction_tags=["零食"],
     )
-    logger.info(f"Read {len(weights)} daily weights from the database")
-    x = np.array([w.htime for w in weights])
-    y = np.array([float(w.value) for w in weights])
-    # calcuate the gradient of y
-    # plot data
-    dydx = np.gradient(y, x)
+    x = np.array(series.days)
+    y = as_series(series.weights["daily"])
+    logger.info(
+        f"Read {np.count_nonzero(~np.isnan(y))} daily weights in {len(x)} days from the database"
+    )
+    if np.count_nonzero(~np.isnan(y)) < 2:
+        logger.error("Not enough daily weights to analyze")
+        return "Done"
+    # calcuate the gradient of y, missing days are interpolated
+    dydx = np.gradient(fill_gaps(y, x), x)
     # normalize dydx
     dydx = dydx / np.max(np.abs(dydx)) * 100  # Normalize to percentage
 
-    one_day = datetime.timedelta(days=1)
-    sy = []
-    for t in x:
-        dt = datetime.datetime.fromtimestamp(t)
-
-        transactions = read_transactions_impl(
-            db,
-            from_time=dt.timestamp(),
-            to_time=(dt + one_day).timestamp(),
-            _tags=["零食"],
-        )
-        sy.append(float(sumup(transactions_money_iter(transactions)).value))
-        # sum up
+    sy = np.array(series.transactions["零食"])
     # normalize sy
-    sy = sy / np.max(sy) * 100  # Normalize to percentage
+    if np.max(np.abs(sy)) > 0:
+        sy = sy / np.max(np.abs(sy)) * 100  # Normalize to percentage
 
     plt.figure(figsize=(10, 5))
     # plt.plot(x, y, label="Weight", color="blue")
@@ -79,13 +70,14 @@ def analyze_snack_weight_rel(db_func):
     plt.legend()
     plt.grid()
     plt.show()  # for each day, get the snack outcome and weight increase rate pair
-    pairs = []
-    for i in range(len(x)):
-        pairs.append((sy[i], dydx[i]))  # Perform correlation analysis
+    # Perform correlation analysis
     logger.info("=== 相关性分析结果 ===")
+    display_range = min(30, len(sy) // 2)
+    # rel.corr[i] = corr(sy[t + lag], dydx[t])
+    rel = lag_analysis(sy, dydx, max_lag=display_range)
 
     # 1. 线性相关系数
-    correlation_coeff = np.corrcoef(sy, dydx)[0, 1]
+    correlation_coeff = rel.pearson
     logger.info(f"皮尔逊相关系数: {correlation_coeff:.4f}")
 
     # 2. 线性回归分析
@@ -107,17 +99,11 @@ def analyze_snack_weight_rel(db_func):
     # 3. 滞后相关性分析 (Cross-correlation)
     logger.info("=== 滞后相关性分析 ===")
 
-    # 计算互相关
-    cross_corr = correlate(dydx, sy, mode="full")
-    lags = np.arange(-len(sy) + 1, len(sy))
-
-    # 标准化互相关
-    cross_corr_normalized = cross_corr / (np.std(sy) * np.std(dydx) * len(sy))
-
-    # 找到最大相关性及其对应的滞后
-    max_corr_idx = np.argmax(np.abs(cross_corr_normalized))
-    max_lag = lags[max_corr_idx]
-    max_corr_value = cross_corr_normalized[max_corr_idx]
+    # 标准化互相关, 找到最大相关性及其对应的滞后
+    lags = rel.lags
+    cross_corr_normalized = rel.corr
+    max_lag = rel.best_lag
+    max_corr_value = rel.best_corr
 
     logger.info(f"最大相关性: {max_corr_value:.4f}")
     logger.info(f"对应滞后: {max_lag} 天")
@@ -160,9 +146,7 @@ def analyze_snack_weight_rel(db_func):
 
     # 子图3: 互相关函数
     # 只显示合理范围的滞后
-    display_range = min(30, len(sy) // 2)
-    display_mask = (lags >= -display_range) & (lags <= display_range)
-    axes[1, 0].plot(lags[display_mask], cross_corr_normalized[display_mask], "g-")
+    axes[1, 0].plot(lags, cross_corr_normalized, "g-")
     axes[1, 0].axvline(
         x=max_lag, color="r", linestyle="--", label=f"最大相关滞后: {max_lag}天"
     )
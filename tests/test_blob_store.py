@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# @file test_blob_store.py
+# @brief Test the content-addressed blob store
+# @author sailing-innocent
+# @date 2025-06-20
+# @version 1.0
+# ---------------------------------
+
+import os
+import pytest
+from utils.blob_store import LocalBlobStore, blob_hash
+
+
+def test_put_read(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    data = b"\x89PNG" + bytes(range(256)) * 100
+    sha = store.put(data)
+    assert sha == blob_hash(data)
+    assert store.path(sha).endswith(os.path.join(sha[:2], sha[2:4], sha))
+    assert store.read(sha) == data
+    assert store.size(sha) == len(data)
+    assert b"".join(store.iter_read(sha, 4, 100, chunk=7)) == data[4:100]
+    # the same bytes are stored once
+    assert store.put(data) == sha
+    assert len(os.listdir(os.path.dirname(store.path(sha)))) == 1
+
+    store.delete(sha)
+    assert not store.exists(sha)
+
+
+def test_empty_and_invalid(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    assert store.read(store.put(b"")) == b""
+    with pytest.raises(ValueError):
+        store.path("../../etc/passwd")
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# @file test_book_parser.py
+# @brief Test the streaming book parser
+# @author sailing-innocent
+# @date 2025-06-10
+# @version 1.0
+# ---------------------------------
+
+from utils.book_parser import BookParser, is_chapter_title
+
+SAMPLE_BOOK = """书名
+作者：某人
+简介
+正文
+第一章 开始
+第一段
+
+第二段
+第二回
+第三段
+尾声 结束
+最后
+"""
+
+
+def test_is_chapter_title():
+    assert is_chapter_title("第一章 开始")
+    assert is_chapter_title("第十二回")
+    assert is_chapter_title("序 前面的话")
+    assert is_chapter_title("尾声")
+    assert not is_chapter_title("第一章节后 文字")
+    assert not is_chapter_title("序列")
+    assert not is_chapter_title("")
+
+
+def test_parse_lines():
+    parser = BookParser("书名", "某人")
+    parser.parse(SAMPLE_BOOK.splitlines(keepends=True))
+    book = parser.book
+    assert book.preface == "作者：某人简介"
+    assert [c.title for c in book.chapters] == ["第一章 开始", "第二回", "尾声 结束"]
+    assert [c.content for c in book.chapters] == ["第一段第二段", "第三段", "最后"]
+
+
+def test_iter_parse_streams_chapters():
+    parser = BookParser("书名", "某人")
+    it = parser.iter_parse(iter(SAMPLE_BOOK.splitlines(keepends=True)))
+    first = next(it)
+    assert first.title == "第一章 开始"
+    assert len(list(it)) == 2
+    assert parser.chapters == []
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# @file test_chapter_cache.py
+# @brief Test the chapter payload cache
+# @author sailing-innocent
+# @date 2025-06-25
+# @version 1.0
+# ---------------------------------
+
+from internal.data.content import ChapterData
+from internal.model.content.cache import (
+    chapter_cache_stats,
+    clear_chapter_cache,
+    get_cached_chapter,
+    invalidate_chapter_cache,
+    put_cached_chapter,
+)
+
+
+def test_chapter_charged_once():
+    clear_chapter_cache()
+    chapter = ChapterData(id=7, title="t", book_id=1, order=3, content="x" * 1000)
+    put_cached_chapter(chapter)
+    stats = chapter_cache_stats()
+    assert stats["entries"] == 1
+    assert stats["bytes"] < 2 * 1000
+    assert get_cached_chapter(chapter_id=7).content == chapter.content
+    assert get_cached_chapter(book_id=1, order=3).id == 7
+    assert get_cached_chapter(book_id=1, order=4) is None
+
+
+def test_order_slot_invalidated():
+    clear_chapter_cache()
+    put_cached_chapter(ChapterData(id=7, title="t", book_id=1, order=3, content="a"))
+    invalidate_chapter_cache(book_id=1, order=3)
+    assert get_cached_chapter(book_id=1, order=3) is None
+    # the slot moved to another chapter, the old pointer is not followed
+    put_cached_chapter(ChapterData(id=8, title="t", book_id=1, order=4, content="b"))
+    put_cached_chapter(ChapterData(id=8, title="t", book_id=1, order=3, content="b"))
+    assert get_cached_chapter(book_id=1, order=4) is None
+    assert get_cached_chapter(book_id=1, order=3).id == 8
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# @file test_codec.py
+# @brief Test the packed text codec
+# @author sailing-innocent
+# @date 2025-06-14
+# @version 1.0
+# ---------------------------------
+
+import pytest
+from utils.codec import CODECS, pack_if_large, pack_text, unpack_text
+
+
+@pytest.mark.parametrize("codec", list(CODECS))
+def test_round_trip(codec):
+    text = "第一章 开始。" * 1000
+    packed = pack_text(text, codec)
+    assert packed[0] == CODECS[codec]
+    assert unpack_text(packed) == text
+
+
+def test_pack_if_large_threshold():
+    assert pack_if_large("short", threshold=100) == ("short", None)
+    assert pack_if_large("long", threshold=0) == ("long", None)
+    data, packed = pack_if_large("重复" * 500, threshold=100, codec="zlib")
+    assert data is None
+    assert unpack_text(packed) == "重复" * 500
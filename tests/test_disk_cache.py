@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# @file test_disk_cache.py
+# @brief Test the size bounded disk LRU cache
+# @author sailing-innocent
+# @date 2025-06-21
+# @version 1.0
+# ---------------------------------
+
+import os
+from utils.disk_cache import DiskLRUCache
+
+
+def test_put_get_evict(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), max_bytes=25)
+    a = cache.put("a", b"a" * 10)
+    cache.put("b", b"b" * 10)
+    assert open(a, "rb").read() == b"a" * 10
+    assert cache.get("a") == a  # a is now the most recent
+    cache.put("c", b"c" * 10)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["bytes"] == 20
+    assert cache.put("big", b"x" * 26) is None
+
+
+def test_reload(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), max_bytes=100)
+    cache.put(("image", 1, 256), b"data")
+    reloaded = DiskLRUCache(str(tmp_path), max_bytes=100)
+    assert reloaded.get(("image", 1, 256)) == cache.path(("image", 1, 256))
+    # a smaller cap evicts on start
+    DiskLRUCache(str(tmp_path), max_bytes=1)
+    assert os.listdir(tmp_path) == []
+
+
+def test_open_survives_eviction(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), max_bytes=15)
+    cache.put("a", b"a" * 10)
+    with cache.open("a") as f:
+        cache.put("b", b"b" * 10)  # evicts a while it is being served
+        assert f.read() == b"a" * 10
+    assert cache.open("a") is None and cache.get("a") is None
+    os.remove(cache.path("b"))  # removed behind the cache's back
+    assert cache.open("b") is None
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# @file test_http_cache.py
+# @brief Test the ETag comparisons
+# @author sailing-innocent
+# @date 2025-06-25
+# @version 1.0
+# ---------------------------------
+
+from utils.http_cache import etag_matches, make_etag
+
+
+def test_weak_comparison():
+    etag = make_etag(b"abc")
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"x", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"x"', etag)
+    assert not etag_matches(None, etag)
+
+
+def test_strong_comparison():
+    etag = make_etag(b"abc")
+    assert etag_matches(etag, etag, strong=True)
+    assert not etag_matches(f"W/{etag}", etag, strong=True)
+    assert not etag_matches(etag, f"W/{etag}", strong=True)
+    assert not etag_matches("*", etag, strong=True)
+    assert not etag_matches("Wed, 21 Oct 2015 07:28:00 GMT", etag, strong=True)
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# @file test_http_encoding.py
+# @brief Test the HTTP content encoding utilities
+# @author sailing-innocent
+# @date 2025-06-19
+# @version 1.0
+# ---------------------------------
+
+import gzip
+from utils.http_encoding import accepts_gzip, gzip_chunks
+
+
+def test_accepts_gzip():
+    assert accepts_gzip("gzip, deflate, br")
+    assert accepts_gzip("br;q=1.0, gzip;q=0.8")
+    assert accepts_gzip("*")
+    assert not accepts_gzip("gzip;q=0")
+    assert not accepts_gzip("deflate")
+    assert not accepts_gzip(None)
+
+
+def test_gzip_chunks():
+    chunks = [f'{{"order": {i}, "title": "第{i}章"}}\n'.encode("utf-8") for i in range(100)]
+    assert gzip.decompress(b"".join(gzip_chunks(chunks))) == b"".join(chunks)
+    assert gzip.decompress(b"".join(gzip_chunks([]))) == b""
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# @file test_http_range.py
+# @brief Test the HTTP Range header parsing
+# @author sailing-innocent
+# @date 2025-06-16
+# @version 1.0
+# ---------------------------------
+
+import pytest
+from utils.http_range import parse_range, content_range, RangeNotSatisfiable
+
+
+def test_parse_range_forms():
+    assert parse_range("bytes=0-99", 1000) == ("bytes", 0, 100)
+    assert parse_range("bytes=900-", 1000) == ("bytes", 900, 1000)
+    assert parse_range("bytes=-100", 1000) == ("bytes", 900, 1000)
+    assert parse_range("bytes=990-2000", 1000) == ("bytes", 990, 1000)
+    assert parse_range("chars=10-19", 50, units=("chars",)) == ("chars", 10, 20)
+    assert content_range("bytes", 0, 100, 1000) == "bytes 0-99/1000"
+
+
+def test_parse_range_ignored_or_unsatisfiable():
+    assert parse_range(None, 1000) is None
+    assert parse_range("chars=0-9", 1000) is None
+    assert parse_range("bytes=abc", 1000) is None
+    # invalid or multiple ranges are ignored, the whole resource is sent
+    assert parse_range("bytes=5-3", 1000) is None
+    assert parse_range("bytes=0-9, 20-29", 1000) is None
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range("bytes=1000-", 1000)
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# @file test_image_blobs.py
+# @brief Test the blob lifetime of images under the file backend
+# @author sailing-innocent
+# @date 2025-06-25
+# @version 1.0
+# ---------------------------------
+
+import pytest
+from PIL import Image
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from internal.data.content import DBImage, DBImageData
+import internal.model.content.blob as blob
+import internal.model.content.image as image_model
+from utils.blob_store import LocalBlobStore
+from utils.image import image_to_bytes
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    store = LocalBlobStore(str(tmp_path / "blobs"))
+    monkeypatch.setattr(image_model, "g_image_store", store)
+    monkeypatch.setattr(blob, "IMAGE_BLOB_BACKEND", "file")
+    engine = create_engine("sqlite://")
+    DBImage.__table__.create(engine)
+    return Session(engine)
+
+
+def _png(color):
+    return image_to_bytes(Image.new("RGB", (8, 8), color))
+
+
+def _create(db, data):
+    return image_model.create_image_impl(
+        db, DBImageData(id=-1, name="i", data=data, htime=0, desp="")
+    )
+
+
+def test_update_releases_old_blob(db):
+    store = image_model.g_image_store
+    red, blue = _png("red"), _png("blue")
+    a = _create(db, red)
+    b = _create(db, red)
+    image_model.update_image_impl(db, a.id, DBImageData(id=a.id, name=None, data=blue, htime=None, desp=None))
+    # b still uses the red blob
+    assert store.exists(a.hash) and store.exists(image_model.get_image_impl(db, a.id).hash)
+    image_model.update_image_impl(db, b.id, DBImageData(id=b.id, name=None, data=blue, htime=None, desp=None))
+    assert not store.exists(a.hash)
+    image_model.delete_image_impl(db, a.id)
+    image_model.delete_image_impl(db, b.id)
+    assert not store.exists(image_model.blob_hash(blue))
+
+
+def test_reencode_skips_lossy(db):
+    store = image_model.g_image_store
+    rng = __import__("numpy").random.default_rng(0)
+    photo = Image.fromarray(rng.integers(0, 255, (64, 64, 3), dtype="uint8"))
+    lossy = image_to_bytes(photo, "WEBP")
+    lossless = image_to_bytes(photo, "PNG")
+    a = _create(db, lossy)
+    b = _create(db, lossless)
+    _, reencoded, _, _ = image_model.reencode_images_batch_impl(db, 0, 10, photo_mode="jpeg:50")
+    assert reencoded == 1  # only the png
+    assert not store.exists(b.hash)
+    _, reencoded, _, _ = image_model.reencode_images_batch_impl(
+        db, 0, 10, photo_mode="jpeg:50", force=True
+    )
+    assert reencoded == 1 and not store.exists(a.hash)
+
+
+def test_blob_media_type_without_format(db):
+    image = _create(db, _png("red"))
+    db.query(DBImage).filter(DBImage.id == image.id).update({"format": None})
+    db.commit()
+    blob = image_model.read_image_blob_impl(db, image.id)
+    assert blob.media_type == "image/png"
+    with blob.file as f:
+        assert f.read() == _png("red")
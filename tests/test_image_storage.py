@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# @file test_image_storage.py
+# @brief Test the image storage encodings
+# @author sailing-innocent
+# @date 2025-06-22
+# @version 1.0
+# ---------------------------------
+
+import io
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+from utils.image import (
+    bytes_to_image,
+    classify_image,
+    encode_for_import,
+    encode_for_storage,
+    image_info,
+    image_to_bytes,
+    is_lossy_encoding,
+    storage_format,
+)
+
+
+def _photo():
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 255, 320)
+    arr = np.stack([np.tile(x, (240, 1))] * 3, -1) + rng.normal(0, 8, (240, 320, 3))
+    return Image.fromarray(arr.clip(0, 255).astype("uint8"))
+
+
+def _graphic():
+    image = Image.new("RGB", (320, 240), "white")
+    ImageDraw.Draw(image).rectangle((40, 40, 200, 160), fill="red")
+    return image
+
+
+def test_classify():
+    assert classify_image(_photo()) == "photo"
+    assert classify_image(_graphic()) == "graphic"
+    assert classify_image(_photo().convert("RGBA")) == "graphic"
+
+
+@pytest.mark.parametrize("mode", ["png", "webp-lossless", "webp:80", "jpeg:85"])
+def test_encode_round_trip(mode):
+    data, format = encode_for_storage(_photo(), mode)
+    assert format == storage_format(mode)
+    assert image_info(data) == (320, 240, format)
+    assert bytes_to_image(data).size == (320, 240)
+
+
+def test_lossy_photo_is_smaller():
+    photo = _photo()
+    data, _ = encode_for_storage(photo, "webp:90")
+    assert len(data) * 3 < len(image_to_bytes(photo, "PNG"))
+
+
+def test_alpha_kept_unless_jpeg():
+    image = _graphic().convert("RGBA")
+    image.putalpha(128)
+    data, _ = encode_for_storage(image, "webp-lossless")
+    assert Image.open(io.BytesIO(data)).mode == "RGBA"
+    data, _ = encode_for_storage(image, "jpeg:80")
+    assert image_info(data)[2] == "jpeg"
+    with pytest.raises(ValueError):
+        encode_for_storage(image, "gif")
+
+
+def test_lossy_encoding():
+    photo = _photo()
+    assert is_lossy_encoding(encode_for_storage(photo, "jpeg:85")[0])
+    assert is_lossy_encoding(encode_for_storage(photo, "webp:80")[0])
+    assert not is_lossy_encoding(encode_for_storage(photo, "webp-lossless")[0])
+    assert not is_lossy_encoding(encode_for_storage(photo, "png")[0])
+    # the extended layout (VP8X) carries alpha before the bitstream
+    alpha = photo.convert("RGBA")
+    alpha.putalpha(128)
+    assert is_lossy_encoding(encode_for_storage(alpha, "webp:80")[0])
+    assert not is_lossy_encoding(encode_for_storage(alpha, "webp-lossless")[0])
+
+
+def test_encode_for_import():
+    photo = _photo()
+    # a JPEG source is kept, not re-encoded lossy a second time
+    jpeg = image_to_bytes(photo, "JPEG")
+    with Image.open(io.BytesIO(jpeg)) as image:
+        assert encode_for_import(image, jpeg, "webp:90") == (jpeg, "jpeg")
+    # a lossless source is encoded only if that makes it smaller
+    png = image_to_bytes(_graphic(), "PNG")
+    with Image.open(io.BytesIO(png)) as image:
+        data, format = encode_for_import(image, png, "webp-lossless")
+    assert format == "webp" and len(data) < len(png)
+    rng = np.random.default_rng(0)
+    noise = image_to_bytes(Image.fromarray(rng.integers(0, 255, (8, 8, 3), dtype="uint8")), "PNG")
+    for mode in ("png", "webp-lossless"):
+        with Image.open(io.BytesIO(noise)) as image:
+            assert encode_for_import(image, noise, mode) == (noise, "png")
+    # other formats are always encoded
+    bmp = image_to_bytes(_graphic(), "BMP")
+    with Image.open(io.BytesIO(bmp)) as image:
+        assert encode_for_import(image, bmp, "png")[1] == "png"
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# @file test_image_tiles.py
+# @brief Test the image tile pyramid
+# @author sailing-innocent
+# @date 2025-06-24
+# @version 1.0
+# ---------------------------------
+
+import io
+import os
+import pytest
+from PIL import Image
+from utils.image import (
+    image_to_bytes,
+    iter_tiles,
+    tile_grid,
+    tile_level_size,
+    tile_max_zoom,
+)
+from utils.tile_store import PyramidTooLarge, TileStore
+
+
+def test_tile_levels():
+    assert tile_max_zoom(200, 100) == 0
+    assert tile_max_zoom(256, 256) == 0
+    assert tile_max_zoom(257, 10) == 1
+    assert tile_max_zoom(1000, 3000) == 4
+    assert tile_level_size(1000, 3000, 4, 4) == (1000, 3000)
+    assert tile_level_size(1001, 3000, 3, 4) == (501, 1500)
+    assert tile_level_size(1000, 3000, 0, 4) == (63, 188)
+    assert tile_grid(1000, 3000, 4, 4) == (4, 12)
+    assert tile_grid(1000, 3000, 0, 4) == (1, 1)
+
+
+def test_iter_tiles():
+    width, height = 601, 300
+    data = image_to_bytes(Image.new("RGB", (width, height), "red"))
+    max_zoom = tile_max_zoom(width, height)
+    tiles = {(z, x, y): t for z, x, y, t in iter_tiles(data, "png")}
+    expected = {
+        (z, x, y)
+        for z in range(max_zoom + 1)
+        for x in range(tile_grid(width, height, z, max_zoom)[0])
+        for y in range(tile_grid(width, height, z, max_zoom)[1])
+    }
+    assert set(tiles) == expected
+    # the edge tiles are cut, not padded
+    last = Image.open(io.BytesIO(tiles[(max_zoom, 2, 1)]))
+    assert last.size == (width - 512, height - 256)
+    top = Image.open(io.BytesIO(tiles[(0, 0, 0)]))
+    assert top.size == tile_level_size(width, height, 0, max_zoom)
+    assert top.getpixel((0, 0)) == (255, 0, 0)
+
+
+def _pyramid(n, size):
+    return [(0, x, 0, bytes(size)) for x in range(n)]
+
+
+def test_tile_store(tmp_path):
+    store = TileStore(str(tmp_path), 1000)
+    assert store.put("a", _pyramid(4, 100)) == (4, 400)
+    assert store.put("b", _pyramid(4, 100)) == (4, 400)
+    path = store.get("a", 0, 3, 0)
+    assert path is not None and os.path.getsize(path) == 100
+    assert store.get("a", 0, 4, 0) is None
+    # whole pyramids are evicted, least recently used first
+    store.put("c", _pyramid(4, 100))
+    assert not store.has("b")
+    assert store.has("a") and store.has("c")
+    assert store.stats()["bytes"] == 800
+    # a pyramid larger than the store leaves nothing behind
+    with pytest.raises(PyramidTooLarge):
+        store.put("d", _pyramid(11, 100))
+    assert not store.has("d")
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        TileStore.key_name(k) for k in ("a", "c")
+    )
+    # an open tile stays readable after its pyramid is evicted
+    with store.open("c", 0, 0, 0) as f:
+        store.put("e", _pyramid(7, 100))
+        assert not store.has("c") and f.read() == bytes(100)
+    assert store.open("c", 0, 0, 0) is None
+    # reloaded from the manifests, interrupted builds are removed
+    os.makedirs(tmp_path / ".tmp-x" / "0")
+    reloaded = TileStore(str(tmp_path), 1000)
+    assert reloaded.has("e") and not reloaded.has("a")
+    assert reloaded.stats()["bytes"] == 700
+    assert not os.path.exists(tmp_path / ".tmp-x")
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# @file test_lru.py
+# @brief Test the size bounded LRU cache
+# @author sailing-innocent
+# @date 2025-06-12
+# @version 1.0
+# ---------------------------------
+
+from utils.lru import SizedLRUCache
+
+
+def test_evicts_least_recently_used_by_bytes():
+    cache = SizedLRUCache(max_bytes=10)
+    cache.put("a", "aaaa")
+    cache.put("b", "bbbb")
+    assert cache.get("a") == "aaaa"  # a is now the most recent
+    cache.put("c", "cccc")
+    assert "b" not in cache
+    assert "a" in cache and "c" in cache
+    stats = cache.stats()
+    assert stats["bytes"] == 8
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 1
+
+
+def test_invalidate_and_oversized_values():
+    cache = SizedLRUCache(max_bytes=4)
+    cache.put("big", "x" * 5)
+    assert cache.get("big") is None
+    cache.put("a", "a")
+    cache.put("b", "b")
+    assert cache.invalidate_if(lambda k, v: v == "a") == 1
+    assert cache.get("a") is None
+    assert cache.stats()["misses"] == 2
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# @file test_ngram.py
+# @brief Test the n-gram search tokens
+# @author sailing-innocent
+# @date 2025-06-15
+# @version 1.0
+# ---------------------------------
+
+from utils.ngram import text_grams, query_grams
+
+
+def test_text_grams():
+    assert text_grams("北京大学") == sorted(
+        ["北", "京", "大", "学", "北京", "京大", "大学"]
+    )
+    # bigrams never span whitespace, case is folded
+    assert "b c" not in text_grams("aB c")
+    assert "ab" in text_grams("aB c")
+
+
+def test_query_grams_are_contained():
+    text = set(text_grams("我们在北京大学读书"))
+    assert set(query_grams("北京大学")) <= text
+    assert set(query_grams("京")) <= text
+    assert not set(query_grams("南京")) <= text
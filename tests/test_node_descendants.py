@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# @file test_node_descendants.py
+# @brief Test the segment ownership of content nodes
+# @author sailing-innocent
+# @date 2025-06-25
+# @version 1.0
+# ---------------------------------
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable
+from internal.data.content import ContentNode
+from internal.model.content.content import read_node_descendants_impl
+from internal.model.content.paragraph import read_node_subtree_impl
+
+
+def _session():
+    # the table only, the GiST span index is postgres specific
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(CreateTable(ContentNode.__table__))
+    return Session(engine)
+
+
+def _node(db, start, offset, tags="", root_id=None, content_id=1):
+    node = ContentNode(
+        content_id=content_id,
+        raw_tags="",
+        tags=tags,
+        start=start,
+        offset=offset,
+        root_id=root_id,
+    )
+    db.add(node)
+    db.flush()
+    return node.id
+
+
+def _segment(db, root):
+    # one paragraph of two sentences, and a single sentence paragraph
+    p1 = _node(db, 0, 10, "paragraph", root)
+    _node(db, 0, 4, "sentence", root)
+    _node(db, 4, 6, "sentence", root)
+    p2 = _node(db, 10, 5, "paragraph", root)
+    _node(db, 10, 5, "sentence", root)
+    return p1, p2
+
+
+def test_deduped_chapters_do_not_share_segments():
+    db = _session()
+    # two chapters with identical text share one content row
+    a = _node(db, 0, 15, "chapter")
+    b = _node(db, 0, 15, "chapter")
+    a_p1, a_p2 = _segment(db, a)
+    b_p1, _ = _segment(db, b)
+
+    a_nodes = read_node_descendants_impl(db, a)
+    assert len(a_nodes) == 5
+    assert all(n.id not in (a, b) for n in a_nodes)
+    assert {n.id for n in a_nodes}.isdisjoint(
+        n.id for n in read_node_descendants_impl(db, b)
+    )
+    assert [n.tags for n in read_node_descendants_impl(db, a_p1)] == ["sentence"] * 2
+    assert len(read_node_descendants_impl(db, a_p2)) == 1
+    assert len(read_node_descendants_impl(db, a, tags="paragraph")) == 2
+    # an unsegmented node has no descendants, whatever lies in its range
+    c = _node(db, 0, 15, "chapter")
+    assert read_node_descendants_impl(db, c) == []
+
+    tree = read_node_subtree_impl(db, a)
+    assert tree["id"] == a
+    assert [p["id"] for p in tree["children"]] == [a_p1, a_p2]
+    assert [len(p["children"]) for p in tree["children"]] == [2, 1]
+    assert read_node_subtree_impl(db, b)["children"][0]["id"] == b_p1
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# @file test_phash.py
+# @brief Test the perceptual hashes and the multi-index
+# @author sailing-innocent
+# @date 2025-06-23
+# @version 1.0
+# ---------------------------------
+
+import io
+import random
+import numpy as np
+from PIL import Image
+from utils.phash import (
+    MultiIndexHash,
+    ahash,
+    dhash,
+    hamming,
+    to_signed64,
+    to_unsigned64,
+)
+
+
+def _image(seed):
+    rng = np.random.default_rng(seed)
+    small = (rng.random((30, 40, 3)) * 255).astype("uint8")
+    return Image.fromarray(small).resize((400, 300), Image.Resampling.BILINEAR)
+
+
+def test_near_duplicates():
+    image = _image(0)
+    buf = io.BytesIO()
+    image.resize((200, 150)).save(buf, format="JPEG", quality=70)
+    copy = Image.open(io.BytesIO(buf.getvalue()))
+    other = _image(1)
+    for h in (ahash, dhash):
+        assert hamming(h(image), h(copy)) <= 8
+        assert hamming(h(image), h(other)) > 16
+
+
+def test_signed_round_trip():
+    for h in (0, 1, (1 << 63) - 1, 1 << 63, (1 << 64) - 1):
+        assert -(1 << 63) <= to_signed64(h) < 1 << 63
+        assert to_unsigned64(to_signed64(h)) == h
+
+
+def test_multi_index_matches_scan():
+    rng = random.Random(0)
+    hashes = [rng.getrandbits(64) for _ in range(2000)]
+    index = MultiIndexHash()
+    for i, h in enumerate(hashes):
+        index.add(h, i)
+    for radius in (0, 4, 7, 10, 15, 20):
+        q = hashes[3] ^ (1 << 5) ^ (1 << 40)
+        expected = sorted(i for i, h in enumerate(hashes) if hamming(h, q) <= radius)
+        found = index.query(q, radius)
+        assert sorted(i for _, i in found) == expected
+        assert [d for d, _ in found] == sorted(d for d, _ in found)
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# @file test_segment.py
+# @brief Test the paragraph and sentence segmentation
+# @author sailing-innocent
+# @date 2025-06-18
+# @version 1.0
+# ---------------------------------
+
+from utils.segment import (
+    nest_spans,
+    paragraph_segments,
+    sentence_segments,
+    segment_text,
+)
+
+
+def _cover(text, segments):
+    return "".join(text[s : s + o] for s, o in segments)
+
+
+def test_sentence_segments():
+    text = "他说：“好！”然后走了。真的吗？？……好吧"
+    segments = sentence_segments(text)
+    assert _cover(text, segments) == text
+    assert [text[s : s + o] for s, o in segments] == [
+        "他说：“好！”",
+        "然后走了。",
+        "真的吗？？……",
+        "好吧",
+    ]
+
+
+def test_paragraph_segments():
+    text = "第一段。\n第二段\n\n"
+    segments = paragraph_segments(text)
+    assert [text[s : s + o] for s, o in segments] == ["第一段。\n", "第二段\n", "\n"]
+    assert paragraph_segments("") == []
+
+
+def test_segment_text():
+    text = "一。二！\n三"
+    res = segment_text(text)
+    assert [(s, o) for s, o, _ in res] == [(0, 5), (5, 1)]
+    assert res[0][2] == [(0, 2), (2, 3)]
+    assert res[1][2] == [(5, 1)]
+
+
+def test_nest_spans():
+    spans = [(0, 10), (0, 4), (0, 2), (2, 2), (4, 6), (10, 3)]
+    roots = nest_spans(spans, start=lambda s: s[0], offset=lambda s: s[1])
+    assert [span for span, _ in roots] == [(0, 10), (10, 3)]
+    first = roots[0][1]
+    assert [span for span, _ in first] == [(0, 4), (4, 6)]
+    assert [span for span, _ in first[0][1]] == [(0, 2), (2, 2)]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# @file test_stat_correlation.py
+# @brief Test the lag correlation analysis
+# @author sailing-innocent
+# @date 2025-06-10
+# @version 1.0
+# ---------------------------------
+
+import numpy as np
+from utils.stat.correlation import as_series, fill_gaps, lag_analysis, pearson
+
+
+def test_lag_analysis_finds_shift():
+    rng = np.random.default_rng(0)
+    y = rng.normal(size=200)
+    x = np.roll(y, 3)  # x[t + 3] == y[t]
+    rel = lag_analysis(x, y, max_lag=10)
+    assert rel.best_lag == 3
+    assert rel.best_corr > 0.9
+    assert len(rel.lags) == 21
+
+
+def test_missing_values_are_masked():
+    x = as_series([1.0, None, 3.0, 4.0, None, 6.0])
+    y = as_series([2.0, 4.0, 6.0, 8.0, 10.0, 12.0])
+    assert np.isclose(pearson(x, y), 1.0)
+    assert np.allclose(fill_gaps(x), [1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# @file test_text_source.py
+# @brief Test the memory-mapped text files
+# @author sailing-innocent
+# @date 2025-06-19
+# @version 1.0
+# ---------------------------------
+
+import codecs
+import pytest
+from utils.book_parser import BookParser
+from utils.text_source import MappedTextFile, detect_encoding
+
+TEXT = "书名\n正文\n第一章 开始\n北京欢迎你。\n\n第二章 结束\n再见\n"
+
+
+@pytest.mark.parametrize(
+    "encoding,expected",
+    [("utf-8", "utf-8"), ("gb18030", "gb18030"), ("gbk", "gb18030")],
+)
+def test_detect_encoding(encoding, expected):
+    assert detect_encoding(TEXT.encode(encoding)) == expected
+
+
+def test_detect_bom():
+    assert detect_encoding(codecs.BOM_UTF8 + TEXT.encode("utf-8")) == "utf-8-sig"
+    # a sample cut inside a character is still utf-8
+    assert detect_encoding("北京".encode("utf-8")[:4]) == "utf-8"
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "gb18030", "utf-8-sig"])
+def test_lines_across_chunks(tmp_path, encoding):
+    path = tmp_path / "book.txt"
+    path.write_bytes(TEXT.encode(encoding))
+    # tiny chunks split characters and lines
+    with MappedTextFile(str(path), chunk_size=3) as f:
+        lines = list(f)
+        assert f.pos == f.size
+    assert "".join(lines) == TEXT
+    with open(path, "r", encoding=encoding) as f:
+        assert lines == f.readlines()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 1 << 16])
+def test_universal_newlines(tmp_path, chunk_size):
+    text = "一\r二\r\n三\n\r\r四\r\n\r五\r"
+    path = tmp_path / "book.txt"
+    path.write_bytes(text.encode("utf-8"))
+    with MappedTextFile(str(path), chunk_size=chunk_size) as f:
+        lines = list(f)
+    with open(path, "r", encoding="utf-8") as f:
+        assert lines == f.readlines()
+
+
+def test_parse_mapped(tmp_path):
+    path = tmp_path / "book.txt"
+    path.write_bytes(TEXT.encode("gbk"))
+    with MappedTextFile(str(path), chunk_size=5) as f:
+        chapters = list(BookParser("书名", "").iter_parse(f))
+    assert [c.title for c in chapters] == ["第一章 开始", "第二章 结束"]
+    assert chapters[0].content == "北京欢迎你。"
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / "empty.txt"
+    path.write_bytes(b"")
+    with MappedTextFile(str(path)) as f:
+        assert list(f) == []
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# @file test_vault_note.py
+# @brief Test that packed vault notes read back as text
+# @author sailing-innocent
+# @date 2025-06-25
+# @version 1.0
+# ---------------------------------
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from internal.data.content import VaultNote, VaultNoteData
+from internal.model.content.vault import (
+    compress_vault_note_batch_impl,
+    create_vault_note_impl,
+    delete_vault_note_impl,
+    get_vault_note_impl,
+    update_vault_note_by_note_id,
+    update_vault_note_impl,
+)
+
+TEXT = "---\nid: n\n---\n" + "重复的笔记正文。\n" * 500
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    VaultNote.__table__.create(engine)
+    return Session(engine)
+
+
+def _note(content):
+    return VaultNoteData(vault_name="v", note_path="n.md", note_id="n", title="t", content=content)
+
+
+def test_packed_note_round_trip(db, monkeypatch):
+    monkeypatch.setenv("CONTENT_COMPRESS_THRESHOLD", "1024")
+    id = create_vault_note_impl(db, _note(TEXT))
+    row = db.query(VaultNote).filter(VaultNote.id == id).first()
+    assert row.content is None and row.packed is not None
+    assert get_vault_note_impl(db, id).content == TEXT
+    assert update_vault_note_by_note_id(db, "n", _note(TEXT + "more")).content == TEXT + "more"
+    assert update_vault_note_impl(db, id, _note(TEXT)).content == TEXT
+    assert delete_vault_note_impl(db, id).content == TEXT
+    assert get_vault_note_impl(db, id) is None
+
+
+def test_compressed_note_reads_as_text(db):
+    id = create_vault_note_impl(db, _note(TEXT))
+    assert db.query(VaultNote.packed).filter(VaultNote.id == id).scalar() is None
+    compress_vault_note_batch_impl(db, threshold=1024)
+    assert db.query(VaultNote.content).filter(VaultNote.id == id).scalar() is None
+    note = get_vault_note_impl(db, id)
+    assert note.content == TEXT and note.id == id
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# @file test_vault_sync.py
+# @brief Test the incremental vault scan
+# @author sailing-innocent
+# @date 2025-06-24
+# @version 1.0
+# ---------------------------------
+
+import os
+from collections import namedtuple
+from utils.vault_sync import plan_vault_sync, scan_vault
+
+Row = namedtuple("Row", "id note_id file_size file_mtime file_hash")
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def test_scan_vault(tmp_path):
+    root = str(tmp_path)
+    _write(os.path.join(root, "a.md"), "a")
+    _write(os.path.join(root, "dir", "b.MD"), "bb")
+    _write(os.path.join(root, "dir", "c.png"), "c")
+    _write(os.path.join(root, ".obsidian", "d.md"), "d")
+    files = scan_vault(root)
+    assert sorted(os.path.relpath(p, root) for p in files) == ["a.md", os.path.join("dir", "b.MD")]
+    assert files[os.path.join(root, "dir", "b.MD")].size == 2
+
+
+def test_plan_vault_sync(tmp_path):
+    root = str(tmp_path)
+    _write(os.path.join(root, "same.md"), "s")
+    _write(os.path.join(root, "edited.md"), "e")
+    _write(os.path.join(root, "new.md"), "n")
+    files = scan_vault(root)
+    same = files[os.path.join(root, "same.md")]
+    edited = files[os.path.join(root, "edited.md")]
+    stored = {
+        same.path: Row(1, "s", same.size, same.mtime, "h1"),
+        edited.path: Row(2, "e", edited.size, edited.mtime - 1, "h2"),
+        os.path.join(root, "gone.md"): Row(3, "g", 1, 1, "h3"),
+        "/elsewhere/vault/other.md": Row(4, "o", 1, 1, "h4"),
+    }
+    plan = plan_vault_sync(root, files, stored)
+    assert plan.unchanged == 1
+    assert [os.path.basename(s.path) for s in plan.changed] == ["edited.md", "new.md"]
+    # rows outside the vault root are never deleted
+    assert plan.deleted == [3]
+
+
+def _note(note_id):
+    return (
+        f"---\nid: {note_id}\ntitle: T {note_id}\ndesc: d\n"
+        "updated: 1747800000000\ncreated: 1747700000000\n---\nbody\n"
+    )
+
+
+def test_update_notes_failures(tmp_path, monkeypatch):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from internal.data.content import VaultNote, VaultSyncSkip
+    import task.db.vault as vault_task
+
+    engine = create_engine("sqlite://")
+    VaultNote.__table__.create(engine)
+    VaultSyncSkip.__table__.create(engine)
+    db = Session(engine)
+    root = str(tmp_path)
+    monkeypatch.setenv("VAULT_PATH", root)
+    read = []
+    worker = vault_task._read_note_worker
+    monkeypatch.setattr(
+        vault_task, "_read_note_worker", lambda args: read.append(args[0].path) or worker(args)
+    )
+
+    def sync():
+        read.clear()
+        vault_task.update_notes(lambda: iter([db]), workers=1)
+        return {row.note_id: row.note_path for row in db.query(VaultNote).all()}
+
+    _write(os.path.join(root, "a.md"), _note("a"))
+    _write(os.path.join(root, "plain.md"), "no front matter")
+    assert sync() == {"a": os.path.join(root, "a.md")}
+    # a file that failed is not read again until it changes
+    assert sync() == {"a": os.path.join(root, "a.md")} and read == []
+    # moved and broken at the new path: the row is kept
+    os.remove(os.path.join(root, "a.md"))
+    _write(os.path.join(root, "b.md"), _note("a").replace("created:", "made:"))
+    assert sync() == {"a": os.path.join(root, "a.md")}
+    assert sync() == {"a": os.path.join(root, "a.md")} and read == []
+    # fixed: the row follows the note, the marker is dropped
+    _write(os.path.join(root, "b.md"), _note("a") + "fixed\n")
+    assert sync() == {"a": os.path.join(root, "b.md")}
+    assert [row.note_path for row in db.query(VaultSyncSkip).all()] == [
+        os.path.join(root, "plain.md")
+    ]
+    os.remove(os.path.join(root, "plain.md"))
+    sync()
+    assert db.query(VaultSyncSkip).count() == 0
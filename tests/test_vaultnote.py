@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# @file test_vaultnote.py
+# @brief Test the vault note front matter parser against the former regex
+# @author sailing-innocent
+# @date 2025-06-24
+# @version 1.0
+# ---------------------------------
+
+import pytest
+from utils.vaultnote import parse_vault_note, parse_vault_note_regex, scan_front_matter
+
+HEADER = "---\nid: 20250521120000\ntitle: A Note\ndesc: about it\nupdated: 1747800000000\ncreated: 1747700000000\n---\n"
+
+NOTES = [
+    HEADER + "# body\n\ntext\n",
+    HEADER,
+    HEADER.replace("\n", "\r\n") + "body\r\n",
+    # blank lines, padding and trailing spaces
+    "---  \n\nid:   abc  \n\ntitle:T\n\n desc\ndesc:\nupdated: 1000 \ncreated:2000\n\n---\n",
+    # extra keys, unit suffixes and lines before the front matter
+    "intro\n---\nid: x\ntags: [a]\ntitle: t\naliases: []\ndesc: d\nupdated: 1747800000000 ms\nmodified: 3\ncreated: 1747700000000Z\nlang: zh\n---\nbody",
+    "---\nid: x\ntitle: 中文标题\ndesc: 描述：冒号\nupdated: 1\ncreated: 2\n---\n正文",
+    # a horizontal rule before the header
+    "----\nid: x\ntitle: t\ndesc: d\nupdated: 1\ncreated: 2\n---\n",
+    "---\n---\nid: x\ntitle: t\ndesc: d\nupdated: 1\ncreated: 2\n---\n" + "---\n" * 3,
+    HEADER + ("long body line\n" * 5000),
+    # indented keys and values on the next line
+    "---\nid: x\n  title: t\n\tdesc: d\n  updated: 1\n  created: 2\n---\n",
+    "---\nid: x\ntitle:\n  Long Title\ndesc:\nupdated:\n  1000\ncreated:\n\n  2000\n---\n",
+]
+
+# where the scanner differs from the regex on purpose, only whole keys match
+CHANGED = [
+    (
+        "---\nid: x\nsubtitle: s\ntitle: t\ndesc: d\nupdated: 1\ncreated: 2\n---\n",
+        {"id": "x", "title": "t", "desc": "d", "updated": "1", "created": "2"},
+    ),
+    (
+        "---\nid: x\ntitle: t\ndesc:\ntags: a\nupdated: 1\ncreated: 2\n---\n",
+        {"id": "x", "title": "t", "desc": "", "updated": "1", "created": "2"},
+    ),
+    (
+        "---\n  id: x\ntitle: t\ndesc: d\nupdated: 1\ncreated: 2\n---\n",
+        {"id": "x", "title": "t", "desc": "d", "updated": "1", "created": "2"},
+    ),
+]
+
+MALFORMED = [
+    "no front matter at all",
+    "---\ntitle: t\ndesc: d\nupdated: 1\ncreated: 2\n---\n",
+    "---\nid: x\ntitle: t\ndesc: d\nupdated: soon\ncreated: 2\n---\n",
+    "---\nid: x\ntitle: t\ndesc: d\nupdated: 1\ncreated: 2\n---",
+    "---\nid: x\ntitle: t\ndesc: d\nupdated: 1\n",
+]
+
+
+@pytest.mark.parametrize("raw", NOTES)
+def test_same_as_regex(raw):
+    assert parse_vault_note(raw, "vault", "a.md") == parse_vault_note_regex(raw, "vault", "a.md")
+
+
+@pytest.mark.parametrize("raw", MALFORMED)
+def test_malformed(raw):
+    with pytest.raises(ValueError):
+        parse_vault_note_regex(raw, "vault", "a.md")
+    with pytest.raises(ValueError):
+        parse_vault_note(raw, "vault", "a.md")
+
+
+@pytest.mark.parametrize("raw, fields", CHANGED)
+def test_changed_from_regex(raw, fields):
+    assert scan_front_matter(raw) == fields
+
+
+def test_scan_front_matter():
+    fields = scan_front_matter(HEADER.replace("\n", "\r\n"))
+    # values keep what the regex kept, the time keys only their digits
+    assert fields == {
+        "id": "20250521120000\r",
+        "title": "A Note\r",
+        "desc": "about it\r",
+        "updated": "1747800000000",
+        "created": "1747700000000",
+    }
+    note = parse_vault_note(HEADER, "vault", "a.md")
+    assert (note.ctime, note.mtime) == (1747700000, 1747800000)
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# @file blob_store.py
+# @brief The Content-Addressed Blob Store
+# @author sailing-innocent
+# @date 2025-06-20
+# @version 1.0
+# ---------------------------------
+# blobs live at {root}/{sha[:2]}/{sha[2:4]}/{sha}, a blob is immutable once
+# written, so the same bytes are stored once and readers never see partial files
+
+import hashlib
+import mmap
+import os
+import tempfile
+
+
+def blob_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def iter_file(path: str, start: int = 0, end: int = None, chunk: int = 1 << 16):
+    # stream [start, end) of a file without loading it as a whole
+    return iter_open_file(open(path, "rb"), start, end, chunk)
+
+
+def iter_open_file(file, start: int = 0, end: int = None, chunk: int = 1 << 16):
+    # stream [start, end) of an open file and close it, the bytes stay
+    # readable if the file is removed meanwhile
+    with file as f:
+        if end is None:
+            end = os.fstat(f.fileno()).st_size
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            data = f.read(min(chunk, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+class BlobStore:
+    """
+    The blob backend interface, blobs are addressed by their sha256 hex digest
+    """
+
+    def put(self, data: bytes) -> str:
+        raise NotImplementedError
+
+    def exists(self, sha: str) -> bool:
+        raise NotImplementedError
+
+    def read(self, sha: str) -> bytes:
+        raise NotImplementedError
+
+    def size(self, sha: str) -> int:
+        raise NotImplementedError
+
+    def delete(self, sha: str):
+        raise NotImplementedError
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, sha: str) -> str:
+        if len(sha) != 64 or any(c not in "0123456789abcdef" for c in sha):
+            raise ValueError(f"Invalid blob hash: {sha}")
+        return os.path.join(self.root, sha[:2], sha[2:4], sha)
+
+    def put(self, data: bytes) -> str:
+        sha = blob_hash(data)
+        path = self.path(sha)
+        if os.path.exists(path):
+            return sha
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write aside and rename, concurrent writers of the same blob are harmless
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return sha
+
+    def exists(self, sha: str) -> bool:
+        return os.path.exists(self.path(sha))
+
+    def size(self, sha: str) -> int:
+        return os.path.getsize(self.path(sha))
+
+    def open_map(self, sha: str) -> mmap.mmap:
+        """
+        Map a blob read-only, the caller closes the map
+        """
+        with open(self.path(sha), "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read(self, sha: str) -> bytes:
+        if self.size(sha) == 0:
+            return b""
+        with self.open_map(sha) as m:
+            return m[:]
+
+    def iter_read(self, sha: str, start: int = 0, end: int = None, chunk: int = 1 << 16):
+        return iter_file(self.path(sha), start, end, chunk)
+
+    def delete(self, sha: str):
+        path = self.path(sha)
+        if os.path.exists(path):
+            os.remove(path)
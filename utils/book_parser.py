@@ -6,6 +6,9 @@
 # @version 1.0
 # ---------------------------------
 
+import re
+
+
 class BPBook:
     def __init__(self, title, author, preface, chapters):
         self.title = title
@@ -44,27 +47,14 @@ class BPChapter:
         return self.content[key]
 
 
+# first space separated part of a chapter title line
+CHAPTER_TITLE_PATTERN = re.compile(
+    r"^(?:第[^ ]*[回章]|尾声|后记|附录|序言|序|楔子|前言|引子|序幕|序章)(?: |$)"
+)
+
+
 def is_chapter_title(line):
-    first_part = line.split(" ")[0]
-    special_tags = [
-        "尾声",
-        "后记",
-        "附录",
-        "序言",
-        "序",
-        "楔子",
-        "前言",
-        "引子",
-        "序幕",
-        "序章",
-    ]
-    if first_part.startswith("第") and first_part.endswith("回"):
-        return True
-    if first_part.startswith("第") and first_part.endswith("章"):
-        return True
-    if first_part in special_tags:
-        return True
-    return False
+    return CHAPTER_TITLE_PATTERN.match(line) is not None
 
 
 class BookParser:
@@ -76,10 +66,16 @@ class BookParser:
         self.author = author
         self.preface = ""
         self.chapter_title = ""
-        self.chapter_content = ""
         self.chapters = []
 
-    def parse(self, lines):
+    def iter_parse(self, lines):
+        """
+        Parse an iterable of lines (e.g. an opened file) and yield each BPChapter
+        as soon as it is finished, chunks are joined once per chapter.
+        The parsed chapters are not kept, self.preface is set when exhausted.
+        """
+        preface = []
+        chunks = []
         for line in lines:
             line = line.strip()
             if self.state == "start":
@@ -88,22 +84,24 @@ class BookParser:
                 if line == "正文":
                     self.state = "chapter"
                 else:
-                    self.preface += line
+                    preface.append(line)
             elif self.state == "chapter":
                 if line == "":
                     continue
                 if is_chapter_title(line):
                     if self.chapter_title:
-                        self.chapters.append(
-                            BPChapter(self.chapter_title, self.chapter_content)
-                        )
+                        yield BPChapter(self.chapter_title, "".join(chunks))
                     self.chapter_title = line
-                    self.chapter_content = ""
+                    chunks = []
                 else:
-                    self.chapter_content += line
+                    chunks.append(line)
 
+        self.preface = "".join(preface)
         # Add the last chapter
         if self.chapter_title:
-            self.chapters.append(BPChapter(self.chapter_title, self.chapter_content))
+            yield BPChapter(self.chapter_title, "".join(chunks))
         self.state = "end"
+
+    def parse(self, lines):
+        self.chapters.extend(self.iter_parse(lines))
         self.book = BPBook(self.title, self.author, self.preface, self.chapters)
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# @file codec.py
+# @brief The Packed Text Codec
+# @author sailing-innocent
+# @date 2025-06-14
+# @version 1.0
+# ---------------------------------
+# packed layout: 1 codec byte + compressed utf-8 payload
+
+import bz2
+import lzma
+import os
+import zlib
+
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+CODEC_BZ2 = 3
+
+CODECS = {
+    "zlib": CODEC_ZLIB,
+    "lzma": CODEC_LZMA,
+    "bz2": CODEC_BZ2,
+}
+
+_COMPRESS = {
+    CODEC_ZLIB: lambda b: zlib.compress(b, 6),
+    CODEC_LZMA: lambda b: lzma.compress(b, preset=6),
+    CODEC_BZ2: lambda b: bz2.compress(b, 9),
+}
+
+_DECOMPRESS = {
+    CODEC_ZLIB: zlib.decompress,
+    CODEC_LZMA: lzma.decompress,
+    CODEC_BZ2: bz2.decompress,
+}
+
+
+def default_codec() -> str:
+    return os.environ.get("CONTENT_CODEC", "zlib")
+
+
+def compress_threshold() -> int:
+    # texts with at least this many characters are packed, 0 disables packing
+    return int(os.environ.get("CONTENT_COMPRESS_THRESHOLD", 0))
+
+
+def should_pack(size: int, threshold: int = None) -> bool:
+    if threshold is None:
+        threshold = compress_threshold()
+    return threshold > 0 and size is not None and size >= threshold
+
+
+def pack_text(text: str, codec: str = None) -> bytes:
+    codec_id = CODECS[codec or default_codec()]
+    return bytes([codec_id]) + _COMPRESS[codec_id](text.encode("utf-8"))
+
+
+def unpack_text(packed: bytes) -> str:
+    codec_id = packed[0]
+    if codec_id not in _DECOMPRESS:
+        raise ValueError(f"Unknown codec byte: {codec_id}")
+    return _DECOMPRESS[codec_id](memoryview(packed)[1:]).decode("utf-8")
+
+
+def pack_if_large(text: str, threshold: int = None, codec: str = None):
+    """
+    Returns (data, packed), at most one of them is not None.
+    The text is kept raw if it is below the threshold or does not shrink.
+    """
+    if text is None or not should_pack(len(text), threshold):
+        return text, None
+    raw = text.encode("utf-8")
+    codec_id = CODECS[codec or default_codec()]
+    packed = bytes([codec_id]) + _COMPRESS[codec_id](raw)
+    if len(packed) >= len(raw):
+        return text, None
+    return None, packed
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+# @file disk_cache.py
+# @brief The Size Bounded LRU Cache on Disk
+# @author sailing-innocent
+# @date 2025-06-21
+# @version 1.0
+# ---------------------------------
+# one file per entry, named by the sha256 of the key; the recency order is
+# rebuilt from the file mtimes on start, so the cache survives restarts
+
+from collections import OrderedDict
+import hashlib
+import os
+import tempfile
+import threading
+
+
+class DiskLRUCache:
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()  # name -> size
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.isdir(self.root):
+            return
+        files = []
+        for entry in os.scandir(self.root):
+            if entry.is_file() and not entry.name.startswith(".tmp-"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._bytes += size
+        with self._lock:
+            self._evict()
+
+    @staticmethod
+    def key_name(key) -> str:
+        return hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+
+    def path(self, key) -> str:
+        return os.path.join(self.root, self.key_name(key))
+
+    def get(self, key):
+        """
+        The path of a cached entry, or None
+        """
+        name = self.key_name(key)
+        path = os.path.join(self.root, name)
+        with self._lock:
+            if name not in self._entries or not os.path.exists(path):
+                self._drop(name)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(name)
+            self.hits += 1
+        try:
+            os.utime(path)  # keeps the order across restarts
+        except FileNotFoundError:
+            return None  # evicted meanwhile, a miss
+        return path
+
+    def open(self, key):
+        """
+        A cached entry opened for reading, or None. The file is opened under
+        the lock, so a concurrent eviction cannot remove it first, and it
+        stays readable after an eviction that comes later.
+        """
+        name = self.key_name(key)
+        path = os.path.join(self.root, name)
+        with self._lock:
+            try:
+                file = open(path, "rb")
+            except FileNotFoundError:
+                file = None
+            if name not in self._entries or file is None:
+                if file is not None:
+                    file.close()
+                self._drop(name)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(name)
+            self.hits += 1
+            try:
+                os.utime(path)  # keeps the order across restarts
+            except FileNotFoundError:
+                pass
+        return file
+
+    def put(self, key, data: bytes):
+        """
+        Store an entry and return its path, None if it is larger than the cache
+        """
+        if len(data) > self.max_bytes:
+            return None
+        name = self.key_name(key)
+        path = os.path.join(self.root, name)
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        with self._lock:
+            self._drop(name)
+            self._entries[name] = len(data)
+            self._bytes += len(data)
+            self._evict(keep=name)
+        return path
+
+    def _drop(self, name: str):
+        size = self._entries.pop(name, None)
+        if size is not None:
+            self._bytes -= size
+
+    def _evict(self, keep: str = None):
+        while self._bytes > self.max_bytes and self._entries:
+            name, size = next(iter(self._entries.items()))
+            if name == keep:
+                break
+            self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.root, name))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            for name in self._entries:
+                try:
+                    os.remove(os.path.join(self.root, name))
+                except FileNotFoundError:
+                    pass
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
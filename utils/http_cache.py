@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# @file http_cache.py
+# @brief The HTTP Conditional Request Utilities
+# @author sailing-innocent
+# @date 2025-06-17
+# @version 1.0
+# ---------------------------------
+
+import hashlib
+
+
+def make_etag(payload: bytes, weak: bool = False) -> str:
+    tag = f'"{hashlib.sha256(payload).hexdigest()[:32]}"'
+    return f"W/{tag}" if weak else tag
+
+
+def etag_matches(if_none_match: str, etag: str, strong: bool = False) -> bool:
+    """
+    Weak comparison of If-None-Match against etag, as required for GET/HEAD.
+    strong compares as If-Range requires: a weak tag on either side never
+    matches, neither does "*" nor an HTTP-date
+    """
+    if not if_none_match:
+        return False
+    if strong:
+        return not etag.startswith("W/") and any(
+            candidate.strip() == etag for candidate in if_none_match.split(",")
+        )
+    if if_none_match.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == bare
+        for candidate in if_none_match.split(",")
+    )
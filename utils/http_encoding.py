@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# @file http_encoding.py
+# @brief The HTTP Content-Encoding Utilities
+# @author sailing-innocent
+# @date 2025-06-19
+# @version 1.0
+# ---------------------------------
+
+import zlib
+from typing import Iterable, Iterator
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """
+    True if Accept-Encoding lists gzip without q=0
+    """
+    if not accept_encoding:
+        return False
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip() not in ("gzip", "*"):
+            continue
+        params = params.strip()
+        if not params.startswith("q="):
+            return True
+        try:
+            return float(params[2:]) > 0
+        except ValueError:
+            return False
+    return False
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    # one gzip member across all chunks, flushed per chunk so clients can parse early
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        out = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if out:
+            yield out
+    yield compressor.flush()
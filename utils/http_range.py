@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# @file http_range.py
+# @brief The HTTP Range Header Utilities
+# @author sailing-innocent
+# @date 2025-06-16
+# @version 1.0
+# ---------------------------------
+
+import re
+
+# a single range "unit=a-b", "unit=a-" or "unit=-n"; a list of ranges does not
+# match, the whole resource is sent rather than multipart/byteranges
+_RANGE_PATTERN = re.compile(r"^\s*([a-z]+)\s*=\s*(\d*)\s*-\s*(\d*)\s*$")
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def parse_range(header: str, total: int, units=("bytes",)):
+    """
+    Parse a Range header against a resource of `total` units.
+    Returns (unit, start, end) with end exclusive, or None if the header is
+    absent, malformed (including a-b with b < a), of another unit or lists
+    several ranges: the whole resource should be sent, as RFC 9110 ignores
+    an invalid Range. Raises RangeNotSatisfiable if the range lies outside
+    the resource.
+    """
+    if not header:
+        return None
+    m = _RANGE_PATTERN.match(header.lower())
+    if m is None or m.group(1) not in units:
+        return None
+    unit, first, last = m.group(1), m.group(2), m.group(3)
+    if first == "" and last == "":
+        return None
+    if total <= 0:
+        raise RangeNotSatisfiable(header)
+    if first == "":
+        # suffix range, the last n units
+        n = int(last)
+        if n == 0:
+            raise RangeNotSatisfiable(header)
+        return unit, max(0, total - n), total
+    start = int(first)
+    if last != "" and int(last) < start:
+        return None
+    end = total if last == "" else min(int(last) + 1, total)
+    if start >= total:
+        raise RangeNotSatisfiable(header)
+    return unit, start, end
+
+
+def content_range(unit: str, start: int, end: int, total: int):
+    return f"{unit} {start}-{end - 1}/{total}"
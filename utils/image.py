@@ -10,6 +10,7 @@ from PIL import Image
 from io import BytesIO
 import numpy as np
 import logging
+import os
 
 from typing import Union, Tuple
 
@@ -57,4 +58,311 @@ def bytes_to_image(image_bytes: bytes) -> Image.Image:
     with BytesIO(image_bytes) as input_stream:
         image = Image.open(input_stream)
         image.load() # Force loading the image data before the stream is closed
-        return image.convert("RGB")
\ No newline at end of file
+        return image.convert("RGB")
+
+# ------------------------------------------------
+# Image Info
+# ------------------------------------------------
+
+def image_info(image_bytes: bytes) -> Tuple[int, int, str]:
+    """
+    Read the size and format of an encoded image from its header, the pixels
+    are not decoded.
+
+    Args:
+        image_bytes (bytes): The encoded image.
+
+    Returns:
+        Tuple[int, int, str]: width, height and lower case format, all None if
+        the bytes are not a known image.
+    """
+    try:
+        with BytesIO(image_bytes) as input_stream, Image.open(input_stream) as image:
+            return image.width, image.height, (image.format or "").lower() or None
+    except Exception:
+        return None, None, None
+
+
+# ------------------------------------------------
+# Derivatives
+# ------------------------------------------------
+
+DERIVATIVE_WIDTHS = (64, 128, 256, 512, 1024, 2048)
+DERIVATIVE_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "png": ("PNG", "image/png"),
+}
+
+
+def snap_width(width: int) -> int:
+    """
+    Round a requested width up to the next derivative width, so the number of
+    cached variants per image stays small.
+    """
+    for w in DERIVATIVE_WIDTHS:
+        if width <= w:
+            return w
+    return DERIVATIVE_WIDTHS[-1]
+
+
+def make_derivative(image_bytes: bytes, width: int, format: str = "webp", quality: int = 80) -> bytes:
+    """
+    Scale an image down to at most `width` pixels wide, keeping the aspect ratio.
+
+    Args:
+        image_bytes (bytes): The encoded source image.
+        width (int): The maximum width, smaller images are not upscaled.
+        format (str): One of DERIVATIVE_FORMATS. Default is "webp".
+        quality (int): The lossy encoder quality. Default is 80.
+
+    Returns:
+        bytes: The encoded derivative.
+    """
+    pil_format, _ = DERIVATIVE_FORMATS[format]
+    with BytesIO(image_bytes) as input_stream:
+        image = Image.open(input_stream)
+        size = (width, max(1, image.height * width // max(1, image.width)))
+        # JPEG sources are decoded at a reduced scale directly
+        image.draft("RGB", size)
+        image.thumbnail(size, Image.Resampling.LANCZOS)
+        if pil_format == "JPEG" or image.mode not in ("RGB", "RGBA", "L", "LA"):
+            image = image.convert("RGB")
+        with BytesIO() as output:
+            if pil_format == "PNG":
+                image.save(output, format=pil_format, optimize=True)
+            else:
+                image.save(output, format=pil_format, quality=quality)
+            return output.getvalue()
+
+
+_MAGIC = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+]
+
+
+def format_media_type(format: str) -> str:
+    """
+    The media type of a PIL format name, e.g. "png" -> "image/png".
+    """
+    if not format:
+        return "application/octet-stream"
+    Image.init()  # registers the format plugins that fill Image.MIME
+    return Image.MIME.get(format.upper(), "application/octet-stream")
+
+
+def image_media_type(image_bytes: bytes) -> str:
+    """
+    Guess the media type from the leading bytes of an encoded image.
+    """
+    if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+        return "image/webp"
+    for magic, media_type in _MAGIC:
+        if image_bytes.startswith(magic):
+            return media_type
+    return "application/octet-stream"
+
+
+# ------------------------------------------------
+# Storage Encodings
+# ------------------------------------------------
+
+# mode -> (PIL format, save options), quality is appended for lossy modes
+STORAGE_MODES = {
+    "png": ("PNG", {"optimize": True}),
+    "webp-lossless": ("WEBP", {"lossless": True, "method": 6}),
+    "webp": ("WEBP", {"method": 6}),
+    "jpeg": ("JPEG", {"optimize": True, "progressive": True}),
+}
+LOSSY_MODES = ("webp", "jpeg")
+
+
+def is_lossy_encoding(image_bytes: bytes) -> bool:
+    """
+    Whether encoded bytes went through a lossy codec: JPEG, or WebP with a
+    lossy "VP8 " bitstream (or animation frames) rather than "VP8L".
+    """
+    if image_bytes[:3] == b"\xff\xd8\xff":
+        return True
+    if image_bytes[:4] != b"RIFF" or image_bytes[8:12] != b"WEBP":
+        return False
+    pos = 12
+    while pos + 8 <= len(image_bytes):
+        fourcc = image_bytes[pos : pos + 4]
+        if fourcc in (b"VP8 ", b"ANMF"):
+            return True
+        if fourcc == b"VP8L":
+            return False
+        size = int.from_bytes(image_bytes[pos + 4 : pos + 8], "little")
+        pos += 8 + size + (size & 1)
+    return True  # unknown layout, assume the worst
+
+
+def storage_mode(image_class: str) -> str:
+    """
+    The configured storage mode of an image class, "mode" or "mode:quality",
+    e.g. IMAGE_STORAGE_PHOTO=jpeg:85, IMAGE_STORAGE_GRAPHIC=png.
+    """
+    defaults = {"photo": "webp:90", "graphic": "png"}
+    return os.environ.get(f"IMAGE_STORAGE_{image_class.upper()}", defaults[image_class])
+
+
+def parse_storage_mode(mode: str) -> Tuple[str, int]:
+    name, _, quality = mode.partition(":")
+    if name not in STORAGE_MODES:
+        raise ValueError(f"Unknown storage mode: {mode}")
+    return name, int(quality) if quality else 90
+
+
+def storage_format(mode: str) -> str:
+    """
+    The lower case format a storage mode encodes to, e.g. "webp:80" -> "webp".
+    """
+    return STORAGE_MODES[parse_storage_mode(mode)[0]][0].lower()
+
+
+def classify_image(image: Image.Image) -> str:
+    """
+    "graphic" for images with transparency or few colors (screenshots, drawings,
+    diagrams) that compress well losslessly, "photo" otherwise.
+    """
+    if image.mode in ("1", "P", "LA", "RGBA", "PA") or "transparency" in image.info:
+        return "graphic"
+    sample = image.convert("RGB")
+    sample.thumbnail((128, 128))
+    # a photo has thousands of distinct colors even at thumbnail size
+    return "graphic" if sample.getcolors(maxcolors=1024) is not None else "photo"
+
+
+def encode_for_storage(image: Image.Image, mode: str = None) -> Tuple[bytes, str]:
+    """
+    Encode an image in its storage mode.
+
+    Args:
+        image (Image.Image): The decoded image.
+        mode (str): "mode" or "mode:quality", by default the configured mode
+            of the image class.
+
+    Returns:
+        Tuple[bytes, str]: The encoded bytes and the lower case format.
+    """
+    if mode is None:
+        mode = storage_mode(classify_image(image))
+    name, quality = parse_storage_mode(mode)
+    pil_format, options = STORAGE_MODES[name]
+    if name in LOSSY_MODES:
+        options = {**options, "quality": quality}
+    if pil_format == "JPEG" or image.mode not in ("RGB", "RGBA", "L", "LA"):
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha and pil_format != "JPEG" else "RGB")
+    with BytesIO() as output:
+        image.save(output, format=pil_format, **options)
+        return output.getvalue(), pil_format.lower()
+
+
+# source formats that are served as they are
+SOURCE_FORMATS = ("jpeg", "png", "webp", "gif")
+
+
+def encode_for_import(image: Image.Image, source: bytes, mode: str = None) -> Tuple[bytes, str]:
+    """
+    The bytes to store for an imported file: the source itself if it is lossy
+    (a second lossy pass only loses quality) or if encoding it in the storage
+    mode does not make it smaller, else encode_for_storage.
+
+    Args:
+        image (Image.Image): The decoded source.
+        source (bytes): The bytes of the source file.
+        mode (str): as in encode_for_storage.
+
+    Returns:
+        Tuple[bytes, str]: The bytes to store and their lower case format.
+    """
+    source_format = (image.format or "").lower()
+    if source_format not in SOURCE_FORMATS:
+        return encode_for_storage(image, mode)
+    if is_lossy_encoding(source):
+        return source, source_format
+    data, format = encode_for_storage(image, mode)
+    if len(data) >= len(source):
+        return source, source_format
+    return data, format
+
+
+# ------------------------------------------------
+# Tile Pyramids
+# ------------------------------------------------
+
+TILE_SIZE = 256
+
+# PIL refuses images above ~179M pixels as decompression bombs, gigapixel
+# scans need IMAGE_MAX_PIXELS raised (0 disables the check)
+if "IMAGE_MAX_PIXELS" in os.environ:
+    Image.MAX_IMAGE_PIXELS = int(os.environ["IMAGE_MAX_PIXELS"]) or None
+
+
+def tile_max_zoom(width: int, height: int, tile_size: int = TILE_SIZE) -> int:
+    """
+    The deepest zoom level, where the image is at full resolution; level 0
+    fits the whole image into a single tile and each level doubles the size.
+    """
+    zoom = 0
+    while max(width, height) > tile_size << zoom:
+        zoom += 1
+    return zoom
+
+
+def tile_level_size(width: int, height: int, zoom: int, max_zoom: int) -> Tuple[int, int]:
+    """
+    The image size at a zoom level, rounded up like Image.reduce.
+    """
+    factor = 1 << (max_zoom - zoom)
+    return -(-width // factor), -(-height // factor)
+
+
+def tile_grid(width: int, height: int, zoom: int, max_zoom: int, tile_size: int = TILE_SIZE) -> Tuple[int, int]:
+    """
+    The number of tile columns and rows at a zoom level.
+    """
+    w, h = tile_level_size(width, height, zoom, max_zoom)
+    return -(-w // tile_size), -(-h // tile_size)
+
+
+def iter_tiles(image_bytes: bytes, format: str = "webp", tile_size: int = TILE_SIZE, quality: int = 80):
+    """
+    Cut an image into its tile pyramid, deepest level first. The image is
+    decoded once, every level is the previous one halved, so the whole
+    pyramid costs about 4/3 of cutting the full resolution level.
+
+    Args:
+        image_bytes (bytes): The encoded source image.
+        format (str): One of DERIVATIVE_FORMATS. Default is "webp".
+        tile_size (int): The tile edge in pixels, edge tiles are smaller.
+        quality (int): The lossy encoder quality. Default is 80.
+
+    Yields:
+        Tuple[int, int, int, bytes]: zoom, column, row and the encoded tile.
+    """
+    pil_format, _ = DERIVATIVE_FORMATS[format]
+    with BytesIO(image_bytes) as input_stream:
+        image = Image.open(input_stream)
+        image.load()
+    if pil_format == "JPEG" or image.mode not in ("RGB", "RGBA", "L", "LA"):
+        image = image.convert("RGB")
+    max_zoom = tile_max_zoom(image.width, image.height, tile_size)
+    for zoom in range(max_zoom, -1, -1):
+        for y in range(0, image.height, tile_size):
+            for x in range(0, image.width, tile_size):
+                tile = image.crop((x, y, min(x + tile_size, image.width), min(y + tile_size, image.height)))
+                with BytesIO() as output:
+                    if pil_format == "PNG":
+                        tile.save(output, format=pil_format)
+                    else:
+                        tile.save(output, format=pil_format, quality=quality)
+                    yield zoom, x // tile_size, y // tile_size, output.getvalue()
+        if zoom > 0:
+            image = image.reduce(2)
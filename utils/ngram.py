@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# @file ngram.py
+# @brief Character N-Gram Tokens for CJK-aware Search
+# @author sailing-innocent
+# @date 2025-06-15
+# @version 1.0
+# ---------------------------------
+# Chinese text has no word boundary, so every character and every pair of
+# adjacent characters is indexed, a query matches if it contains all its grams
+
+import re
+
+_SPLIT_PATTERN = re.compile(r"\s+")
+
+
+def text_grams(text: str) -> list[str]:
+    """
+    Unique unigrams and bigrams of the text, bigrams never span whitespace
+    """
+    grams = set()
+    for part in _SPLIT_PATTERN.split(text.lower()):
+        grams.update(part)
+        grams.update(part[i : i + 2] for i in range(len(part) - 1))
+    grams.discard("")
+    return sorted(grams)
+
+
+def query_grams(query: str) -> list[str]:
+    """
+    The smallest gram set a matching text must contain
+    """
+    grams = set()
+    for part in _SPLIT_PATTERN.split(query.lower()):
+        if len(part) == 1:
+            grams.add(part)
+        else:
+            grams.update(part[i : i + 2] for i in range(len(part) - 1))
+    grams.discard("")
+    return sorted(grams)
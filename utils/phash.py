@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# @file phash.py
+# @brief Perceptual Image Hashes and the Multi-Index
+# @author sailing-innocent
+# @date 2025-06-23
+# @version 1.0
+# ---------------------------------
+# 64 bit hashes that survive resizing and re-encoding, near duplicates are
+# within a small Hamming distance; the multi-index finds them without a full scan
+
+from collections import defaultdict
+from PIL import Image
+import numpy as np
+
+_WEIGHTS = 1 << np.arange(63, -1, -1, dtype=np.uint64)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int(np.sum(_WEIGHTS[: bits.size] * bits.ravel().astype(np.uint64)))
+
+
+def _gray(image: Image.Image, size) -> np.ndarray:
+    # draft lets JPEG decode at a fraction of its size first
+    image.draft("L", (size[0] * 8, size[1] * 8))
+    return np.asarray(
+        image.convert("L").resize(size, Image.Resampling.BOX), dtype=np.float32
+    )
+
+
+def ahash(image: Image.Image, size: int = 8) -> int:
+    """
+    Average hash: a bit per pixel of the size x size thumbnail, set if brighter than the mean
+    """
+    pixels = _gray(image, (size, size))
+    return _bits_to_int(pixels > pixels.mean())
+
+
+def dhash(image: Image.Image, size: int = 8) -> int:
+    """
+    Difference hash: a bit per horizontal neighbour pair, set if the gradient goes up
+    """
+    pixels = _gray(image, (size + 1, size))
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def to_signed64(h: int) -> int:
+    # postgres BIGINT is signed
+    return h - (1 << 64) if h >= 1 << 63 else h
+
+
+def to_unsigned64(h: int) -> int:
+    return h + (1 << 64) if h < 0 else h
+
+
+def _flip_masks(bits: int, radius: int) -> list[int]:
+    # every bits-wide mask with at most radius bits set
+    masks = [0]
+    for _ in range(radius):
+        masks = sorted({m | (1 << b) for m in masks for b in range(bits)} | set(masks))
+    return masks
+
+
+class MultiIndexHash:
+    """
+    Hashes split into 4 chunks of 16 bits, each chunk indexed exactly. Two
+    hashes within distance r differ in at most r // 4 bits of some chunk
+    (pigeonhole), so a query probes each chunk table with every value within
+    r // 4 of its own chunk and only verifies the hashes found there, e.g.
+    17 probes per chunk for r <= 7 and 697 for r <= 15, against 65536 buckets.
+    Larger radii fall back to a vectorized scan.
+    """
+
+    CHUNKS = 4
+    BITS = 16
+    MAX_RADIUS = 15
+
+    def __init__(self):
+        self._hashes = []
+        self._items = []
+        self._tables = [defaultdict(list) for _ in range(self.CHUNKS)]
+        self._masks = {}  # probe radius -> flip masks
+        self._array = None  # uint64 copy of the hashes for the scan
+
+    @classmethod
+    def _chunk(cls, h: int, k: int) -> int:
+        return (h >> (cls.BITS * k)) & ((1 << cls.BITS) - 1)
+
+    def add(self, h: int, item):
+        i = len(self._hashes)
+        self._hashes.append(h)
+        self._items.append(item)
+        for k in range(self.CHUNKS):
+            self._tables[k][self._chunk(h, k)].append(i)
+        self._array = None
+
+    def query(self, h: int, radius: int):
+        """
+        All (distance, item) within radius, closest first
+        """
+        if radius <= self.MAX_RADIUS:
+            probe = radius // self.CHUNKS
+            if probe not in self._masks:
+                self._masks[probe] = _flip_masks(self.BITS, probe)
+            candidates = set()
+            for k in range(self.CHUNKS):
+                table = self._tables[k]
+                chunk = self._chunk(h, k)
+                for mask in self._masks[probe]:
+                    candidates.update(table.get(chunk ^ mask, ()))
+            res = [
+                (d, self._items[i])
+                for i in candidates
+                if (d := hamming(h, self._hashes[i])) <= radius
+            ]
+        else:
+            if self._array is None:
+                self._array = np.array(self._hashes, dtype=np.uint64)
+            dist = np.bitwise_count(self._array ^ np.uint64(h))
+            res = [(int(dist[i]), self._items[i]) for i in np.flatnonzero(dist <= radius)]
+        res.sort(key=lambda x: x[0])
+        return res
+
+    def __len__(self):
+        return len(self._hashes)
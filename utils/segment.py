@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# @file segment.py
+# @brief Vectorized Paragraph and Sentence Segmentation
+# @author sailing-innocent
+# @date 2025-06-18
+# @version 1.0
+# ---------------------------------
+# Segments are (start, offset) pairs in characters that cover the text
+# without gaps, so they map one to one onto ContentNode rows.
+
+import numpy as np
+
+SENTENCE_END = "。！？!?…；;"
+SENTENCE_CLOSE = "”’」』）)】》\"'"
+PARAGRAPH_END = "\n"
+
+_END_CODES = np.array([ord(c) for c in SENTENCE_END], dtype=np.uint32)
+_CLOSE_CODES = np.array([ord(c) for c in SENTENCE_CLOSE], dtype=np.uint32)
+_PARAGRAPH_CODES = np.array([ord(c) for c in PARAGRAPH_END], dtype=np.uint32)
+
+
+def code_points(text: str) -> np.ndarray:
+    return np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+
+
+def _segments_from_cuts(cuts: np.ndarray, n: int) -> list[tuple[int, int]]:
+    # cuts are the exclusive ends of all segments but the last one
+    bounds = np.concatenate(([0], cuts[(cuts > 0) & (cuts < n)], [n]))
+    bounds = np.unique(bounds)
+    starts = bounds[:-1]
+    return list(zip(starts.tolist(), np.diff(bounds).tolist()))
+
+
+def paragraph_segments(text: str) -> list[tuple[int, int]]:
+    """
+    Paragraphs end after a newline, the newline belongs to its paragraph
+    """
+    n = len(text)
+    if n == 0:
+        return []
+    cp = code_points(text)
+    cuts = np.flatnonzero(np.isin(cp, _PARAGRAPH_CODES)) + 1
+    return _segments_from_cuts(cuts, n)
+
+
+def sentence_segments(text: str) -> list[tuple[int, int]]:
+    """
+    Sentences end after a run of end marks and closing quotes/brackets
+    that contains at least one end mark, e.g. `好！」` or `……`
+    """
+    n = len(text)
+    if n == 0:
+        return []
+    cp = code_points(text)
+    idx = np.arange(n)
+    is_end = np.isin(cp, _END_CODES) | np.isin(cp, _PARAGRAPH_CODES)
+    is_mark = is_end | np.isin(cp, _CLOSE_CODES)
+
+    # the run of marks ending at i contains an end mark if the last end mark
+    # is after the last non-mark character
+    last_end = np.maximum.accumulate(np.where(is_end, idx, -1))
+    last_plain = np.maximum.accumulate(np.where(~is_mark, idx, -1))
+    run_has_end = last_end > last_plain
+
+    next_is_mark = np.append(is_mark[1:], False)
+    cut_after = is_mark & ~next_is_mark & run_has_end
+    cuts = np.flatnonzero(cut_after) + 1
+    return _segments_from_cuts(cuts, n)
+
+
+def segment_text(text: str) -> list[tuple[int, int, list[tuple[int, int]]]]:
+    """
+    Two level segmentation: [(start, offset, [(start, offset), ...]), ...]
+    every sentence lies inside its paragraph, all offsets are absolute
+    """
+    res = []
+    for p_start, p_offset in paragraph_segments(text):
+        sentences = sentence_segments(text[p_start : p_start + p_offset])
+        res.append(
+            (p_start, p_offset, [(p_start + s, o) for s, o in sentences])
+        )
+    return res
+
+
+def nest_spans(spans: list, start=lambda s: s.start, offset=lambda s: s.offset):
+    """
+    Nest spans sorted by (start, offset desc) into [(span, children), ...],
+    a span is the child of the innermost earlier span that contains it
+    """
+    roots = []
+    stack = []  # (end, children) of the open spans
+    for span in spans:
+        s = start(span)
+        e = s + offset(span)
+        while stack and stack[-1][0] < e:
+            stack.pop()
+        children = []
+        (stack[-1][1] if stack else roots).append((span, children))
+        stack.append((e, children))
+    return roots
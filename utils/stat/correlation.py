@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+# @file correlation.py
+# @brief Correlation and lag analysis utilities
+# @author sailing-innocent
+# @date 2025-06-10
+# @version 1.0
+# ---------------------------------
+import numpy as np
+from dataclasses import dataclass
+from scipy.signal import correlate
+
+
+@dataclass
+class LagCorrelation:
+    pearson: float  # zero-lag pearson coefficient
+    lags: np.ndarray  # lag in samples
+    corr: np.ndarray  # corr[i] = corr(x[t + lags[i]], y[t]), nan if too few overlaps
+    best_lag: int
+    best_corr: float
+
+
+def as_series(values) -> np.ndarray:
+    # None -> nan, so missing days can be masked out
+    return np.array(
+        [np.nan if v is None else v for v in values], dtype=np.float64
+    )
+
+
+def fill_gaps(y: np.ndarray, x: np.ndarray = None) -> np.ndarray:
+    # linear interpolation over nan, edges hold the nearest valid value
+    mask = np.isnan(y)
+    if not mask.any():
+        return y
+    if mask.all():
+        raise ValueError("Cannot fill a series without any valid value")
+    if x is None:
+        x = np.arange(len(y))
+    res = y.copy()
+    res[mask] = np.interp(x[mask], x[~mask], y[~mask])
+    return res
+
+
+def pearson(x: np.ndarray, y: np.ndarray) -> float:
+    # pearson coefficient over the positions where both are valid
+    if len(x) != len(y):
+        raise ValueError("x and y arrays must have the same length")
+    mask = ~(np.isnan(x) | np.isnan(y))
+    if mask.sum() < 2:
+        return np.nan
+    xv = x[mask] - np.mean(x[mask])
+    yv = y[mask] - np.mean(y[mask])
+    denominator = np.sqrt(np.sum(xv**2) * np.sum(yv**2))
+    if denominator == 0:
+        return np.nan
+    return float(np.sum(xv * yv) / denominator)
+
+
+def lagged_correlation(
+    x: np.ndarray, y: np.ndarray, max_lag: int = None, min_overlap: int = 3
+):
+    """
+    Normalized cross-correlation for every lag in one pass.
+
+    Both series are standardized, missing values contribute zero, and each lag is
+    divided by its own count of overlapping valid samples.
+    Returns (lags, corr) where corr[i] = corr(x[t + lags[i]], y[t]).
+    """
+    n = len(x)
+    if n != len(y):
+        raise ValueError("x and y arrays must have the same length")
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+    mx = ~np.isnan(x)
+    my = ~np.isnan(y)
+    xz = np.where(mx, x - np.nanmean(x), 0.0)
+    yz = np.where(my, y - np.nanmean(y), 0.0)
+    sx = np.nanstd(x)
+    sy = np.nanstd(y)
+    if sx == 0 or sy == 0:
+        lags = np.arange(-n + 1, n)
+        return lags, np.full(len(lags), np.nan)
+
+    num = correlate(xz / sx, yz / sy, mode="full")
+    cnt = np.rint(
+        correlate(mx.astype(np.float64), my.astype(np.float64), mode="full")
+    )
+    lags = np.arange(-n + 1, n)
+    corr = np.full(len(lags), np.nan)
+    valid = cnt >= min_overlap
+    corr[valid] = num[valid] / cnt[valid]
+
+    if max_lag is not None:
+        keep = np.abs(lags) <= max_lag
+        lags, corr = lags[keep], corr[keep]
+    return lags, corr
+
+
+def lag_analysis(
+    x: np.ndarray, y: np.ndarray, max_lag: int = None, min_overlap: int = 3
+) -> LagCorrelation:
+    lags, corr = lagged_correlation(x, y, max_lag, min_overlap)
+    if len(corr) == 0 or np.all(np.isnan(corr)):
+        best_lag, best_corr = 0, np.nan
+    else:
+        idx = np.nanargmax(np.abs(corr))
+        best_lag, best_corr = int(lags[idx]), float(corr[idx])
+    return LagCorrelation(
+        pearson=pearson(x, y),
+        lags=lags,
+        corr=corr,
+        best_lag=best_lag,
+        best_corr=best_corr,
+    )
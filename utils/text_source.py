@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# @file text_source.py
+# @brief Memory-Mapped Text Files with Encoding Detection
+# @author sailing-innocent
+# @date 2025-06-19
+# @version 1.0
+# ---------------------------------
+# Novel dumps are several hundred MB and often GBK/GB18030 encoded, the file is
+# mapped and decoded chunk by chunk, so only one chunk is held in memory
+
+import codecs
+import mmap
+import os
+
+SAMPLE_SIZE = 1 << 16
+CHUNK_SIZE = 1 << 20
+
+_BOMS = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+
+def _decodes(sample: bytes, encoding: str) -> bool:
+    # the sample may end inside a multi-byte character, so decode incrementally
+    try:
+        codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def detect_encoding(sample: bytes) -> str:
+    """
+    BOM first, then strict UTF-8, then GB18030 (a superset of GBK and GB2312)
+    """
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+    for encoding in ("utf-8", "gb18030"):
+        if _decodes(sample, encoding):
+            return encoding
+    return "utf-8"  # undecodable bytes are replaced
+
+
+class MappedTextFile:
+    """
+    Iterate the lines of a text file through mmap, e.g.
+    with MappedTextFile(path) as f: parser.iter_parse(f)
+    pos is the number of bytes consumed, for progress and throughput
+    """
+
+    def __init__(self, path: str, encoding: str = None, chunk_size: int = CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.size = os.path.getsize(path)
+        self.pos = 0
+        self._file = open(path, "rb")
+        # an empty file can not be mapped
+        self._map = (
+            mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self.size > 0
+            else None
+        )
+        if encoding is None:
+            encoding = detect_encoding(self._map[:SAMPLE_SIZE] if self._map else b"")
+        self.encoding = encoding
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def iter_chunks(self):
+        decoder = codecs.getincrementaldecoder(self.encoding)(errors="replace")
+        self.pos = 0
+        while self._map is not None and self.pos < self.size:
+            chunk = self._map[self.pos : self.pos + self.chunk_size]
+            self.pos += len(chunk)
+            text = decoder.decode(chunk, final=self.pos >= self.size)
+            if text:
+                yield text
+
+    def __iter__(self):
+        # lines end in "\n" like a file opened in text mode: "\r\n" and "\r"
+        # are translated, a "\r" ending a chunk is held back as it may start
+        # a "\r\n"; the pieces of a line spanning chunks are joined once
+        parts = []
+        held = False
+        for text in self.iter_chunks():
+            if held:
+                text = "\r" + text
+            held = text.endswith("\r")
+            if held:
+                text = text[:-1]
+            lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+            if len(lines) > 1:
+                parts.append(lines[0])
+                yield "".join(parts) + "\n"
+                parts = []
+                for line in lines[1:-1]:
+                    yield line + "\n"
+            if lines[-1]:
+                parts.append(lines[-1])
+        if held:
+            parts.append("\n")
+        if parts:
+            yield "".join(parts)
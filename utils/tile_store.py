@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+# @file tile_store.py
+# @brief The Size Bounded Store of Tile Pyramids on Disk
+# @author sailing-innocent
+# @date 2025-06-25
+# @version 1.0
+# ---------------------------------
+# one directory per pyramid, {root}/{name}/{z}/{x}_{y}, named by the sha256 of
+# the key; a pyramid is written aside and renamed into place with its manifest,
+# so readers see either the whole pyramid or nothing. Whole pyramids are
+# evicted least recently used first, a per-tile LRU would drop the deep
+# levels of a large pyramid while its upper levels are still being written.
+
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+MANIFEST = "manifest.json"
+
+
+class PyramidTooLarge(Exception):
+    pass
+
+
+class TileStore:
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._pyramids: OrderedDict = OrderedDict()  # name -> bytes
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.isdir(self.root):
+            return
+        found = []
+        for entry in os.scandir(self.root):
+            if not entry.is_dir():
+                continue
+            manifest = os.path.join(entry.path, MANIFEST)
+            if entry.name.startswith(".tmp-") or not os.path.exists(manifest):
+                # an interrupted build
+                shutil.rmtree(entry.path, ignore_errors=True)
+                continue
+            with open(manifest, "r", encoding="utf-8") as f:
+                size = json.load(f)["bytes"]
+            found.append((os.path.getmtime(manifest), entry.name, size))
+        for _, name, size in sorted(found):
+            self._pyramids[name] = size
+            self._bytes += size
+        with self._lock:
+            self._evict()
+
+    @staticmethod
+    def key_name(key) -> str:
+        return hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+
+    def has(self, key) -> bool:
+        with self._lock:
+            return self.key_name(key) in self._pyramids
+
+    def get(self, key, z: int, x: int, y: int):
+        """
+        The path of a tile of a stored pyramid, or None
+        """
+        name = self.key_name(key)
+        with self._lock:
+            if name not in self._pyramids:
+                return None
+            recent = next(reversed(self._pyramids)) == name
+            self._pyramids.move_to_end(name)
+        path = os.path.join(self.root, name, str(z), f"{x}_{y}")
+        if not os.path.exists(path):
+            return None
+        if not recent:
+            # keeps the order across restarts, once per switch of pyramid
+            try:
+                os.utime(os.path.join(self.root, name, MANIFEST))
+            except FileNotFoundError:
+                return None  # evicted meanwhile, a miss
+        return path
+
+    def open(self, key, z: int, x: int, y: int):
+        """
+        A tile of a stored pyramid opened for reading, or None. The file is
+        opened under the lock that eviction holds, so it stays readable
+        after the pyramid is evicted.
+        """
+        name = self.key_name(key)
+        with self._lock:
+            if name not in self._pyramids:
+                return None
+            recent = next(reversed(self._pyramids)) == name
+            self._pyramids.move_to_end(name)
+            try:
+                file = open(os.path.join(self.root, name, str(z), f"{x}_{y}"), "rb")
+            except FileNotFoundError:
+                return None
+        if not recent:
+            # keeps the order across restarts, once per switch of pyramid
+            try:
+                os.utime(os.path.join(self.root, name, MANIFEST))
+            except FileNotFoundError:
+                pass
+        return file
+
+    def put(self, key, tiles):
+        """
+        Write a pyramid from (z, x, y, bytes) tiles and return (count, bytes).
+        Raises PyramidTooLarge, leaving nothing behind, once the pyramid
+        outgrows the whole store.
+        """
+        name = self.key_name(key)
+        os.makedirs(self.root, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=self.root, prefix=".tmp-")
+        count, total = 0, 0
+        try:
+            for z, x, y, data in tiles:
+                total += len(data)
+                if total > self.max_bytes:
+                    raise PyramidTooLarge(
+                        f"Pyramid over {self.max_bytes} bytes after {count} tiles"
+                    )
+                level = os.path.join(tmp, str(z))
+                os.makedirs(level, exist_ok=True)
+                with open(os.path.join(level, f"{x}_{y}"), "wb") as f:
+                    f.write(data)
+                count += 1
+            with open(os.path.join(tmp, MANIFEST), "w", encoding="utf-8") as f:
+                json.dump({"tiles": count, "bytes": total}, f)
+            with self._lock:
+                if name in self._pyramids:
+                    shutil.rmtree(tmp, ignore_errors=True)  # built concurrently
+                    return count, total
+                os.replace(tmp, os.path.join(self.root, name))
+                self._pyramids[name] = total
+                self._bytes += total
+                self._evict(keep=name)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        return count, total
+
+    def _evict(self, keep: str = None):
+        while self._bytes > self.max_bytes and self._pyramids:
+            name, size = next(iter(self._pyramids.items()))
+            if name == keep:
+                break
+            self._pyramids.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def delete(self, key):
+        name = self.key_name(key)
+        with self._lock:
+            size = self._pyramids.pop(name, None)
+            if size is None:
+                return
+            self._bytes -= size
+        shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pyramids": len(self._pyramids),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
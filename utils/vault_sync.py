@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# @file vault_sync.py
+# @brief The Incremental Vault Scan
+# @author sailing-innocent
+# @date 2025-06-24
+# @version 1.0
+# ---------------------------------
+# One walk of the vault collects (size, mtime) of every note, only notes whose
+# stat differs from the stored one are read, and only those whose content hash
+# differs are parsed again; a note renamed inside the vault keeps its row.
+
+from dataclasses import dataclass, field
+import hashlib
+import os
+
+NOTE_EXTENSIONS = (".md",)
+
+
+@dataclass
+class VaultFileStat:
+    path: str  # absolute, as stored in vault_note.note_path
+    size: int
+    mtime: int  # st_mtime_ns
+
+
+@dataclass
+class VaultSyncPlan:
+    """
+    changed: files to read, hashed and parsed unless the hash is unchanged
+    skipped: files that failed to parse before and did not change since
+    deleted: ids of the stored notes whose file is gone
+    cleared: paths whose failure marker is stale, the file changed or is gone
+    """
+
+    changed: list = field(default_factory=list)
+    unchanged: int = 0
+    skipped: int = 0
+    deleted: list = field(default_factory=list)
+    cleared: list = field(default_factory=list)
+
+
+def file_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def scan_vault(vault_path: str, extensions=NOTE_EXTENSIONS):
+    """
+    Stat every note under vault_path with one scandir walk, hidden entries
+    (.obsidian, .git, .trash) are skipped
+    """
+    stats = {}
+    stack = [vault_path]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.lower().endswith(extensions):
+                    stat = entry.stat()
+                    stats[entry.path] = VaultFileStat(
+                        entry.path, stat.st_size, stat.st_mtime_ns
+                    )
+    return stats
+
+
+def _same_stat(row, stat: VaultFileStat) -> bool:
+    return (
+        row is not None
+        and stat is not None
+        and row.file_size == stat.size
+        and row.file_mtime == stat.mtime
+    )
+
+
+def plan_vault_sync(
+    vault_path: str, files: dict, stored: dict, skipped: dict = None
+) -> VaultSyncPlan:
+    """
+    Compare the scanned files with the stored rows, stored maps note_path to
+    a row with id, note_id, file_size and file_mtime, skipped maps note_path
+    to the failure marker (note_id, file_size, file_mtime) of a file that did
+    not parse. Only rows under vault_path can be deleted, so notes synced from
+    another mount are left alone, and a row is kept while a file that failed
+    to parse still claims its note_id: the note was moved and broken.
+    """
+    skipped = skipped or {}
+    plan = VaultSyncPlan()
+    for path, stat in files.items():
+        if _same_stat(stored.get(path), stat):
+            plan.unchanged += 1
+        elif _same_stat(skipped.get(path), stat):
+            plan.skipped += 1
+        else:
+            plan.changed.append(stat)
+    plan.cleared = [
+        path
+        for path, mark in skipped.items()
+        if not _same_stat(mark, files.get(path))
+    ]
+    claimed = {
+        mark.note_id
+        for path, mark in skipped.items()
+        if mark.note_id and _same_stat(mark, files.get(path))
+    }
+    root = os.path.join(vault_path, "")
+    plan.deleted = [
+        row.id
+        for path, row in stored.items()
+        if path not in files and path.startswith(root) and row.note_id not in claimed
+    ]
+    plan.changed.sort(key=lambda stat: stat.path)
+    plan.cleared.sort()
+    return plan
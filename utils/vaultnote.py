@@ -5,6 +5,15 @@
 # @date 2025-05-21
 # @version 1.0
 # ---------------------------------
+# The front matter is scanned line by line up to the closing fence, so a note
+# costs O(header) however long or malformed its body is:
+# ---
+# id: 20250521...
+# title: ...
+# desc: ...
+# updated: 1747800000000 (ms)
+# created: 1747800000000 (ms)
+# ---
 
 import re
 from internal.data.content import VaultNoteData
@@ -12,54 +21,209 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+HEADER_KEYS = ("id", "title", "desc", "updated", "created")
+_TIME_KEYS = ("updated", "created")
+_DIGITS = re.compile(r"\d+")
+_KEY_LINE = re.compile(r"[\w-]+:")
+
+
+def _iter_lines(text: str):
+    # (line, terminated) without splitting the whole document
+    pos, n = 0, len(text)
+    while pos < n:
+        end = text.find("\n", pos)
+        if end < 0:
+            yield text[pos:], False
+            return
+        yield text[pos:end], True
+        pos = end + 1
+
+
+def _is_open_fence(line: str, terminated: bool) -> bool:
+    return terminated and line.rstrip().endswith("---")
+
+
+def _close_fence(text: str, pos: int) -> int:
+    # the offset of the first line after pos that is "---" and trailing
+    # whitespace, -1 if there is none
+    start = text.find("\n---", pos) + 1
+    while start > 0:
+        end = text.find("\n", start)
+        if end < 0:
+            return -1
+        if text[start + 3 : end].strip() == "":
+            return start
+        start = text.find("\n---", end) + 1
+    return -1
+
+
+def _header_start(text: str) -> int:
+    # the offset of the "id:" line after the opening fence, -1 if there is none
+    state = "fence"
+    pos = 0
+    for line, terminated in _iter_lines(text):
+        if state == "fence":
+            if _is_open_fence(line, terminated):
+                state = "id"
+        elif line.strip():
+            if line.lstrip().startswith("id:"):
+                return pos + len(line) - len(line.lstrip())
+            # not a header, look for the next fence
+            state = "id" if _is_open_fence(line, terminated) else "fence"
+        pos += len(line) + 1
+    return -1
+
+
+def _key_value(line: str, key: str):
+    # the value after "key:" on an indented or plain line, None for other lines
+    line = line.lstrip()
+    if not line.startswith(key) or line[len(key) : len(key) + 1] != ":":
+        return None
+    return line[len(key) + 1 :].lstrip()
+
+
+def _next_value(lines: list, i: int):
+    # (index, line) of the first non-blank line from i, the value of a key
+    # left empty on its own line, like the "\s*" of the regex took it
+    while i < len(lines) and lines[i].strip() == "":
+        i += 1
+    if i == len(lines):
+        return i, None
+    return i, lines[i].lstrip()
+
+
+def scan_front_matter(text: str):
+    """
+    The header fields {"id", "title", "desc", "updated", "created"} as
+    strings, None if the note has no complete header.
+    The header opens with a line ending in "---" followed (after blank lines)
+    by "id:", the other keys are taken in order, each from the first line
+    starting with it after indentation, other lines are skipped; values keep
+    their trailing whitespace and the times keep their leading digits. A key
+    left empty takes the next non-blank line, unless that line is a "key:"
+    line itself.
+    The header ends at the first "---" line, unlike the former regex the
+    keys are never looked up in the body, and only whole keys match: a
+    "subtitle:" line is not the title, a "tags:" line is not an empty desc.
+    """
+    start = _header_start(text)
+    if start < 0:
+        return None
+    end = _close_fence(text, start)
+    if end < 0:
+        return None
+    fields = {}
+    keys = iter(HEADER_KEYS)
+    key = next(keys)
+    lines = text[start:end].split("\n")
+    i = 0
+    while i < len(lines):
+        value = _key_value(lines[i], key)
+        i += 1
+        if value is None:
+            continue
+        if value.strip() == "":
+            j, line = _next_value(lines, i)
+            if line is not None and _KEY_LINE.match(line) is None:
+                value, i = line, j + 1
+        if key in _TIME_KEYS:
+            digits = _DIGITS.match(value)
+            if digits is None:
+                continue
+            value = digits.group()
+        fields[key] = value
+        key = next(keys, None)
+        if key is None:
+            return fields
+    return None
+
+
+def scan_note_id(text: str):
+    """
+    The "id:" value of a header that scan_front_matter rejects, None if there
+    is no header start
+    """
+    start = _header_start(text)
+    if start < 0:
+        return None
+    end = text.find("\n", start)
+    line = text[start:] if end < 0 else text[start:end]
+    return line[len("id:") :].strip() or None
+
+
+def _note_data(raw_content, vault_name, note_path, note_id, title, desc, mtime, ctime):
+    assert len(note_id) > 0 and len(note_id) < 50
+    return VaultNoteData(
+        vault_name=vault_name,
+        note_path=note_path,
+        note_id=note_id,
+        title=title,
+        desc=desc,
+        ctime=int(ctime) // 1000,
+        mtime=int(mtime) // 1000,
+        tags="",
+        content=raw_content,
+    )
+
 
 def parse_vault_note(
     raw_content: str, vault_name: str, note_path: str
 ) -> VaultNoteData:
-    # 更灵活的正则表达式，允许更多格式变化
-    NOTE_PATTERN = r"""---\s*
+    fields = scan_front_matter(raw_content)
+    if fields is None:
+        raise ValueError("Invalid note format")
+    return _note_data(
+        raw_content,
+        vault_name,
+        note_path,
+        fields["id"],
+        fields["title"],
+        fields["desc"],
+        fields["updated"],
+        fields["created"],
+    )
+
+
+# the former regex parser, kept as the reference for tests and benchmarks
+# 更灵活的正则表达式，允许更多格式变化
+_NOTE_PATTERN = re.compile(
+    r"""---\s*
 id:\s*(?P<note_id>[^\n]*)\s*
 title:\s*(?P<title>[^\n]*)\s*
 desc:\s*(?P<desc>[^\n]*)\s*
 updated:\s*(?P<mtime>\d+).*?\s*
 created:\s*(?P<ctime>\d+).*?\s*
 ---\s*
-(?P<content>.*)"""
-
-    result = re.search(NOTE_PATTERN, raw_content, re.DOTALL)
-    if not result:
-        # 如果主要模式匹配失败，尝试使用更宽松的备用模式
-        ALT_PATTERN = r"""---\s*
+(?P<content>.*)""",
+    re.DOTALL,
+)
+# 如果主要模式匹配失败，尝试使用更宽松的备用模式
+_ALT_PATTERN = re.compile(
+    r"""---\s*
 id:\s*(?P<note_id>[^\n]*)\s*
 .*?title:\s*(?P<title>[^\n]*)\s*
 .*?desc:\s*(?P<desc>[^\n]*)\s*
 .*?updated:\s*(?P<mtime>\d+).*?\s*
 .*?created:\s*(?P<ctime>\d+).*?\s*
 ---\s*
-(?P<content>.*)"""
-        result = re.search(ALT_PATTERN, raw_content, re.DOTALL)
+(?P<content>.*)""",
+    re.DOTALL,
+)
 
+
+def parse_vault_note_regex(
+    raw_content: str, vault_name: str, note_path: str
+) -> VaultNoteData:
+    result = _NOTE_PATTERN.search(raw_content) or _ALT_PATTERN.search(raw_content)
     if not result:
-        logger.error(f"Failed to parse note with content: {raw_content[:200]}...")
         raise ValueError("Invalid note format")
-
-    note_id = result.group("note_id")
-    title = result.group("title")
-    desc = result.group("desc")
-    mtime = result.group("mtime")
-    ctime = result.group("ctime")
-
-    # logger.info(f">>> Note ID: {note_id}")
-    assert len(note_id) > 0 and len(note_id) < 50
-    # logger.info(f">>> Title: {title}")
-    return VaultNoteData(
-        vault_name=vault_name,
-        note_path=note_path,
-        note_id=note_id,
-        title=title,
-        desc=desc,
-        ctime=int(ctime) // 1000,
-        mtime=int(mtime) // 1000,
-        tags="",
-        content=raw_content,
+    return _note_data(
+        raw_content,
+        vault_name,
+        note_path,
+        result.group("note_id"),
+        result.group("title"),
+        result.group("desc"),
+        result.group("mtime"),
+        result.group("ctime"),
     )